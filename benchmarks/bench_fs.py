@@ -0,0 +1,271 @@
+"""
+Scaling of `make_moviedb` and `rename_episodes` on synthetic trees.
+
+A movie tree of `--width` folders per level and `--depth` levels and a
+TV show of `--episodes` episodes per season are generated with empty
+files for every size of `--files`. Up to a million files is fine on a
+tmpfs like /dev/shm, the default when it exists. The time spent in the
+traversal, name parsing, DataFrame building and output is measured
+separately. `--latency` adds a delay to every filesystem call to
+reproduce a NAS locally.
+
+Usage:
+    python benchmarks/bench_fs.py --files 1000 10000 100000
+    python benchmarks/bench_fs.py --files 10000 --latency 0.0005
+    python benchmarks/bench_fs.py --json after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mediafiletools import (  # noqa: E402
+    episode_rename, movie_sort_to_df, series_details)
+from mediafiletools.common import scan_media  # noqa: E402
+from mediafiletools.rename_log import set_rename_log  # noqa: E402
+
+# The filesystem calls slowed down by `--latency`.
+SYSCALLS = ("scandir", "listdir", "stat", "lstat", "rename", "replace")
+
+_QUALITY = ("1080p BluRay x264", "720p WEB-DL", "[2160p] [HEVC]", "DVDRip")
+
+
+class _Timer:
+    # Sums the time spent in a function, nested calls of a recursive
+    # function are only counted once.
+    def __init__(self, func):
+        self.func = func
+        self.total = 0.0
+        self.calls = 0
+        self._depth = 0
+
+    def __call__(self, *args, **kwargs):
+        if self._depth:
+            return self.func(*args, **kwargs)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.total += time.perf_counter() - start
+            self.calls += 1
+            self._depth -= 1
+
+
+class _patch:
+    # Replace module attributes with `_Timer`s for one run.
+    def __init__(self, *targets):
+        self.targets = targets
+        self.timers = {}
+
+    def __enter__(self):
+        for module, name in self.targets:
+            self.timers[name] = _Timer(getattr(module, name))
+            setattr(module, name, self.timers[name])
+        return self.timers
+
+    def __exit__(self, *exc):
+        for module, name in self.targets:
+            setattr(module, name, self.timers[name].func)
+
+
+def slow_syscalls(latency):
+    # Delay every call in `SYSCALLS` by `latency` seconds.
+    def _slow(func):
+        def wrapper(*args, **kwargs):
+            time.sleep(latency)
+            return func(*args, **kwargs)
+        wrapper.original = func
+        return wrapper
+
+    for name in SYSCALLS:
+        setattr(os, name, _slow(getattr(os, name)))
+
+
+def _dirs(root, width, depth):
+    # Every folder of a tree `width` wide and `depth` deep.
+    level = [root]
+    folders = []
+    for _ in range(depth):
+        level = [os.path.join(parent, f"Collection {i}")
+                 for parent in level for i in range(width)]
+        folders.extend(level)
+    return folders
+
+
+def make_movie_tree(root, files, width, depth):
+    # `files` movies spread over the folders, plus a subtitle and an
+    # info file in every folder.
+    folders = _dirs(root, width, depth) or [root]
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        folder = folders[i % len(folders)]
+        name = f"Movie Title {i} ({1950 + i % 70}) " \
+            f"{_QUALITY[i % len(_QUALITY)]}.mkv"
+        open(os.path.join(folder, name), "w").close()
+    for folder in folders:
+        open(os.path.join(folder, "movie.nfo"), "w").close()
+        open(os.path.join(folder, "Movie Title.srt"), "w").close()
+
+
+def make_show_tree(root, files, episodes):
+    # A show of `files` episodes, and the csv of its episode list.
+    rows = []
+    for i in range(files):
+        season, episode = divmod(i, episodes)
+        season += 1
+        episode += 1
+        folder = os.path.join(root, f"Season {season}")
+        if episode == 1:
+            os.makedirs(folder)
+        open(os.path.join(folder, f"Show.S{season:02d}E{episode:03d}."
+                                  f"1080p.WEB.mkv"), "w").close()
+        rows.append((season, episode, f"Episode {episode}", "", ""))
+    import pandas as pd
+
+    csv_path = root + ".csv"
+    pd.DataFrame(rows, columns=series_details.EPISODE_COLUMNS).to_csv(
+        csv_path, index=False)
+    return csv_path
+
+
+def bench_moviedb(root, out):
+    """
+    Time `make_moviedb` by stage. Returns the seconds of every
+    stage, the stages add up to the wall time.
+    """
+    targets = [(movie_sort_to_df, "recursive_sort"),
+               (movie_sort_to_df, "_format_filename"),
+               (movie_sort_to_df, "_create_abc_df"),
+               (movie_sort_to_df, "save_to_file")]
+    with _patch(*targets) as timers:
+        start = time.perf_counter()
+        movie_sort_to_df.make_moviedb(root, filepath=out)
+        wall = time.perf_counter() - start
+    parse = timers["_format_filename"].total
+    output = timers["save_to_file"].total
+    build = timers["_create_abc_df"].total - output
+    traversal = timers["recursive_sort"].total - parse
+    start = time.perf_counter()
+    scan = scan_media(root)
+    scan_s = time.perf_counter() - start
+    start = time.perf_counter()
+    movie_sort_to_df.make_moviedb(root, filepath=out, scan=scan)
+    return {"wall_s": wall, "traversal_s": traversal, "parse_s": parse,
+            "dataframe_s": build, "output_s": output,
+            "other_s": wall - traversal - parse - build - output,
+            "scan_media_s": scan_s,
+            "wall_with_scan_s": time.perf_counter() - start,
+            "movies": timers["_format_filename"].calls}
+
+
+def bench_rename(root, csv_path, journal):
+    """
+    Time `rename_episodes` by stage, then roll the renames back so
+    the tree can be reused.
+    """
+    targets = [(series_details, "plan_renames"),
+               (series_details, "apply_renames"),
+               (episode_rename, "_media_files"),
+               (episode_rename, "parse_episode_number"),
+               (series_details, "make_seriesdb")]
+    with _patch(*targets) as timers:
+        start = time.perf_counter()
+        series_details.rename_episodes(root, csv_path=csv_path,
+                                       journal=journal)
+        wall = time.perf_counter() - start
+    listing = timers["_media_files"].total
+    parse = timers["parse_episode_number"].total
+    start = time.perf_counter()
+    episode_rename.rollback_renames(journal)
+    rollback = time.perf_counter() - start
+    os.remove(journal)
+    return {"wall_s": wall, "episode_table_s": timers["make_seriesdb"].total,
+            "listing_s": listing, "parse_s": parse,
+            "plan_s": timers["plan_renames"].total - listing - parse,
+            "apply_s": timers["apply_renames"].total,
+            "rollback_s": rollback,
+            "episodes": timers["parse_episode_number"].calls}
+
+
+def compare(results, baseline):
+    # Print the change of every stage against an earlier run.
+    for size, benches in results.items():
+        for bench, stages in benches.items():
+            before = baseline.get(size, {}).get(bench, {})
+            for stage, value in stages.items():
+                old = before.get(stage)
+                if not stage.endswith("_s") or not old:
+                    continue
+                print(f"{size:>8} {bench:<8} {stage:<18} {old:9.3f}s -> "
+                      f"{value:9.3f}s  {value / old:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000],
+                        help="Sizes of the trees, in files.")
+    parser.add_argument("--width", type=int, default=10,
+                        help="Folders per level of the movie tree.")
+    parser.add_argument("--depth", type=int, default=2,
+                        help="Levels of folders of the movie tree.")
+    parser.add_argument("--episodes", type=int, default=100,
+                        help="Episodes per season of the TV tree.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds added to every filesystem call.")
+    parser.add_argument("--dir", help="Where the trees are generated. "
+                                      "Default is /dev/shm if it exists.")
+    parser.add_argument("--json", help="Write the results to this file.")
+    parser.add_argument("--compare", help="Compare with the results of "
+                                          "an earlier run.")
+    args = parser.parse_args()
+
+    base = args.dir or ("/dev/shm" if os.path.isdir("/dev/shm") else None)
+    set_rename_log(None)
+    results = {}
+    for files in args.files:
+        tmp = tempfile.mkdtemp(prefix="bench_fs-", dir=base)
+        try:
+            movies = os.path.join(tmp, "Movies")
+            show = os.path.join(tmp, "Show")
+            start = time.perf_counter()
+            make_movie_tree(movies, files, args.width, args.depth)
+            csv_path = make_show_tree(show, files, args.episodes)
+            print(f"{files} files: trees generated in "
+                  f"{time.perf_counter() - start:.1f}s")
+            if args.latency:
+                slow_syscalls(args.latency)
+            try:
+                results[str(files)] = {
+                    "moviedb": bench_moviedb(movies, tmp),
+                    "rename": bench_rename(show, csv_path,
+                                           os.path.join(tmp, "journal")),
+                }
+            finally:
+                for name in SYSCALLS:
+                    setattr(os, name, getattr(getattr(os, name), "original",
+                                              getattr(os, name)))
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        for bench, stages in results[str(files)].items():
+            print(f"  {bench:<8} " + "  ".join(
+                f"{stage[:-2]} {value:.3f}s" for stage, value in stages.items()
+                if stage.endswith("_s")))
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f)["results"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
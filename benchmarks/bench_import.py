@@ -0,0 +1,83 @@
+"""
+Startup cost of the package measured with `python -X importtime`.
+
+Every statement is run in a fresh interpreter, `--repeat` times, and
+the cumulative import time of each top-level module is summed.
+
+Usage:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeat 10 --json results.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+
+# `pass` is the cost of the interpreter itself.
+STATEMENTS = {
+    "interpreter": "pass",
+    "package": "import mediafiletools",
+    "make_moviedb": "from mediafiletools import make_moviedb",
+    "find_music_dupes": "from mediafiletools import find_music_dupes",
+    "make_seriesdb": "from mediafiletools import make_seriesdb",
+}
+
+# "import time: self [us] | cumulative | imported package"
+_LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(statement):
+    """
+    Run `statement` in a new interpreter with `-X importtime`.
+    Returns the total import time in microseconds and the
+    cumulative time of every top-level module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        # Nested imports are indented, keep the top-level ones.
+        if match and len(match.group(3)) == 1:
+            modules[match.group(4)] = int(match.group(2))
+    return sum(modules.values()), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    results = {}
+    for name, statement in STATEMENTS.items():
+        totals = []
+        modules = {}
+        for _ in range(args.repeat):
+            total, modules = import_times(statement)
+            totals.append(total)
+        heaviest = sorted(modules.items(), key=lambda m: -m[1])[:5]
+        results[name] = {
+            "statement": statement,
+            "median_us": statistics.median(totals),
+            "heaviest": dict(heaviest),
+        }
+        print(f"{statement:<45} {statistics.median(totals) / 1000:8.1f} ms")
+        for module, us in heaviest:
+            print(f"    {module:<41} {us / 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Throughput of the series scraper against the local replay server.
+
+Every show of the corpus is scraped `--repeat` times, one season at a
+time and with its seasons fetched concurrently. The time spent in the
+requests and in parsing is measured separately, and the season pages
+are also parsed without any network to get the parser's own speed.
+
+Usage:
+    python benchmarks/bench_scraper.py
+    python benchmarks/bench_scraper.py --latency 0.05 --json results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mediafiletools import series_details  # noqa: E402
+from tests.replay_server import (  # noqa: E402
+    SHOWS, ReplayServer, build_corpus, load_index)
+
+
+class _Timer:
+    # Sums the time spent in a function across threads.
+    def __init__(self, func):
+        self.func = func
+        self.total = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.total += elapsed
+                self.calls += 1
+
+
+def scrape(show_id, seasons, concurrent):
+    """
+    Scrape a show once. Returns the wall time, the number of pages
+    and episodes, and the time spent in requests and parsing.
+    """
+    request = _Timer(series_details._request)
+    parse = _Timer(series_details._scrape_season)
+    series_details._request = request
+    series_details._scrape_season = parse
+    try:
+        start = time.perf_counter()
+        rows = series_details.make_seriesdb(
+            series_id=show_id, end=seasons,
+            max_workers=None if concurrent else 1, from_write_ep=True)
+        wall = time.perf_counter() - start
+    finally:
+        series_details._request = request.func
+        series_details._scrape_season = parse.func
+    return wall, request.calls, len(rows), request.total, parse.total
+
+
+def parse_only(corpus_dir):
+    # Parse every season page of the corpus from memory, the API
+    # responses under /3 are JSON.
+    pages = []
+    for path, f_name in load_index(corpus_dir).items():
+        if "/season/" in path and not path.startswith("/3/"):
+            with open(os.path.join(corpus_dir, f_name),
+                      encoding="utf-8") as f:
+                pages.append((int(path.rsplit("/", 1)[1]), f.read()))
+    episodes = 0
+    start = time.perf_counter()
+    for season, page in pages:
+        episodes += len(series_details._scrape_season(page, season,
+                                                      False)[0])
+    return time.perf_counter() - start, len(pages), episodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Seconds the server delays every response.")
+    parser.add_argument("--corpus", help="Use this corpus instead of "
+                                         "building one.")
+    parser.add_argument("--json", help="Write the results to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or tmp
+        if not args.corpus:
+            build_corpus(corpus_dir)
+
+        results = {}
+        wall, pages, episodes = min(parse_only(corpus_dir)
+                                    for _ in range(args.repeat))
+        results["parse_only"] = {"pages_per_s": pages / wall,
+                                 "episodes_per_s": episodes / wall}
+        print(f"{'parse only':<28} {pages / wall:8.1f} pages/s "
+              f"{episodes / wall:10.1f} episodes/s")
+
+        with ReplayServer(corpus_dir, latency=args.latency) as server:
+            series_details.TMDB_URL = server.url
+            for show_id, name, _, seasons in SHOWS:
+                for concurrent in (False, True):
+                    runs = [scrape(show_id, len(seasons), concurrent)
+                            for _ in range(args.repeat)]
+                    wall = statistics.median(r[0] for r in runs)
+                    _, pages, episodes, network, parsing = runs[0]
+                    label = f"{name} {show_id} " \
+                        f"({'concurrent' if concurrent else 'serial'})"
+                    results[label] = {
+                        "wall_s": wall,
+                        "pages_per_s": pages / wall,
+                        "episodes_per_s": episodes / wall,
+                        "network_s": statistics.median(r[3] for r in runs),
+                        "parse_s": statistics.median(r[4] for r in runs),
+                    }
+                    share = parsing / (network + parsing)
+                    print(f"{label:<28} {pages / wall:8.1f} pages/s "
+                          f"{episodes / wall:10.1f} episodes/s "
+                          f"  network {network * 1000:7.1f} ms "
+                          f"  parse {parsing * 1000:7.1f} ms ({share:.0%})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
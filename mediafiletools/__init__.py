@@ -11,6 +11,10 @@ __all__ = [
     "_extract_data",
     "save_to_file",
     "is_file",
+    "stream_to_file",
+    "register_sink",
+    "MediaScan",
+    "scan_media",
     "find_music_dupes",
     "get_songs",
     "_create_dataframe",
@@ -18,29 +22,97 @@ __all__ = [
     "_fill_df",
     "_calculate_score",
     "_check_artist_match",
+    "find_movie_dupes",
+    "get_movies",
+    "probe_video",
+    "probe_videos",
+    "Catalog",
+    "serve_catalog",
+    "MovieIndex",
+    "ResponseCache",
+    "set_http_cache",
+    "make_seriesdb_many",
+    "NameCache",
+    "set_name_cache",
+    "rollback_renames",
+    "resume_renames",
+    "rename_library",
+    "set_rename_log",
+    "EpisodeProvider",
+    "TMDBProvider",
+    "IMDBProvider",
+    "TMDBAPIProvider",
+    "CSVProvider",
 ]
 
-from mediafiletools.movie_sort_to_df import (
-    make_moviedb,
-    recursive_sort,
-    _format_filename,
-    _create_abc_df,
-    _create_folder_df,
-)
-from mediafiletools.series_details import (
-    make_seriesdb,
-    _parse_series_name,
-    _reach_end_of_season,
-    rename_episodes,
-    _extract_data,
-)
-from mediafiletools.find_music_dupes import (
-    find_music_dupes,
-    get_songs,
-    _create_dataframe,
-    _mark_matched_songs,
-    _fill_df,
-    _calculate_score,
-    _check_artist_match,
-)
-from mediafiletools.common import save_to_file, is_file
+import importlib
+
+# Module of every public name. Modules (and their heavy dependencies
+# like pandas and BeautifulSoup) are only imported the first time one
+# of their names is used.
+_LAZY_ATTRS = {
+    "make_moviedb": "movie_sort_to_df",
+    "recursive_sort": "movie_sort_to_df",
+    "_format_filename": "movie_sort_to_df",
+    "_create_abc_df": "movie_sort_to_df",
+    "_create_folder_df": "movie_sort_to_df",
+    "make_seriesdb": "series_details",
+    "_parse_series_name": "series_details",
+    "_reach_end_of_season": "series_details",
+    "rename_episodes": "series_details",
+    "_extract_data": "series_details",
+    "get_songs": "find_music_dupes",
+    "_create_dataframe": "find_music_dupes",
+    "_mark_matched_songs": "find_music_dupes",
+    "_fill_df": "find_music_dupes",
+    "_calculate_score": "find_music_dupes",
+    "_check_artist_match": "find_music_dupes",
+    "get_movies": "find_movie_dupes",
+    "save_to_file": "common",
+    "is_file": "common",
+    "stream_to_file": "common",
+    "register_sink": "common",
+    "MediaScan": "common",
+    "scan_media": "common",
+    "probe_video": "video_probe",
+    "probe_videos": "video_probe",
+    "Catalog": "catalog_server",
+    "serve_catalog": "catalog_server",
+    "MovieIndex": "search_index",
+    "ResponseCache": "http_cache",
+    "set_http_cache": "http_cache",
+    "make_seriesdb_many": "series_bulk",
+    "NameCache": "name_cache",
+    "set_name_cache": "name_cache",
+    "rollback_renames": "episode_rename",
+    "resume_renames": "episode_rename",
+    "rename_library": "episode_rename",
+    "set_rename_log": "rename_log",
+    "EpisodeProvider": "providers",
+    "TMDBProvider": "providers",
+    "IMDBProvider": "providers",
+    "TMDBAPIProvider": "providers",
+    "CSVProvider": "providers",
+}
+
+
+# `find_movie_dupes` and `find_music_dupes` are also the names of their
+# modules, and importing a module binds it on the package, hiding the
+# function from `__getattr__`. These two are imported up front, they
+# don't pull in any heavy dependency.
+from .find_movie_dupes import find_movie_dupes  # noqa: E402
+from .find_music_dupes import find_music_dupes  # noqa: E402
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    # Cache the name so `__getattr__` isn't called again.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,358 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from .common import EXTENSIONS, MUSIC_FORMAT
+from .find_movie_dupes import _group_movies, _movie_key
+from .movie_sort_to_df import _format_filename
+from .search_index import MovieIndex
+
+
+class Catalog:
+    """
+    In-memory catalog of the movie and music libraries.
+
+    The directory tree is cached with the modification time of every
+    folder, so `refresh()` only lists folders whose contents changed.
+    Files are compared by modification time and size, which catches
+    tags edited in place, and only the tags of new or modified audio
+    files are read. The indexes are only rebuilt for a library that
+    changed, and queries are answered from dicts built after each
+    refresh.
+
+    Parameters
+    ----------
+    movie_dirs: list of str, optional
+        The root directories of the movie files.
+    music_dirs: list of str, optional
+        The root directories of the audio files.
+    distance: float, optional
+        The levenshtein distance used to match song names and movie
+        titles, see `find_music_dupes()`. Default is 0.08.
+    """
+    def __init__(self, movie_dirs=None, music_dirs=None, distance=None):
+        self.movie_dirs = list(movie_dirs or [])
+        self.music_dirs = list(music_dirs or [])
+        self.distance = 0.08 if distance is None else distance
+        self.refreshed = None
+        # path -> (mtime_ns, subdirs, files) of every scanned folder.
+        self._movie_tree = {}
+        self._music_tree = {}
+        # path -> ((mtime_ns, size), (name, path, size)) of every movie.
+        self._movies = {}
+        # path -> ((mtime_ns, size), Song) of every audio file.
+        self._songs = {}
+        self._lock = threading.Lock()
+        self._index = {"titles": {}, "letters": {}, "movie_dupes": [],
+                       "music_dupes": [], "movies": 0, "songs": 0,
+                       "search": MovieIndex()}
+
+    def refresh(self):
+        """
+        Rescan the changed parts of the libraries and rebuild the
+        query indexes. Returns True if anything changed.
+        """
+        from .find_music_dupes import _match_songs
+
+        with self._lock:
+            movie_files = _scan_tree(self.movie_dirs, self._movie_tree,
+                                     EXTENSIONS)
+            music_files = _scan_tree(self.music_dirs, self._music_tree,
+                                     MUSIC_FORMAT)
+            movies_changed = self._update_movies(movie_files)
+            music_changed = self._update_songs(music_files)
+
+            index = dict(self._index)
+            if movies_changed or self.refreshed is None:
+                movies = [self._movies[p][1] for p in movie_files
+                          if p in self._movies]
+                index.update(_index_movies(movies, self.distance))
+            if music_changed or self.refreshed is None:
+                songs = [self._songs[p][1] for p in sorted(self._songs)]
+                for song in songs:
+                    song.matched = song.identical = False
+                    song.score = 0
+                index["music_dupes"] = _match_songs(songs,
+                                                    distance=self.distance)
+                index["songs"] = len(songs)
+            # Swap the whole index so readers never see a partial one.
+            self._index = index
+            self.refreshed = time.time()
+            return movies_changed or music_changed
+
+    def _update_movies(self, paths):
+        # Strip the names of new and modified files only.
+        changed = False
+        movies = {}
+        for path in paths:
+            key = _file_key(path)
+            if key is None:
+                continue
+            cached = self._movies.get(path)
+            if cached is not None and cached[0] == key:
+                movies[path] = cached
+                continue
+            name = _format_filename(os.path.basename(path), strip_all=True)
+            movies[path] = (key, (name, path, key[1]))
+            changed = True
+        changed = changed or movies.keys() != self._movies.keys()
+        self._movies = movies
+        return changed
+
+    def _update_songs(self, paths):
+        # Read the tags of new and modified files only.
+        from .find_music_dupes import Song
+
+        changed = False
+        songs = {}
+        for path in paths:
+            key = _file_key(path)
+            if key is None:
+                continue
+            cached = self._songs.get(path)
+            if cached is not None and cached[0] == key:
+                songs[path] = cached
+                continue
+            try:
+                songs[path] = (key, Song(path))
+                changed = True
+            except Exception as e:
+                print(f"{type(e).__name__} - {e} --> {path}")
+        changed = changed or songs.keys() != self._songs.keys()
+        self._songs = songs
+        return changed
+
+    def lookup(self, title):
+        """
+        Find the movies matching `title`. The query is stripped and
+        normalized like the file names, so "Die.Hard.1988.720p" and
+        "die hard" both find "Die Hard 1988".
+        """
+        if not title.lower().endswith(EXTENSIONS):
+            # Release tags are only stripped from file names.
+            title += ".mkv"
+        name = _format_filename(title, strip_all=True)
+        key_title, year = _movie_key(name)
+        matches = self._index["titles"].get(key_title, [])
+        if year is not None:
+            matches = [m for m in matches if _movie_key(m[0])[1] == year]
+        return [{"movie": m[0], "path": m[1], "size": m[2]} for m in matches]
+
+    def search(self, query, limit=10):
+        # Prefix matches first, then typo-tolerant matches.
+        index = self._index["search"]
+        results = index.prefix(query, limit=limit)
+        for title in index.search(query, limit=limit):
+            if len(results) >= limit:
+                break
+            if title not in results:
+                results.append(title)
+        return results
+
+    def letter(self, char):
+        # Every movie under the `char` heading of the `abc` sort.
+        return self._index["letters"].get(char.upper(), [])
+
+    def dupes(self, kind="movies"):
+        # The duplicate groups of the movie or music library.
+        if kind == "music":
+            return [[{"song": str(song), "path": song.tag._filename}
+                     for song in grp]
+                    for grp in self._index["music_dupes"]]
+        return [[{"movie": m[0], "path": m[1], "size": m[2]} for m in grp]
+                for grp in self._index["movie_dupes"]]
+
+    def status(self):
+        return {"movies": self._index["movies"],
+                "songs": self._index["songs"],
+                "refreshed": self.refreshed}
+
+
+def _file_key(path):
+    # (mtime_ns, size) of a file, None if it's gone.
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _scan_tree(roots, tree, extensions):
+    """
+    Walk the folders under `roots`, reusing the cached listing of
+    every folder whose modification time didn't change. `tree` is
+    updated in place. Returns the file paths.
+    """
+    seen = set()
+    files = []
+    stack = list(reversed(roots))
+    while stack:
+        path = stack.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        cached = tree.get(path)
+        if cached is None or cached[0] != mtime:
+            subdirs, entries = [], []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        # Like `MediaScan`, symlinked folders aren't
+                        # followed, a link to a parent would loop.
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(extensions) \
+                                and entry.is_file():
+                            entries.append(entry.path)
+            except OSError:
+                continue
+            cached = (mtime, sorted(subdirs), sorted(entries))
+            tree[path] = cached
+        files.extend(cached[2])
+        stack.extend(reversed(cached[1]))
+    for path in set(tree) - seen:
+        del tree[path]
+    return files
+
+
+def _index_movies(movies, distance):
+    # Build the lookup dicts for `Catalog`.
+    titles = {}
+    letters = {}
+    for movie in movies:
+        titles.setdefault(_movie_key(movie[0])[0], []).append(movie)
+        if movie[0]:
+            letters.setdefault(movie[0][0].upper(), []).append(movie[0])
+    for names in letters.values():
+        names.sort()
+    return {"titles": titles,
+            "letters": letters,
+            "movie_dupes": _group_movies(movies, distance=distance),
+            "search": MovieIndex(m[0] for m in movies),
+            "movies": len(movies)}
+
+
+class _CatalogHandler(BaseHTTPRequestHandler):
+    # Answers the catalog queries as JSON:
+    #   /lookup?title=<title>
+    #   /search?q=<text>
+    #   /letter/<char>
+    #   /dupes?kind=<movies|music>
+    #   /status
+    catalog = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        if parts[0] == "lookup" and "title" in query:
+            body = {"title": query["title"][0],
+                    "matches": self.catalog.lookup(query["title"][0])}
+        elif parts[0] == "search" and "q" in query:
+            body = {"q": query["q"][0],
+                    "movies": self.catalog.search(query["q"][0])}
+        elif parts[0] == "letter" and len(parts) == 2:
+            body = {"letter": parts[1],
+                    "movies": self.catalog.letter(parts[1])}
+        elif parts[0] == "dupes":
+            kind = query.get("kind", ["movies"])[0]
+            body = {"kind": kind, "groups": self.catalog.dupes(kind)}
+        elif parts[0] == "status":
+            body = self.catalog.status()
+        else:
+            self.send_error(404, "Valid queries are /lookup?title=, "
+                                 "/search?q=, /letter/<char>, /dupes "
+                                 "and /status.")
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet, every query would be printed.
+        pass
+
+
+def make_catalog_server(catalog, host="127.0.0.1", port=8765):
+    """
+    Create the HTTP server answering queries from `catalog`.
+    Call `serve_forever()` on the result to start it.
+    """
+    handler = type("CatalogHandler", (_CatalogHandler,), {"catalog": catalog})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve_catalog(movie_dirs=None, music_dirs=None, host="127.0.0.1",
+                  port=8765, refresh_interval=300, distance=None):
+    """
+    Load the movie and music catalogs once, keep them in memory and
+    answer queries on a local HTTP port until interrupted. The
+    catalogs are refreshed in the background every
+    `refresh_interval` seconds, only rescanning changed folders.
+
+    Example:
+        serve_catalog(movie_dirs=['/mnt/movies'],
+                      music_dirs=['/mnt/music'], port=8765)
+
+        curl 'http://127.0.0.1:8765/lookup?title=die%20hard'
+        curl 'http://127.0.0.1:8765/search?q=blazing%20sadles'
+        curl 'http://127.0.0.1:8765/letter/D'
+        curl 'http://127.0.0.1:8765/dupes?kind=music'
+
+    Parameters
+    ----------
+    movie_dirs: list of str, optional
+        The root directories of the movie files.
+    music_dirs: list of str, optional
+        The root directories of the audio files.
+    host: str, default `127.0.0.1`
+        The address to listen on.
+    port: int, default 8765
+        The port to listen on.
+    refresh_interval: float, default 300
+        Seconds between background refreshes.
+    distance: float, optional
+        The levenshtein distance used to find duplicates.
+    """
+    catalog = Catalog(movie_dirs, music_dirs, distance=distance)
+    catalog.refresh()
+    server = make_catalog_server(catalog, host=host, port=port)
+    stop = threading.Event()
+
+    def _refresh_loop():
+        while not stop.wait(refresh_interval):
+            catalog.refresh()
+
+    threading.Thread(target=_refresh_loop, daemon=True).start()
+    print(f"Serving catalog on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the media catalog.")
+    parser.add_argument("--movies", nargs="*", default=[])
+    parser.add_argument("--music", nargs="*", default=[])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--refresh", type=float, default=300)
+    args = parser.parse_args()
+    serve_catalog(args.movies, args.music, host=args.host, port=args.port,
+                  refresh_interval=args.refresh)
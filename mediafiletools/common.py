@@ -1,7 +1,11 @@
+import csv
+import json
 import os
 import re
-import Levenshtein
-from tabulate import tabulate
+import sys
+import tempfile
+
+from .metrics import count, counted, stage
 
 
 EXTENSIONS = ('.mp4', '.mkv', '.avi', 'ts', 'mov', '.wmv', '.flv', '.webm',
@@ -12,8 +16,52 @@ EXTENSIONS = ('.mp4', '.mkv', '.avi', 'ts', 'mov', '.wmv', '.flv', '.webm',
 # TODO only wav, flac and mp3 covered in tests
 MUSIC_FORMAT = ('wav', 'flac', 'alac', 'AIFF', 'ogg', 'mp3', 'wma', 'm4a', 'AAC')
 
+SUB_EXTENSIONS = ('.srt', '.vtt')
+
+# The kinds of files of a `MediaScan`.
+VIDEO, AUDIO, SUBTITLE, OTHER = "video", "audio", "subtitle", "other"
+
+# Buffer size of the streaming writers.
+WRITE_BUFFER_SIZE = 1024 * 1024
+# The output types of `stream_to_file()`.
+STREAM_TYPES = ("txt", "csv", "jsonl", "console")
+
+
+# The writers of `save_to_file()` by output type, as
+# (file extension, writer). Added with `register_sink()`.
+_SINKS = {}
+
+
+def register_sink(output_type, extension=None):
+    """
+    Register a writer as the `output_type` of `save_to_file()`, and
+    so of `make_moviedb()`, `make_seriesdb()` and the dupe finders.
+    The writer is called as `writer(df, fpath, fname, key=None)`,
+    where `fpath` is the output file, or None if `extension` is None.
+
+    Example:
+        @register_sink("html", ".html")
+        def write_html(df, fpath, fname, key=None):
+            df.to_html(fpath, index=False)
 
-def save_to_file(df, filepath=None, output_type=None, fname=None):
+    Parameters
+    ----------
+    output_type: str
+        The `output_type` keyword of the writer.
+    extension: str, optional
+        The extension of the output files, e.g. ".html". None if the
+        writer doesn't write a file.
+
+    .. versionadded:: 2.2.0
+    """
+    def decorator(writer):
+        _SINKS[output_type] = (extension, writer)
+        return writer
+    return decorator
+
+
+@stage("output")
+def save_to_file(df, filepath=None, output_type=None, fname=None, key=None):
     """
     Helper function to save the resulting DataFrame to
     a file or to print to console.
@@ -27,46 +75,366 @@ def save_to_file(df, filepath=None, output_type=None, fname=None):
         Default is /home/user.
     output_type: str, default `txt`
         Choose the resulting filetype/output. Valid types are `txt`,
-        `csv`, `console`.
+        `csv`, `console`, `jsonl`, `sqlite`, and `parquet` and
+        `feather` if pyarrow is installed, or any type added with
+        `register_sink()`.
     fname: str
-        The filename for the output movie database.
+        The filename for the output movie database. Also the table
+        name of `sqlite` output.
+    key: list of str, optional
+        The columns identifying a row. `sqlite` output updates the
+        rows with the same key in an existing table instead of
+        replacing the table.
+
+        .. versionadded:: 2.2.0
     """
-    if output_type == "txt":
+    sink = _SINKS.get(output_type)
+    if sink is None:
+        valid = ", ".join(repr(t) for t in _SINKS)
+        raise ValueError(
+            f"{output_type} is not a valid output type. Valid "
+            f"keywords are {valid}."
+        )
+    extension, writer = sink
+    fpath = None
+    if extension is not None:
         if is_file(filepath):
             fpath = filepath
         else:
-            fpath = os.path.join(filepath, fname + ".txt")
-        # Convert the dataframe to a left-aligned table string using tabulate
-        table_str = _tabulate_df(df)
-        with open(fpath, "w", encoding="utf-8") as txt:
-            txt.write(table_str)
-    elif output_type == "csv":
-        if is_file(filepath):
-            df.to_csv(filepath, index=False)
+            fpath = os.path.join(filepath, fname + extension)
+    writer(df, fpath, fname, key=key)
+    count("rows_written", len(df))
+
+
+@register_sink("txt", ".txt")
+def _write_txt(df, fpath, fname, key=None):
+    with open(fpath, "w", encoding="utf-8",
+              buffering=WRITE_BUFFER_SIZE) as txt:
+        _write_df_table(txt, df)
+
+
+@register_sink("csv", ".csv")
+def _write_csv(df, fpath, fname, key=None):
+    df.to_csv(fpath, index=False)
+
+
+@register_sink("console")
+def _write_console(df, fpath, fname, key=None):
+    _write_df_table(sys.stdout, df)
+    sys.stdout.write("\n")
+
+
+@register_sink("jsonl", ".jsonl")
+def _write_jsonl(df, fpath, fname, key=None):
+    _write_json_lines(df.itertuples(index=False, name=None),
+                      list(df.columns), fpath)
+
+
+@register_sink("sqlite", ".sqlite")
+def _write_sqlite(df, fpath, fname, key=None):
+    # A table named `fname`, replaced on every write unless `key`
+    # is given, then rows with the same key are updated in place.
+    import sqlite3
+
+    columns = [str(c) for c in df.columns]
+    table = _quote_name(fname)
+    names = ", ".join(_quote_name(c) for c in columns)
+    insert = f"INSERT INTO {table} ({names}) " \
+        f"VALUES ({', '.join('?' * len(columns))})"
+    con = sqlite3.connect(fpath)
+    try:
+        with con:
+            if key is None:
+                con.execute(f"DROP TABLE IF EXISTS {table}")
+            con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({names})")
+            if key is not None:
+                keys = ", ".join(_quote_name(c) for c in key)
+                con.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS "
+                            f"{_quote_name(fname + ' key')} "
+                            f"ON {table} ({keys})")
+                updates = ", ".join(f"{_quote_name(c)} = excluded."
+                                    f"{_quote_name(c)}"
+                                    for c in columns if c not in key)
+                insert += f" ON CONFLICT ({keys}) DO " + \
+                    (f"UPDATE SET {updates}" if updates else "NOTHING")
+            con.executemany(insert, (
+                [_null_nan(cell) for cell in row]
+                for row in df.itertuples(index=False, name=None)))
+    finally:
+        con.close()
+
+
+def _quote_name(name):
+    # An SQLite identifier, e.g. a table or column name.
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+@register_sink("parquet", ".parquet")
+def _write_parquet(df, fpath, fname, key=None):
+    _require_pyarrow("parquet")
+    df.to_parquet(fpath, index=False)
+
+
+@register_sink("feather", ".feather")
+def _write_feather(df, fpath, fname, key=None):
+    _require_pyarrow("feather")
+    df.reset_index(drop=True).to_feather(fpath)
+
+
+def _require_pyarrow(output_type):
+    import importlib.util
+
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError(f"The {output_type} output type requires pyarrow, "
+                          f"install it with 'pip install pyarrow'.")
+
+
+def _write_json_lines(rows, columns, fpath):
+    # One JSON object per row, written as the rows arrive.
+    with open(fpath, "w", encoding="utf-8",
+              buffering=WRITE_BUFFER_SIZE) as f:
+        for row in rows:
+            f.write(json.dumps(
+                dict(zip(columns, map(_null_nan, row))),
+                ensure_ascii=False, default=str) + "\n")
+
+
+def _null_nan(cell):
+    # Missing values (NaN) are written as null.
+    return None if isinstance(cell, float) and cell != cell else cell
+
+
+@stage("output")
+def stream_to_file(rows, columns, filepath=None, output_type=None, fname=None):
+    """
+    Write rows to a file or the console without building a DataFrame.
+    Memory use doesn't depend on the number of rows: `csv` and `jsonl`
+    rows are written as they arrive. `txt` and `console` need the
+    column widths first, so the rows are measured in a first pass
+    (and spooled to a temporary file if `rows` is an iterator) and
+    written in a second, buffered pass. The table layout is the same
+    as `save_to_file()` with cells written verbatim.
+
+    Parameters
+    ----------
+    rows: iterable of tuple
+        The rows of the table.
+    columns: list of str
+        The column headers.
+    filepath: str, optional
+        The directory path or file path for the output file.
+    output_type: str, default `txt`
+        Choose the resulting filetype/output. Valid types are `txt`,
+        `csv`, `jsonl`, `console`.
+    fname: str
+        The filename for the output file.
+    """
+    rows = counted("rows_written", rows)
+    if output_type == "csv":
+        fpath = filepath if is_file(filepath) else \
+            os.path.join(filepath, fname + ".csv")
+        with open(fpath, "w", encoding="utf-8", newline="",
+                  buffering=WRITE_BUFFER_SIZE) as f:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+    elif output_type == "jsonl":
+        _write_json_lines(rows, columns, filepath if is_file(filepath)
+                          else os.path.join(filepath, fname + ".jsonl"))
+    elif output_type in ("txt", "console"):
+        widths = [len(c) + 2 for c in columns]
+        if iter(rows) is rows:
+            # A one-shot iterator can't be read twice, spool it.
+            with tempfile.TemporaryFile("w+", encoding="utf-8",
+                                        newline="") as spool:
+                writer = csv.writer(spool)
+                for row in rows:
+                    row = _measure_row(row, widths)
+                    writer.writerow(row)
+                spool.seek(0)
+                _write_table(csv.reader(spool), columns, widths,
+                             filepath, output_type, fname)
         else:
-            df.to_csv(os.path.join(filepath, fname + ".csv"), index=False)
-    elif output_type == "console":
-        table_str = _tabulate_df(df)
-        print(table_str)
+            for row in rows:
+                _measure_row(row, widths)
+            _write_table(rows, columns, widths,
+                         filepath, output_type, fname)
     else:
         raise ValueError(
             f"{output_type} is not a valid output type. Valid "
-            f"keywords are 'txt', 'csv' or 'console'."
+            f"keywords are 'txt', 'csv', 'jsonl' or 'console'."
         )
 
 
+def _measure_row(row, widths):
+    # Widen `widths` to fit the row and return its cleaned cells.
+    cells = _clean_cells(row)
+    for i, cell in enumerate(cells):
+        width = _text_width(cell)
+        if width > widths[i]:
+            widths[i] = width
+    return cells
+
+
+def _clean_cells(row):
+    return ["" if cell is None else str(cell).strip() for cell in row]
+
+
+def _write_table(rows, columns, widths, filepath, output_type, fname):
+    # Second pass of `stream_to_file()`, pads every cell to its width.
+    if output_type == "console":
+        _write_lines(sys.stdout, rows, columns, widths)
+        sys.stdout.write("\n")
+        return
+    fpath = filepath if is_file(filepath) else \
+        os.path.join(filepath, fname + ".txt")
+    with open(fpath, "w", encoding="utf-8",
+              buffering=WRITE_BUFFER_SIZE) as txt:
+        _write_lines(txt, rows, columns, widths)
+
+
+def _write_lines(f, rows, columns, widths):
+    f.write(_format_line(columns, widths))
+    for row in rows:
+        f.write("\n" + _format_line(_clean_cells(row), widths))
+
+
+def _format_line(cells, widths):
+    # Same layout as `_tabulate_df`: a leading space, two spaces
+    # between columns and no trailing whitespace.
+    return " " + "  ".join(
+        cell.ljust(width + len(cell) - _text_width(cell))
+        for cell, width in zip(cells, widths)
+    ).rstrip()
+
+
+def _text_width(text):
+    # The number of terminal columns `text` takes up. Wide characters
+    # are only measured if `wcwidth` is installed, like tabulate does.
+    if text.isascii():
+        return len(text)
+    try:
+        from wcwidth import wcswidth
+    except ImportError:
+        return len(text)
+    width = wcswidth(text)
+    return width if width >= 0 else len(text)
+
+
 def _print_file_loc(output_type, filepath, f_name):
     # Prints file location to console.
     if output_type != 'console':
         msg = f"\n{output_type} file located in: "
-        if filepath.endswith((".csv", ".txt")):
+        extension = _SINKS[output_type][0] \
+            if output_type in _SINKS else f".{output_type}"
+        if filepath.endswith(tuple(e for e, _ in _SINKS.values() if e)):
             fpath = filepath
         else:
-            fpath = f"{os.path.join(filepath, f_name)}.{output_type}"
+            fpath = f"{os.path.join(filepath, f_name)}{extension}"
         print(msg + fpath)
 
 
+def _write_df_table(f, df):
+    # Write the table of `_tabulate_df` to `f` line by line.
+    lines = _fixed_width_lines(df)
+    if lines is None:
+        f.write(_tabulate_df(df))
+        return
+    f.write(lines[0])
+    for line in lines[1]:
+        f.write("\n" + line)
+
+
+def _fixed_width_lines(df):
+    """
+    Render the plain tabulate table of `df` with vectorized string
+    operations, which is much faster than tabulate on big tables.
+    Only integer and string columns whose cells tabulate writes
+    verbatim are rendered, None is returned for any other frame
+    so it's left to tabulate.
+
+    Returns
+    -------
+    tuple
+        (header line, Series of row lines)
+    """
+    import pandas as pd
+
+    if len(df.columns) == 0:
+        return None
+    columns = [str(c) for c in df.columns]
+    widths = [len(c) + 2 for c in columns]
+    cells = []
+    for i in range(len(columns)):
+        text = _column_text(df.iloc[:, i])
+        if text is None:
+            return None
+        display = text.str.len()
+        wide = ~text.map(str.isascii).astype(bool)
+        if wide.any():
+            display[wide] = text[wide].map(_text_width)
+        if len(text):
+            widths[i] = max(widths[i], int(display.max()))
+        if wide.any():
+            cells.append(text + pd.Series(" ", index=text.index)
+                         .str.repeat(widths[i] - display))
+        else:
+            cells.append(text.str.ljust(widths[i]))
+    rows = cells[0].str.cat(cells[1:], sep="  ") if len(cells) > 1 \
+        else cells[0]
+    return _format_line(columns, widths), " " + rows.str.rstrip()
+
+
+def _column_text(column):
+    # The cells of a column as tabulate writes them, None if they
+    # need tabulate's number formatting.
+    import pandas as pd
+    from pandas.api.types import is_integer_dtype, is_string_dtype
+
+    if is_integer_dtype(column.dtype):
+        return column.astype(str)
+    if not is_string_dtype(column.dtype):
+        return None
+    missing = column.isna()
+    text = column.astype(object)
+    if missing.any():
+        # None is tabulate's missing value, NaN is written as "nan".
+        text[missing] = [
+            "" if cell is None else "nan" for cell in text[missing]]
+    if column.dtype == object and not text.map(type).eq(str).all():
+        return None
+    text = text.astype(str).str.strip()
+    if text.str.contains("\n", regex=False).any():
+        return None
+    # Tabulate formats a column as numbers or booleans unless one of
+    # its cells is text, only plain integers come out unchanged.
+    filled = text[text != ""]
+    numeric = pd.to_numeric(filled, errors="coerce").notna()
+    if not any(_is_text(cell) for cell in filled[~numeric]):
+        if filled.empty or missing.any() or \
+                not filled.str.fullmatch(r"-?(0|[1-9][0-9]*)").all():
+            return None
+    return text
+
+
+def _is_text(cell):
+    # Whether tabulate reads the cell as a string.
+    if cell in ("True", "False"):
+        return False
+    try:
+        float(cell)
+    except ValueError:
+        return True
+    return False
+
+
 def _tabulate_df(df):
+    lines = _fixed_width_lines(df)
+    if lines is not None:
+        return "\n".join([lines[0], *lines[1]])
+    from tabulate import tabulate
+
     table_str = tabulate(df, headers='keys', tablefmt='plain', stralign='left',
                          numalign='left', showindex=False)
     # Add a space before each item for readability
@@ -86,6 +454,8 @@ def is_file(filepath):
 def normalize_ld(seq1, seq2):
     # Scale levenshtein distance according to sequence length.
     # Default max distance = 0.08
+    import Levenshtein
+
     lev_distance = Levenshtein.distance(seq1, seq2)
     max_distance = len(seq1) + len(seq2)
     return lev_distance / max_distance
@@ -95,3 +465,141 @@ def clean_filename(f_name):
     # Remove special characters that can cause issues
     # with file creation.
     return re.sub(r'[^A-Za-z0-9 ]+', '-', f_name)
+
+
+def media_kind(name):
+    # The kind of a file, with the same extension checks as the
+    # movie, music and episode tools.
+    name = name.lower()
+    if name.endswith(EXTENSIONS):
+        return VIDEO
+    if name.endswith(MUSIC_FORMAT):
+        return AUDIO
+    if name.endswith(SUB_EXTENSIONS):
+        return SUBTITLE
+    return OTHER
+
+
+class MediaScan:
+    """
+    Every file under a folder, classified as video, audio, subtitle
+    or other in a single walk. Pass it as the `scan` of
+    `make_moviedb()`, `find_movie_dupes()`, `find_music_dupes()`,
+    `rename_episodes()` and `rename_library()` so a share they all
+    read is only walked once.
+
+    Example:
+        scan = scan_media('/mnt/media')
+        make_moviedb('/mnt/media/Movies', scan=scan)
+        find_music_dupes('/mnt/media/Music', scan=scan)
+        rename_library('/mnt/media/TV', scan=scan)
+
+    Like `os.walk()`, symlinked folders aren't followed and folders
+    that can't be read are skipped.
+
+    Attributes
+    ----------
+    root: str
+        The scanned folder.
+    video, audio, subtitle, other: list of str
+        The paths of the files of each kind, in walk order.
+
+    .. versionadded:: 2.2.0
+    """
+    def __init__(self, root):
+        self.root = root
+        self.video = []
+        self.audio = []
+        self.subtitle = []
+        self.other = []
+        # Normalized folder path -> (sub folder names, [(name, kind)]),
+        # both sorted by name.
+        self._dirs = {}
+        self._scan()
+
+    def _scan(self):
+        partitions = {VIDEO: self.video, AUDIO: self.audio,
+                      SUBTITLE: self.subtitle, OTHER: self.other}
+        stack = [self.root]
+        while stack:
+            top = stack.pop()
+            try:
+                with os.scandir(top) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            dirs = []
+            files = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    kind = media_kind(entry.name)
+                    files.append((entry.name, kind))
+                    partitions[kind].append(entry.path)
+            self._dirs[os.path.normpath(top)] = (dirs, files)
+            stack.extend(os.path.join(top, d) for d in reversed(dirs))
+
+    def __contains__(self, path):
+        return os.path.normpath(path) in self._dirs
+
+    def listdir(self, path, kind=None):
+        """
+        The sub folder names and file names of a scanned folder, only
+        the files of `kind` (or a tuple of kinds) if it's given.
+
+        Returns
+        -------
+        tuple of list
+            (folder names, file names), both sorted.
+        """
+        listing = self._dirs.get(os.path.normpath(path))
+        if listing is None:
+            raise FileNotFoundError(f"{path} isn't in the scan of "
+                                    f"{self.root}.")
+        dirs, files = listing
+        kinds = (kind,) if isinstance(kind, str) else kind
+        return list(dirs), [name for name, k in files
+                            if kinds is None or k in kinds]
+
+    def walk(self, top=None):
+        """
+        Walk a scanned folder like `os.walk()`, top-down and sorted
+        by name, without touching the disk. Removing names from the
+        yielded folder list skips them.
+
+        Raises
+        ------
+        FileNotFoundError
+            If `top` isn't in the scan.
+        """
+        top = self.root if top is None else top
+        if top not in self:
+            raise FileNotFoundError(f"{top} isn't in the scan of "
+                                    f"{self.root}.")
+        return self._walk(top)
+
+    def _walk(self, top):
+        dirs, files = self.listdir(top)
+        yield top, dirs, files
+        for d in dirs:
+            path = os.path.join(top, d)
+            # Folders that couldn't be read are skipped, like os.walk().
+            if path in self:
+                yield from self._walk(path)
+
+    def files(self, kind, top=None):
+        # The paths of the files of `kind` under `top`, in walk order.
+        for root, _, _ in self.walk(top):
+            for name in self.listdir(root, kind)[1]:
+                yield os.path.join(root, name)
+
+
+@stage("scan")
+def scan_media(root):
+    """
+    Walk `root` once and classify every file, see `MediaScan`.
+
+    .. versionadded:: 2.2.0
+    """
+    return MediaScan(root)
@@ -0,0 +1,549 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from .common import EXTENSIONS, SUB_EXTENSIONS, SUBTITLE, VIDEO
+from .metrics import count, stage
+from .profiling import entry_point
+from .rename_log import flush_rename_log, log_dir, log_event
+
+
+JOURNAL_VERSION = 1
+MEDIA_EXTENSIONS = EXTENSIONS + SUB_EXTENSIONS
+PLAN_COLUMNS = ["Season", "Folder", "Old Name", "New Name"]
+LIBRARY_COLUMNS = ["Show", "Season", "Old Name", "New Name", "Status"]
+
+# "S01E02", "s1.e2", "S01 E02"
+_SXXEYY_RE = re.compile(r"(?<![a-z0-9])s(\d{1,2})[ ._-]?e(\d{1,3})(?!\d)",
+                        re.IGNORECASE)
+# "1x02"
+_NXNN_RE = re.compile(r"(?<![a-z0-9])(\d{1,2})x(\d{2,3})(?!\d)",
+                      re.IGNORECASE)
+# "Episode 2", "Ep.02", "E02"
+_EPISODE_RE = re.compile(r"(?<![a-z0-9])(?:episode|ep|e)[ ._-]?(\d{1,3})"
+                         r"(?!\d)", re.IGNORECASE)
+
+# "Season 1"
+_SEASON_DIR_RE = re.compile(r"Season \d+$")
+# "Seinfeld (1989)"
+_SHOW_YEAR_RE = re.compile(r"(.+?)\s*\((\d{4})\)$")
+
+# Suffix of the temporary names used to break rename cycles.
+_TMP_SUFFIX = ".mftrename"
+
+
+@stage("plan")
+def plan_renames(root_folder_path, df, info="", listing=None):
+    """
+    Build the complete old -> new name mapping of every season
+    before anything is renamed. Files are matched to their episode
+    by the numbers in their names, e.g. "S01E02", "1x02" or
+    "Episode 2". If no file of a folder has numbers, the files are
+    paired with the episodes in sorted order.
+
+    Parameters
+    ----------
+    root_folder_path: str
+        The root directory of the series.
+    df: DataFrame
+        The 'Season', 'Episode Number' and 'Title' of every episode.
+    info: str, optional
+        Text appended to every new name.
+    listing: dict, optional
+        The media file names of every season folder, by folder path.
+        Folders missing from it are skipped. Default is to list the
+        season folders.
+
+    Returns
+    -------
+    tuple of list
+        (season, folder, old name, new name) of every file to rename
+        and (season, folder, name) of every file matching no episode.
+
+    Raises
+    ------
+    ValueError
+        If two files would get the same name or a new name is
+        taken by a file that isn't renamed.
+    """
+    # (season, episode) -> title
+    titles = {(int(s), int(e)): t for s, e, t in
+              zip(df["Season"], df["Episode Number"], df["Title"])}
+    moves = []
+    unmatched = []
+    for season in sorted({s for s, _ in titles}):
+        # Look for folders titled 'Season X'. Change depending on naming scheme.
+        # TODO add way of handling other naming schemes.
+        season_folder = os.path.join(root_folder_path, f"Season {season}")
+        if listing is not None:
+            names = sorted(listing.get(season_folder, ()))
+        else:
+            try:
+                names = _media_files(season_folder)
+            except OSError:
+                print(f"Season folder {season_folder} does not exist. "
+                      f"Skipping...")
+                continue
+
+        count("files_scanned", len(names))
+        keys = {name: parse_episode_number(name, season) for name in names}
+        if not any(keys.values()):
+            keys = _sorted_keys(names, season,
+                                sorted(e for s, e in titles if s == season))
+        for old_name in names:
+            key = keys[old_name]
+            if key not in titles:
+                unmatched.append((season, season_folder, old_name))
+                continue
+            new_name = episode_file_name(key[0], key[1], titles[key], info,
+                                         os.path.splitext(old_name)[1])
+            if new_name != old_name:
+                moves.append((season, season_folder, old_name, new_name))
+
+    _check_plan(moves)
+    return moves, unmatched
+
+
+def _media_files(folder):
+    # The sorted names of the video and subtitle files in `folder`.
+    with os.scandir(folder) as it:
+        return sorted(e.name for e in it if e.is_file() and
+                      e.name.lower().endswith(MEDIA_EXTENSIONS))
+
+
+def parse_episode_number(name, season=None):
+    """
+    The (season, episode) numbers in a file name, from "S01E02",
+    "1x02" or "Episode 2". The last one takes the season of the
+    folder. Returns None if the name has no numbers.
+    """
+    match = _SXXEYY_RE.search(name) or _NXNN_RE.search(name)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    match = _EPISODE_RE.search(name)
+    if match and season is not None:
+        return int(season), int(match.group(1))
+    return None
+
+
+def _sorted_keys(names, season, episodes):
+    # Pair the files of a folder without episode numbers with the
+    # episodes in sorted order, the videos and subtitles separately.
+    keys = dict.fromkeys(names)
+    for ext in (EXTENSIONS, SUB_EXTENSIONS):
+        files = [n for n in names if n.lower().endswith(ext)]
+        if len(files) == len(episodes):
+            keys.update((n, (season, e)) for n, e in zip(files, episodes))
+    return keys
+
+
+def episode_file_name(season, episode_num, title, info, file_ext):
+    # "S01E02 - Title - info.mkv"
+    episode_name = "".join(c for c in str(title) if c not in r'\/:*?"<>|')
+    return f"S{int(season):02d}E{int(episode_num):02d} - " \
+        f"{episode_name}{info}{file_ext}"
+
+
+def plan_to_df(moves, unmatched=()):
+    # The plan as a DataFrame, returned by a dry run. The files
+    # matching no episode have no new name.
+    import pandas as pd
+
+    rows = list(moves) + [(s, f, name, None) for s, f, name in unmatched]
+    return pd.DataFrame(rows, columns=PLAN_COLUMNS)
+
+
+def _check_plan(moves):
+    # Detect names claimed twice and names taken by other files.
+    sources = {os.path.normcase(os.path.join(f, old))
+               for _, f, old, _ in moves}
+    targets = {}
+    for _, folder, old_name, new_name in moves:
+        dst = os.path.join(folder, new_name)
+        key = os.path.normcase(dst)
+        if key in targets:
+            raise ValueError(f"{targets[key]} and {old_name} would both be "
+                             f"renamed to {new_name} in {folder}.")
+        targets[key] = old_name
+        if key not in sources and os.path.exists(dst):
+            raise ValueError(f"Renaming {old_name} would overwrite "
+                             f"{new_name} in {folder}.")
+
+
+def _plan_steps(moves):
+    """
+    Order the renames of every folder. A file whose new name is the
+    old name of another file (a chain or a cycle, like swapping two
+    names) is moved to a temporary name first.
+
+    Returns
+    -------
+    list of list
+        [id, folder, source, destination] of every rename.
+    """
+    folders = {}
+    for _, folder, old_name, new_name in moves:
+        folders.setdefault(folder, []).append((old_name, new_name))
+    steps = []
+    for folder, pairs in folders.items():
+        sources = {os.path.normcase(old) for old, _ in pairs}
+        direct, first, second = [], [], []
+        for old_name, new_name in pairs:
+            if os.path.normcase(new_name) in sources:
+                tmp = f".{old_name}{_TMP_SUFFIX}"
+                first.append((old_name, tmp))
+                second.append((tmp, new_name))
+            else:
+                direct.append((old_name, new_name))
+        for src, dst in first + direct + second:
+            steps.append([len(steps), folder, os.path.join(folder, src),
+                          os.path.join(folder, dst)])
+    return steps
+
+
+@stage("apply")
+def apply_renames(moves, journal, max_workers=None):
+    """
+    Rename the files of a plan, the season folders concurrently.
+    Every rename is recorded in a write-ahead `journal` file. If one
+    fails, the renames already made are rolled back and the error is
+    raised. A committed journal can still be undone with
+    `rollback_renames()`.
+
+    Parameters
+    ----------
+    moves: list of tuple
+        The plan made by `plan_renames()`.
+    journal: str
+        The path of the journal file.
+    max_workers: int, optional
+        The number of folders renamed at the same time.
+
+    Returns
+    -------
+    int
+        The number of files renamed.
+    """
+    steps = _plan_steps(moves)
+    os.makedirs(os.path.dirname(os.path.abspath(journal)), exist_ok=True)
+    with open(journal, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"version": JOURNAL_VERSION, "steps": steps}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _run_steps(steps, journal, set(), max_workers)
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"committed": True}) + "\n")
+    return len(moves)
+
+
+def resume_renames(journal, max_workers=None):
+    # Finish the renames of an interrupted `apply_renames()`.
+    steps, done = _read_journal(journal)
+    _run_steps(steps, journal, done, max_workers)
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"committed": True}) + "\n")
+
+
+def rollback_renames(journal):
+    """
+    Undo the renames recorded in `journal`, newest first. Works on
+    interrupted and committed journals, and can itself be resumed
+    if it's interrupted. If `journal` is a folder, like the one
+    written by `rename_library()`, every journal in it is undone.
+
+    Returns
+    -------
+    int
+        The number of renames undone.
+    """
+    if os.path.isdir(journal):
+        return sum(rollback_renames(os.path.join(journal, f))
+                   for f in sorted(os.listdir(journal))
+                   if f.endswith(".journal"))
+    steps, done = _read_journal(journal)
+    undone = 0
+    with open(journal, "a", encoding="utf-8") as f:
+        for step_id, _, src, dst in reversed(steps):
+            if step_id not in done:
+                continue
+            # The rename may have been undone before the journal
+            # was written.
+            if os.path.exists(dst):
+                os.rename(dst, src)
+            elif not os.path.exists(src):
+                # Moved or deleted since, the other steps are still
+                # undone.
+                log_event("rename", logging.WARNING, old=dst, new=src,
+                          status="missing")
+                f.write(json.dumps({"undone": step_id}) + "\n")
+                f.flush()
+                continue
+            log_event("rename", old=dst, new=src, status="rolled back")
+            f.write(json.dumps({"undone": step_id}) + "\n")
+            f.flush()
+            undone += 1
+    return undone
+
+
+def _read_journal(journal):
+    # The steps of a journal and the ids of the renames in effect.
+    with open(journal, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != JOURNAL_VERSION:
+            raise ValueError(f"{os.path.basename(journal)} was written by an "
+                             f"incompatible version.")
+        done = set()
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash.
+                continue
+            if "done" in record:
+                done.add(record["done"])
+            elif "undone" in record:
+                done.discard(record["undone"])
+    return header["steps"], done
+
+
+def _run_steps(steps, journal, done, max_workers=None):
+    # Apply the steps not in `done`, one thread per folder.
+    from concurrent.futures import ThreadPoolExecutor
+
+    folders = {}
+    for step in steps:
+        if step[0] not in done:
+            folders.setdefault(step[1], []).append(step)
+    lock = threading.Lock()
+    failed = threading.Event()
+    errors = []
+
+    with open(journal, "a", encoding="utf-8") as log:
+        def _rename_folder(folder_steps):
+            for step_id, _, src, dst in folder_steps:
+                if failed.is_set():
+                    return
+                start = time.perf_counter()
+                try:
+                    # The rename may have been made before a crash
+                    # kept it out of the journal.
+                    if os.path.exists(src) or not os.path.exists(dst):
+                        os.rename(src, dst)
+                except OSError as e:
+                    log_event("rename", logging.ERROR, old=src, new=dst,
+                              status="failed", error=str(e))
+                    errors.append(e)
+                    failed.set()
+                    return
+                log_event("rename", old=src, new=dst, status="renamed",
+                          ms=round((time.perf_counter() - start) * 1000, 3))
+                with lock:
+                    log.write(json.dumps({"done": step_id}) + "\n")
+                    log.flush()
+
+        if folders:
+            workers = min(max_workers or 4, len(folders))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_rename_folder, folders.values()))
+
+    if errors:
+        rollback_renames(journal)
+        raise errors[0]
+
+
+@entry_point
+def rename_library(tv_root, mapping=None, info=None, dry_run=False,
+                   journal_dir=None, max_workers=None, rate=5.0,
+                   scan=None, profile=None, metrics=None):
+    """
+    Rename the episodes of every show under `tv_root` at once. The
+    tree is scanned a single time, the episode lists of all the shows
+    are scraped concurrently under one rate limit (and through the
+    caches set with `set_http_cache()` and `set_name_cache()`), then
+    the shows are renamed in a pool of workers. Each show is renamed
+    on its own, a failing show is rolled back without stopping the
+    others. A single report is returned instead of a line per file.
+
+    <tv_root>
+      |
+      |-- Seinfeld (1989)
+      |     |-- Season 1
+      |     |-- Season 2
+      |-- Some Show
+      |     |-- Season 1
+
+    Example:
+        journal, report = rename_library(
+            "/mnt/tv", {"Some Show": {"series_id": "7317"},
+                        "Other Show": {"csv_path": "/home/user/other.csv"}})
+        rollback_renames(journal)
+
+    Parameters
+    ----------
+    tv_root: str
+        The folder holding one folder per show.
+    mapping: dict, optional
+        The episode list of a show folder, by folder name: a dict with
+        the `series_id`, `imdb_id` or `series` and `year` arguments of
+        `make_seriesdb()`, or a `csv_path`. A str is a `series_id`.
+        Show folders missing from it are looked up by their name, a
+        year in parentheses like "Seinfeld (1989)" is used as `year`.
+    info: str, optional
+        Any additional information about the files.
+    dry_run: bool, default False
+        Only plan the renames.
+    journal_dir: str, optional
+        The folder of the journals, one per show. Pass it to
+        `rollback_renames()` to undo the whole run. Default is a new
+        folder in ~/.cache/mediafiletools/log, or in the
+        `MEDIAFILETOOLS_LOG_DIR` environment variable.
+    max_workers: int, optional
+        The number of shows renamed at the same time.
+    rate: float, default 5.0
+        Requests per second when scraping the episode lists.
+    scan: MediaScan, optional
+        A `scan_media()` of `tv_root` or a folder above it, read
+        instead of walking the folder again.
+    profile: bool or str, optional
+        Profile the call with cProfile (True or `'cprofile'`), or with
+        the low overhead sampler (`'sample'`) for long runs. A pstats
+        dump and a collapsed stack file for flamegraphs are written to
+        ~/.cache/mediafiletools/profile. Default is the
+        `MEDIAFILETOOLS_PROFILE` environment variable.
+    metrics: str, optional
+        A node_exporter textfile collector folder. The duration of
+        every stage, the files scanned, dupes found, HTTP requests
+        and failures, rows written and the peak RSS of the call are
+        written to `mediafiletools_<function name>.prom` in it.
+        Default is the `MEDIAFILETOOLS_METRICS_DIR` environment
+        variable.
+
+    Returns
+    -------
+    tuple
+        (journal folder or None for a dry run, DataFrame with the
+        'Show', 'Season', 'Old Name', 'New Name' and 'Status' of every
+        file, and the shows that failed with an empty 'Old Name').
+
+    .. versionadded:: 2.2.0
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import pandas as pd
+
+    from .series_bulk import _fetch_episode_tables
+    from .series_details import _read_episode_csv, _warn_imdb_id
+
+    mapping = dict(mapping or {})
+    if any(isinstance(spec, dict) and spec.get('imdb_id') is not None
+           for spec in mapping.values()):
+        _warn_imdb_id()
+    info = f" - {info}" if info is not None else ""
+    shows = _scan_library(tv_root, scan)
+    specs = {name: _show_spec(name, mapping.get(name)) for name in shows}
+
+    # Scrape the episode lists of every show at once.
+    tables = {}
+    scraped = [name for name in shows if "csv_path" not in specs[name]]
+    results = _fetch_episode_tables([specs[n] for n in scraped], rate=rate)
+    for name, rows in zip(scraped, results):
+        tables[name] = rows if isinstance(rows, BaseException) else \
+            pd.DataFrame(rows, columns=["Season", "Episode Number", "Title"])
+    for name in shows:
+        if name not in tables:
+            try:
+                tables[name] = _read_episode_csv(specs[name]["csv_path"])
+            except (OSError, ValueError) as e:
+                tables[name] = e
+
+    if journal_dir is None:
+        journal_dir = os.path.join(
+            log_dir(), f"library-{time.strftime('%Y%m%d-%H%M%S')}")
+    if not dry_run:
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def _rename_show(name):
+        # Returns the report rows of one show.
+        table = tables[name]
+        if isinstance(table, BaseException):
+            return [(name, None, None, None,
+                     f"failed: {type(table).__name__} - {table}")]
+        try:
+            moves, unmatched = plan_renames(os.path.join(tv_root, name),
+                                            table, info, listing=shows[name])
+            status = "planned"
+            if not dry_run and moves:
+                journal = os.path.join(journal_dir, _journal_name(name))
+                apply_renames(moves, journal, max_workers=1)
+                status = "renamed"
+        except (OSError, ValueError) as e:
+            return [(name, None, None, None,
+                     f"failed: {type(e).__name__} - {e}")]
+        return ([(name, m[0], m[2], m[3], status) for m in moves]
+                + [(name, u[0], u[2], None, "unmatched") for u in unmatched])
+
+    with ThreadPoolExecutor(max_workers=max_workers or 4) as pool:
+        rows = [row for show_rows in pool.map(_rename_show, sorted(shows))
+                for row in show_rows]
+    report = pd.DataFrame(rows, columns=LIBRARY_COLUMNS)
+
+    counts = report["Status"].value_counts()
+    failed = report["Status"].str.startswith("failed").sum()
+    summary = (f"{counts.get('renamed', counts.get('planned', 0))} files "
+               f"{'planned' if dry_run else 'renamed'} in {len(shows)} shows, "
+               f"{counts.get('unmatched', 0)} unmatched, {failed} shows failed.")
+    print(summary)
+    if dry_run:
+        return None, report
+    log_event("library", root=tv_root, shows=len(shows),
+              renamed=int(counts.get("renamed", 0)),
+              unmatched=int(counts.get("unmatched", 0)), failed=int(failed),
+              journal=journal_dir)
+    flush_rename_log()
+    return journal_dir, report
+
+
+def _scan_library(tv_root, scan=None):
+    """
+    List the season folders of every show with one walk over the
+    tree. Returns {show folder name: {season folder: file names}}.
+    """
+    if scan is not None:
+        return {name: _scan_listing(scan, os.path.join(tv_root, name))
+                for name in scan.listdir(tv_root)[0]}
+    shows = {}
+    with os.scandir(tv_root) as it:
+        show_dirs = [e for e in it if e.is_dir()]
+    for show in show_dirs:
+        with os.scandir(show.path) as it:
+            seasons = [e.path for e in it
+                       if e.is_dir() and _SEASON_DIR_RE.match(e.name)]
+        shows[show.name] = {path: _media_files(path) for path in seasons}
+    return shows
+
+
+def _scan_listing(scan, show_folder):
+    # The `plan_renames()` listing of a show folder from a `MediaScan`.
+    return {path: scan.listdir(path, (VIDEO, SUBTITLE))[1]
+            for path in (os.path.join(show_folder, d)
+                         for d in scan.listdir(show_folder)[0]
+                         if _SEASON_DIR_RE.match(d))}
+
+
+def _show_spec(name, spec):
+    # The `make_seriesdb` arguments of a show folder.
+    if spec is None:
+        match = _SHOW_YEAR_RE.match(name)
+        if match:
+            return {"series": match.group(1), "year": match.group(2)}
+        return {"series": name}
+    if isinstance(spec, str):
+        return {"series_id": spec}
+    return dict(spec)
+
+
+def _journal_name(show_name):
+    return "".join(c if c.isalnum() or c in " -_." else "_"
+                   for c in show_name) + ".journal"
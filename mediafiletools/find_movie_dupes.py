@@ -0,0 +1,216 @@
+import os
+import re
+
+from .common import EXTENSIONS, save_to_file, normalize_ld, _print_file_loc
+from .metrics import count, stage
+from .movie_sort_to_df import _format_filename
+from .profiling import entry_point
+
+
+# Year buckets larger than this are not fuzzy matched to keep
+# the pairwise comparison bounded.
+MAX_BUCKET_SIZE = 500
+
+_YEAR_RE = re.compile(r"[(\[]?((?:19|20)\d{2})[)\]]?$")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+@entry_point
+def find_movie_dupes(dir_path, filepath=None, output_type='csv',
+                     distance=None, scan=None, profile=None,
+                     metrics=None):
+    """
+    Finds movies that exist more than once in the `dir_path` tree,
+    e.g. "Blazing Saddles 1974.avi" and a 1080p release of the same
+    film in another folder. Every file name is stripped with
+    `_format_filename()` and grouped by its normalized title and year.
+    The output file is created in the Home directory by default.
+
+    Examples:
+        find_movie_dupes("C:/Users/user/Movies")
+        find_movie_dupes("C:/Users/user/Movies", distance=0.08)
+
+    Parameters
+    ----------
+    dir_path: str
+        The root directory of the movie files.
+    filepath: str, optional
+        The directory path for the output file.
+        Default is /home/user.
+    output_type: str, default `csv`
+        Choose the resulting filetype/output. Valid types are `txt`,
+        `csv`, `console`, or any other type of
+        `save_to_file()`.
+    distance: float, optional
+        If set, titles released in the same year are also matched
+        when their levenshtein distance is at most `distance`. This
+        catches typos like "Blazing Sadles 1974".
+    scan: MediaScan, optional
+        A `scan_media()` of `dir_path` or a folder above it, read
+        instead of walking the folder again.
+
+        .. versionadded:: 2.2.0
+
+    profile: bool or str, optional
+        Profile the call with cProfile (True or `'cprofile'`), or with
+        the low overhead sampler (`'sample'`) for long runs. A pstats
+        dump and a collapsed stack file for flamegraphs are written to
+        ~/.cache/mediafiletools/profile. Default is the
+        `MEDIAFILETOOLS_PROFILE` environment variable.
+
+        .. versionadded:: 2.2.0
+
+    metrics: str, optional
+        A node_exporter textfile collector folder. The duration of
+        every stage, the files scanned, dupes found, HTTP requests
+        and failures, rows written and the peak RSS of the call are
+        written to `mediafiletools_<function name>.prom` in it.
+        Default is the `MEDIAFILETOOLS_METRICS_DIR` environment
+        variable.
+
+        .. versionadded:: 2.2.0
+    """
+    if filepath is None:
+        filepath = os.path.expanduser('~')
+
+    groups = _group_movies(get_movies(dir_path, scan=scan), distance=distance)
+    count("dupes_found", sum(len(grp) for grp in groups))
+    _create_dataframe(groups, filepath=filepath, output_type=output_type)
+
+
+@stage("scan")
+def get_movies(dir_path, scan=None):
+    """
+    Finds every movie file in the `dir_path` tree.
+
+    Parameters
+    ----------
+    dir_path: str
+        The root directory of the movie files.
+    scan: MediaScan, optional
+        Read the folders from this scan instead of the disk.
+
+        .. versionadded:: 2.2.0
+
+    Returns
+    -------
+    list of tuple
+        (stripped name, file path, size in bytes) of every movie.
+    """
+    movies = []
+    walk = os.walk if scan is None else scan.walk
+    for root, dirs, files in walk(dir_path):
+        dirs.sort()
+        for f in sorted(files):
+            if f.lower().endswith(EXTENSIONS):
+                path = os.path.join(root, f)
+                movies.append((_format_filename(f, strip_all=True),
+                               path,
+                               os.path.getsize(path)))
+    count("files_scanned", len(movies))
+    return movies
+
+
+def _movie_key(name):
+    # Normalize a stripped movie name into a (title, year) key.
+    # Movies without a year get None as the year.
+    name = name.strip()
+    year = None
+    match = _YEAR_RE.search(name)
+    if match:
+        year = match.group(1)
+        name = name[:match.start()]
+    title = _NON_ALNUM_RE.sub(" ", name.lower()).strip()
+    return title, year
+
+
+@stage("match")
+def _group_movies(movies, distance=None):
+    """
+    Groups the movies by their (title, year) key with a single pass
+    over a dict. If `distance` is set, the groups inside each year
+    bucket are merged when their titles are close enough.
+    """
+    groups = {}
+    for movie in movies:
+        groups.setdefault(_movie_key(movie[0]), []).append(movie)
+
+    if distance:
+        buckets = {}
+        for title, year in groups:
+            buckets.setdefault(year, []).append(title)
+        for year, titles in buckets.items():
+            if len(titles) > MAX_BUCKET_SIZE:
+                continue
+            _merge_similar(groups, year, sorted(titles), distance)
+
+    return [grp for grp in groups.values() if len(grp) >= 2]
+
+
+def _merge_similar(groups, year, titles, distance):
+    # Merge the groups of titles within `distance` of each other
+    # into the group of the first title.
+    merged = set()
+    for i, title in enumerate(titles):
+        if title in merged:
+            continue
+        for other in titles[i + 1:]:
+            if other in merged:
+                continue
+            # The distance can't be smaller than the length difference.
+            total = len(title) + len(other)
+            if not total or abs(len(title) - len(other)) / total > distance:
+                continue
+            if normalize_ld(title, other) <= distance:
+                groups[(title, year)].extend(groups.pop((other, year)))
+                merged.add(other)
+
+
+def _create_dataframe(data, filepath=None, output_type=None):
+    """
+    Creates a dataframe out of all the groups of duplicate movies.
+
+    Parameters
+    ----------
+    data: list of list
+        A list of every group of duplicate movies.
+    filepath: str, optional
+        The directory path for the output file.
+        Default is /home/user.
+    output_type: str, default `csv`
+        Choose the resulting filetype/output. Valid types are
+        `txt`, `csv`, `console`, or any other type of
+        `save_to_file()`.
+    """
+    import pandas as pd
+
+    rows = []
+    for grp in sorted(data, key=lambda g: g[0][0].casefold()):
+        rows.append(("", "", "", ""))
+        first = True
+        for name, path, size in sorted(grp, key=lambda m: -m[2]):
+            movie = name if first else ""
+            rows.append((movie, os.path.basename(path), _format_size(size),
+                         os.path.dirname(path)))
+            first = False
+
+    f_name = "Movie Dupes"
+    # Output file location to console.
+    _print_file_loc(output_type, filepath, f_name)
+
+    save_to_file(
+        pd.DataFrame(rows, columns=["Movie", "Release", "Size",
+                                    "File Location"]),
+        filepath=filepath,
+        output_type=output_type,
+        fname=f_name,
+    )
+
+
+def _format_size(size):
+    # Human readable file size.
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
@@ -1,12 +1,15 @@
 import os
 
-import pandas as pd
-from tinytag import TinyTag
-from .common import MUSIC_FORMAT, save_to_file, normalize_ld, _print_file_loc
+from .common import (AUDIO, MUSIC_FORMAT, save_to_file, normalize_ld,
+                     _print_file_loc)
+from .metrics import count, stage
+from .profiling import entry_point
 
 
 class Song:
     def __init__(self, song_path):
+        from tinytag import TinyTag
+
         self.tag = TinyTag.get(song_path)
         self.format = os.path.splitext(song_path)[1][1:]
         self.matched = False
@@ -19,7 +22,8 @@ class Song:
         return os.path.basename(self.tag._filename)
 
 
-def get_songs(dir_path, music_list=None):
+@stage("scan")
+def get_songs(dir_path, music_list=None, scan=None):
     """
     Recursively finds every audio file in the `dir_path` tree
     and sorts them into a list.
@@ -32,13 +36,27 @@ def get_songs(dir_path, music_list=None):
         The root directory of the audio files.
     music_list: list, default None
         A list containing the sorted audio titles.
+    scan: MediaScan, optional
+        Read the folders from this scan instead of the disk.
+
+        .. versionadded:: 2.2.0
         """
     if music_list is None:
         music_list = []
+    if scan is not None:
+        for item_path in scan.files(AUDIO, dir_path):
+            count("files_scanned")
+            try:
+                music_list.append(Song(item_path))
+            except Exception as e:
+                print(f"{type(e).__name__} - {e} --> "
+                      f"{os.path.basename(item_path)}")
+        return music_list
     files_and_dirs = os.listdir(dir_path)
     for item in files_and_dirs:
         item_path = os.path.join(dir_path, item)
         if os.path.isfile(item_path) and item.lower().endswith(MUSIC_FORMAT):
+            count("files_scanned")
             try:
                 music_list.append(Song(item_path))
             except Exception as e:
@@ -57,8 +75,10 @@ FORMAT_POINTS = 2
 THRESHOLD = 16
 
 
+@entry_point
 def find_music_dupes(dir_path, filter=None, filepath=None,
-                     output_type='csv', distance=None):
+                     output_type='csv', distance=None, scan=None,
+                     profile=None, metrics=None):
     """
     Compares every file in the list returned from `get_songs()`
     and finds duplicate audio files. Matches are calculated by
@@ -85,19 +105,59 @@ def find_music_dupes(dir_path, filter=None, filepath=None,
         Default is /home/user.
     output_type: str, default `csv`
         Choose the resulting filetype/output. Valid types are `txt`,
-        `csv`, `console`.
+        `csv`, `console`, or any other type of
+        `save_to_file()`.
     distance: float, optional
         The strictness of the levenshtein function to find matches
         in song or artist names. A higher distance allows more leeway
         for differences in spelling and grammar and would match more files.
+    scan: MediaScan, optional
+        A `scan_media()` of `dir_path` or a folder above it, read
+        instead of walking the folder again.
+
+        .. versionadded:: 2.2.0
+
+    profile: bool or str, optional
+        Profile the call with cProfile (True or `'cprofile'`), or with
+        the low overhead sampler (`'sample'`) for long runs. A pstats
+        dump and a collapsed stack file for flamegraphs are written to
+        ~/.cache/mediafiletools/profile. Default is the
+        `MEDIAFILETOOLS_PROFILE` environment variable.
+
+        .. versionadded:: 2.2.0
+
+    metrics: str, optional
+        A node_exporter textfile collector folder. The duration of
+        every stage, the files scanned, dupes found, HTTP requests
+        and failures, rows written and the peak RSS of the call are
+        written to `mediafiletools_<function name>.prom` in it.
+        Default is the `MEDIAFILETOOLS_METRICS_DIR` environment
+        variable.
+
+        .. versionadded:: 2.2.0
     """
     if filepath is None:
         filepath = os.path.expanduser('~')
     if distance is None:
         distance = 0.08
 
+    matched_songs = _match_songs(get_songs(dir_path, scan=scan),
+                                 distance=distance)
+    count("dupes_found", sum(len(group) for group in matched_songs))
+
+    _create_dataframe(matched_songs,
+                      filter,
+                      filepath=filepath,
+                      output_type=output_type)
+
+
+@stage("match")
+def _match_songs(music_list, distance=None):
+    """
+    Compares every song in `music_list` with `_calculate_score()`
+    and returns a list of every group of matched songs.
+    """
     matched = False
-    music_list = get_songs(dir_path)
     matched_songs = []
     group = []
 
@@ -124,11 +184,7 @@ def find_music_dupes(dir_path, filter=None, filepath=None,
             matched_songs.append(group)
         matched = False
         group = []
-
-    _create_dataframe(matched_songs,
-                      filter,
-                      filepath=filepath,
-                      output_type=output_type)
+    return matched_songs
 
 
 def _calculate_score(cur_song, nxt_song, distance=None):
@@ -226,8 +282,11 @@ def _create_dataframe(data, filter=None, filepath=None, output_type=None):
         Default is /home/user.
     output_type: str, default `csv`
         Choose the resulting filetype/output. Valid types are
-        `txt`, `csv`, `console`.
+        `txt`, `csv`, `console`, or any other type of
+        `save_to_file()`.
         """
+    import pandas as pd
+
     rows = []
     # Show all matches.
     if filter is None:
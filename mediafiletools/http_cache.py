@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'mediafiletools', 'http')
+# One week.
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# The cache used by `make_seriesdb()` and `rename_episodes()`,
+# set with `set_http_cache()`.
+_cache = None
+
+
+class ResponseCache:
+    """
+    On-disk cache of HTTP responses keyed by URL.
+
+    A response younger than `ttl` is served without a request. Older
+    ones are revalidated with a conditional request (`If-None-Match` /
+    `If-Modified-Since`), so an unchanged page costs a 304 instead of
+    a download. The least recently used entries are evicted when the
+    cache grows past `max_size` bytes.
+
+    Example:
+        set_http_cache(ResponseCache(ttl=24 * 60 * 60))
+        make_seriesdb(series_id='1400')
+
+    Parameters
+    ----------
+    cache_dir: str, optional
+        The cache directory. Default is ~/.cache/mediafiletools/http.
+    ttl: float, default one week
+        Seconds a response is served without revalidating it.
+    max_size: int, default 256 MB
+        The maximum size of the cache directory in bytes.
+    offline: bool, default False
+        Only serve from the cache and never make a request, even
+        for expired entries. Missing pages raise a ValueError.
+    """
+    def __init__(self, cache_dir=None, ttl=DEFAULT_TTL,
+                 max_size=DEFAULT_MAX_SIZE, offline=False):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def fetch(self, session, url):
+        """
+        GET `url` through the cache with `session`.
+
+        Returns
+        -------
+        tuple
+            (status code, reason, body text)
+        """
+        entry = self._load(url)
+        if entry is not None and (
+                self.offline or time.time() - entry["stored"] < self.ttl):
+            self._touch(url)
+            return 200, "OK", entry["body"]
+        if self.offline:
+            raise ValueError(f"{url} is not in the cache and offline "
+                             f"mode is on.")
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = session.get(url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            entry["stored"] = time.time()
+            self._store(url, entry)
+            return 200, "OK", entry["body"]
+        if response.status_code == 200:
+            self._store(url, {
+                "url": url,
+                "stored": time.time(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "body": response.text,
+            })
+        return response.status_code, response.reason, response.text
+
+    def clear(self):
+        # Delete every cached response.
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".json"):
+                    os.remove(entry.path)
+            self._size = 0
+
+    def _path(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".json")
+
+    def _load(self, url):
+        try:
+            with open(self._path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Guard against hash collisions.
+        return entry if entry.get("url") == url else None
+
+    def _touch(self, url):
+        # The modification time orders the entries for LRU eviction.
+        try:
+            os.utime(self._path(url))
+        except OSError:
+            pass
+
+    def _store(self, url, entry):
+        path = self._path(url)
+        data = json.dumps(entry).encode("utf-8")
+        with self._lock:
+            size = self._current_size()
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            # Write to a temporary file first so readers never see
+            # a partial entry.
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self._size = size + len(data)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _current_size(self):
+        # Total size of the entries, measured once then kept up to date.
+        if self._size is None:
+            self._size = sum(e.stat().st_size for e in os.scandir(self.cache_dir)
+                             if e.name.endswith(".json"))
+        return self._size
+
+    def _evict(self):
+        # Delete the least recently used entries until the cache
+        # fits in `max_size`.
+        entries = sorted((e for e in os.scandir(self.cache_dir)
+                          if e.name.endswith(".json")),
+                         key=lambda e: e.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self.max_size:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+
+
+def set_http_cache(cache):
+    """
+    Set the `ResponseCache` used for every page fetched by
+    `make_seriesdb()` and `rename_episodes()`. Pass None to
+    turn caching off.
+    """
+    global _cache
+    _cache = cache
+
+
+def get_http_cache():
+    return _cache
@@ -0,0 +1,188 @@
+import functools
+import os
+import sys
+import threading
+import time
+import warnings
+
+
+# The counters of a run, with their HELP text.
+COUNTERS = {
+    "files_scanned": "Media files found while scanning the folders.",
+    "dupes_found": "Files in a group of duplicates.",
+    "http_requests": "HTTP requests made, including cached responses.",
+    "http_failures": "HTTP requests that failed or didn't return 200.",
+    "rows_written": "Rows written to the output file or console.",
+}
+
+# The run of the outermost entry point, None when metrics are off.
+# Shared by every thread, so the workers of a run count too.
+_run = None
+_lock = threading.Lock()
+
+
+class Run:
+    """
+    The counters and stage durations of one call of an entry point,
+    written with `write_metrics()` when it returns.
+    """
+    def __init__(self, entry, directory):
+        self.entry = entry
+        self.directory = directory
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        # Seconds spent in every stage.
+        self.stages = {}
+        self.start = time.perf_counter()
+        self.started = time.time()
+        self._lock = threading.Lock()
+        # Stages in progress, by name: (depth, start time).
+        self._open = {}
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def enter(self, name):
+        with self._lock:
+            depth, start = self._open.get(name, (0, time.perf_counter()))
+            self._open[name] = (depth + 1, start)
+
+    def exit(self, name):
+        # A stage entered again while it's running, by a recursive call
+        # or another thread, is timed once.
+        with self._lock:
+            depth, start = self._open.pop(name)
+            if depth > 1:
+                self._open[name] = (depth - 1, start)
+            else:
+                self.stages[name] = self.stages.get(name, 0.0) + \
+                    time.perf_counter() - start
+
+
+def count(name, n=1):
+    # Add `n` to a counter of the current run, if there is one.
+    run = _run
+    if run is not None:
+        run.count(name, n)
+
+
+def counted(name, rows):
+    # Count the rows of an iterable as they're consumed.
+    if _run is None:
+        return rows
+    return _counted(name, rows)
+
+
+def _counted(name, rows):
+    for row in rows:
+        count(name)
+        yield row
+
+
+def stage(name):
+    """
+    Decorator adding the time spent in a function to the `name`
+    stage of the current run.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = _run
+            if run is None:
+                return func(*args, **kwargs)
+            run.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                run.exit(name)
+        return wrapper
+    return decorator
+
+
+def start(entry, directory=None):
+    """
+    Start the run of an entry point if `directory` or the
+    `MEDIAFILETOOLS_METRICS_DIR` environment variable is set. Returns
+    None if metrics are off or a run is already going on, a nested
+    entry point counts towards the outer one.
+    """
+    global _run
+    directory = directory or os.environ.get("MEDIAFILETOOLS_METRICS_DIR")
+    if not directory:
+        return None
+    with _lock:
+        if _run is not None:
+            return None
+        _run = Run(entry, directory)
+        return _run
+
+
+def finish(run, success):
+    # A metrics folder that can't be written doesn't fail the run.
+    global _run
+    with _lock:
+        _run = None
+    try:
+        write_metrics(run, success)
+    except OSError as e:
+        # Called by the wrapper of `entry_point()`, the warning
+        # points at the caller of the entry point.
+        warnings.warn(f"The metrics of {run.entry} couldn't be written: "
+                      f"{e}", stacklevel=3)
+
+
+def peak_rss():
+    # The peak resident set size of the process in bytes, None on
+    # Windows.
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB everywhere else.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def write_metrics(run, success):
+    """
+    Write the run to `mediafiletools_<entry>.prom` in its directory,
+    in the text format of the node_exporter textfile collector. The
+    file is written next to it first and renamed, so the collector
+    never reads a partial file.
+    """
+    labels = f'entry="{run.entry}"'
+    metrics = [
+        ("duration_seconds", "Wall time of the run.",
+         [(labels, f"{time.perf_counter() - run.start:.6f}")]),
+        ("stage_duration_seconds", "Wall time of every stage of the run.",
+         [(f'{labels},stage="{name}"', f"{seconds:.6f}")
+          for name, seconds in sorted(run.stages.items())]),
+    ]
+    metrics.extend((name, help_text, [(labels, str(run.counters[name]))])
+                   for name, help_text in COUNTERS.items())
+    rss = peak_rss()
+    if rss is not None:
+        metrics.append(("peak_rss_bytes",
+                        "Peak resident set size of the process.",
+                        [(labels, str(rss))]))
+    metrics.append(("success", "1 if the run finished without an error.",
+                    [(labels, "1" if success else "0")]))
+    metrics.append(("last_run_timestamp_seconds",
+                    "Unix time the run started.",
+                    [(labels, f"{run.started:.3f}")]))
+
+    lines = []
+    for name, help_text, samples in metrics:
+        lines.append(f"# HELP mediafiletools_{name} {help_text}")
+        lines.append(f"# TYPE mediafiletools_{name} gauge")
+        lines.extend(f"mediafiletools_{name}{{{sample_labels}}} {value}"
+                     for sample_labels, value in samples)
+
+    os.makedirs(run.directory, exist_ok=True)
+    path = os.path.join(run.directory, f"mediafiletools_{run.entry}.prom")
+    # The collector skips files not ending in .prom.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+    return path
@@ -2,12 +2,20 @@ import os
 import re
 from string import ascii_uppercase
 
-import pandas as pd
-from .common import save_to_file, EXTENSIONS, _print_file_loc
+from .common import save_to_file, EXTENSIONS, VIDEO, _print_file_loc
+from .metrics import count, stage
+from .profiling import entry_point
+from .video_probe import probe_videos, format_probe
 
+# Extra columns added to the movie database by `probe=True`.
+PROBE_COLUMNS = ["Duration", "Resolution", "Codec"]
 
+
+@entry_point
 def make_moviedb(dir_path, filepath=None, sort_type="abc",
-                 output_type="csv", strip=False):
+                 output_type="csv", strip=False, probe=False,
+                 max_workers=None, search_index=False, scan=None,
+                 profile=None, metrics=None):
     """
     Create movie database from every movie file in the directory.
 
@@ -36,36 +44,106 @@ def make_moviedb(dir_path, filepath=None, sort_type="abc",
         produces a dataframe of movies organized by folder.
     output_type: str, default `csv`
         Choose the resulting filetype/output. Valid types are `txt`,
-        `csv`, `console`.
+        `csv`, `console`, or any other type of
+        `save_to_file()`.
     strip: bool, default False
         Call `_format_filename()` with the `strip_all` kwarg
         to remove extraneous details from the file names.
+    probe: bool, default False
+        Read the container header of every movie file with
+        `probe_video()` and add `Duration`, `Resolution` and
+        `Codec` columns to the output.
+
+        .. versionadded:: 2.2.0
+
+    max_workers: int, optional
+        The size of the worker pool used when `probe` is True.
+
+        .. versionadded:: 2.2.0
+
+    search_index: bool, default False
+        Also save a `MovieIndex` of the titles next to the output
+        file, e.g. `Movie Database A - Z.index.json`.
+
+        .. versionadded:: 2.2.0
+
+    scan: MediaScan, optional
+        A `scan_media()` of `dir_path` or a folder above it, read
+        instead of walking the folder again.
+
+        .. versionadded:: 2.2.0
+
+    profile: bool or str, optional
+        Profile the call with cProfile (True or `'cprofile'`), or with
+        the low overhead sampler (`'sample'`) for long runs. A pstats
+        dump and a collapsed stack file for flamegraphs are written to
+        ~/.cache/mediafiletools/profile. Default is the
+        `MEDIAFILETOOLS_PROFILE` environment variable.
+
+        .. versionadded:: 2.2.0
+
+    metrics: str, optional
+        A node_exporter textfile collector folder. The duration of
+        every stage, the files scanned, dupes found, HTTP requests
+        and failures, rows written and the peak RSS of the call are
+        written to `mediafiletools_<function name>.prom` in it.
+        Default is the `MEDIAFILETOOLS_METRICS_DIR` environment
+        variable.
+
+        .. versionadded:: 2.2.0
     """
     if filepath is None:
         filepath = os.path.expanduser('~')
     sorted_movies = []
+    # Full paths of the movie files, only collected when probing.
+    movie_paths = [] if probe else None
+    walk = os.walk if scan is None else scan.walk
 
     if sort_type == "abc":
-        for root, dirs, files in os.walk(dir_path):
-            sorted_movies.extend(recursive_sort(root, strip=strip))
+        for root, dirs, files in walk(dir_path):
+            sorted_movies.extend(recursive_sort(root, strip=strip,
+                                                path_list=movie_paths,
+                                                scan=scan))
             del dirs[:]
-        _create_abc_df(sorted_movies, filepath=filepath, output_type=output_type)
+        details = None
+        if probe:
+            details = _probe_details(sorted_movies, movie_paths, max_workers)
+        if search_index:
+            _save_index(sorted_movies, filepath, "Movie Database A - Z")
+        _create_abc_df(sorted_movies, filepath=filepath,
+                       output_type=output_type, details=details)
 
     elif sort_type == "folder":
         uncategorized = []
-        for root, dirs, files in os.walk(dir_path):
+        movie_names = []
+        for root, dirs, files in walk(dir_path):
             if root == dir_path:
                 # All movie files in root folder get appended
                 # to `movie_list` without sorting.
+                videos = []
                 for i in range(len(files)):
+                    # Only the video files are probed and counted,
+                    # like in `recursive_sort()`.
+                    is_video = files[i].lower().endswith(EXTENSIONS)
+                    if probe and is_video:
+                        movie_paths.append(os.path.join(root, files[i]))
                     files[i] = _format_filename(files[i], strip_all=strip)
+                    if is_video:
+                        videos.append(files[i])
                 uncategorized = ("Uncategorized", files)
+                count("files_scanned", len(videos))
+                if probe:
+                    movie_names.extend(videos)
             else:
                 # Send each movie folder to `recursive_sort()` to be
                 # put in their own separate list.
                 sorted_movies.append(
-                    (os.path.basename(root), recursive_sort(root, strip=strip))
+                    (os.path.basename(root),
+                     recursive_sort(root, strip=strip, path_list=movie_paths,
+                                    scan=scan))
                 )
+                if probe:
+                    movie_names.extend(sorted_movies[-1][1])
                 del dirs[:]
         # Sort list of tuples ignoring case and append the
         # `Uncategorized` list at the end.
@@ -80,7 +158,14 @@ def make_moviedb(dir_path, filepath=None, sort_type="abc",
                 sorted_movies[-1][1].extend(sorted_movies[i][1])
         # Filter out the single movie folders from the final list.
         final_list = [i for i in sorted_movies if len(i[1]) >= 2]
-        _create_folder_df(final_list, filepath=filepath, output_type=output_type)
+        details = None
+        if probe:
+            details = _probe_details(movie_names, movie_paths, max_workers)
+        if search_index:
+            _save_index([m for _, movies in final_list for m in movies],
+                        filepath, "Movie Database")
+        _create_folder_df(final_list, filepath=filepath,
+                          output_type=output_type, details=details)
 
     else:
         raise ValueError(
@@ -89,7 +174,9 @@ def make_moviedb(dir_path, filepath=None, sort_type="abc",
         )
 
 
-def recursive_sort(dir_path, movie_list=None, strip=False):
+@stage("scan")
+def recursive_sort(dir_path, movie_list=None, strip=False, path_list=None,
+                   scan=None):
     """
     Recursively sorts every file in the `dir_path` tree.
 
@@ -102,20 +189,68 @@ def recursive_sort(dir_path, movie_list=None, strip=False):
     strip: bool, default False
         Call `_format_filename` with the `strip_all` kwarg
         to remove extraneous details from the file names.
+    path_list: list, optional
+        If passed, the full path of every movie file is appended
+        to it in the same order as `movie_list`.
+    scan: MediaScan, optional
+        Read the folders from this scan instead of the disk.
+
+        .. versionadded:: 2.2.0
     """
     if movie_list is None:
         movie_list = []
+    if scan is not None:
+        # Same order as below: the sub folders, then the movies.
+        dirs, movies = scan.listdir(dir_path, VIDEO)
+        for d in dirs:
+            recursive_sort(os.path.join(dir_path, d), movie_list,
+                           strip=strip, path_list=path_list, scan=scan)
+        count("files_scanned", len(movies))
+        for item in movies:
+            movie_list.append(_format_filename(item, strip_all=strip))
+            if path_list is not None:
+                path_list.append(os.path.join(dir_path, item))
+        return movie_list
     files_and_dirs = os.listdir(dir_path)
     files_and_dirs.sort(key=lambda x: (not os.path.isdir(os.path.join(dir_path, x)), x))
     for item in files_and_dirs:
         item_path = os.path.join(dir_path, item)
         if os.path.isfile(item_path) and item.lower().endswith(EXTENSIONS):
+            count("files_scanned")
             movie_list.append(_format_filename(item, strip_all=strip))
+            if path_list is not None:
+                path_list.append(item_path)
         elif os.path.isdir(item_path):
-            recursive_sort(item_path, movie_list, strip=strip)
+            recursive_sort(item_path, movie_list, strip=strip,
+                           path_list=path_list)
     return movie_list
 
 
+def _save_index(names, filepath, f_name):
+    # Save the search index of the titles next to the output file.
+    from .search_index import MovieIndex, index_path
+
+    MovieIndex(names).save(index_path(filepath, f_name))
+
+
+@stage("probe")
+def _probe_details(names, paths, max_workers=None):
+    # Probe every movie file and map each formatted movie name to a
+    # list of (duration, resolution, codec) tuples. Files that share
+    # a name keep one entry each.
+    details = {}
+    for name, info in zip(names, probe_videos(paths, max_workers=max_workers)):
+        details.setdefault(name, []).append(format_probe(info))
+    return details
+
+
+def _pop_details(details, name):
+    # Take the next probe result for `name`, empty if none is left.
+    if details.get(name):
+        return details[name].pop(0)
+    return "", "", ""
+
+
 def _format_filename(filename, strip_all=False):
     """
     Helper function to clean up filenames.
@@ -143,7 +278,7 @@ def _format_filename(filename, strip_all=False):
     return filename
 
 
-def _create_abc_df(data, filepath=None, output_type=None):
+def _create_abc_df(data, filepath=None, output_type=None, details=None):
     """
     Creates a dataframe for an `abc` sort.
 
@@ -156,35 +291,48 @@ def _create_abc_df(data, filepath=None, output_type=None):
         Default is /home/user.
     output_type: str, default `csv`
         Choose the resulting filetype/output. Valid types are `txt`,
-        `csv`, `console`.
+        `csv`, `console`, or any other type of
+        `save_to_file()`.
+    details: dict, optional
+        Probe results from `_probe_details()`. Adds the `Duration`,
+        `Resolution` and `Codec` columns.
     """
+    import pandas as pd
+
     rows = []
+    columns = ["A - Z", "Movie"]
+    blank = ("", "")
+    if details is not None:
+        columns += PROBE_COLUMNS
+        blank += ("", "", "")
     alphanum = list(map(str, range(1, 10))) + list(ascii_uppercase)
     for char in alphanum:
         first = True
         for m in sorted(data):
             if m.startswith(char):
                 data.remove(m)
+                extra = () if details is None else _pop_details(details, m)
                 if first:
-                    rows.append(("", ""))
-                    rows.append((char, m))
+                    rows.append(blank)
+                    rows.append((char, m) + extra)
                     first = False
                 else:
-                    rows.append(("", m))
+                    rows.append(("", m) + extra)
 
     f_name = "Movie Database A - Z"
     # Output file location to console.
     _print_file_loc(output_type, filepath, f_name)
 
     save_to_file(
-        pd.DataFrame(rows, columns=["A - Z", "Movie"]),
+        pd.DataFrame(rows, columns=columns),
         filepath=filepath,
         output_type=output_type,
         fname=f_name,
     )
 
 
-def _create_folder_df(data, filepath=None, output_type=None, strip=False):
+def _create_folder_df(data, filepath=None, output_type=None, strip=False,
+                      details=None):
     """
     Creates a dataframe for a `folder` sort.
 
@@ -197,29 +345,41 @@ def _create_folder_df(data, filepath=None, output_type=None, strip=False):
         Default is /home/user.
     output_type: str, default `scv`
         Choose the resulting filetype/output. Valid types are `txt`,
-        `csv`, `console`.
+        `csv`, `console`, or any other type of
+        `save_to_file()`.
     strip: bool, default False
         Call `_format_filename` with the `strip_all` kwarg
         to removes extraneous details from the file names.
+    details: dict, optional
+        Probe results from `_probe_details()`. Adds the `Duration`,
+        `Resolution` and `Codec` columns.
     """
+    import pandas as pd
+
     rows = []
+    columns = ["Series", "Movie"]
+    blank = ("", "")
+    if details is not None:
+        columns += PROBE_COLUMNS
+        blank += ("", "", "")
     for series, movies in data:
         series = _format_filename(series, strip_all=strip)
         first = True
         for m in sorted(movies, key=str.casefold):
+            extra = () if details is None else _pop_details(details, m)
             if first:
-                rows.append(("", ""))
-                rows.append((series, m))
+                rows.append(blank)
+                rows.append((series, m) + extra)
                 first = False
             else:
-                rows.append(("", m))
+                rows.append(("", m) + extra)
 
     f_name = "Movie Database"
     # Output file location to console.
     _print_file_loc(output_type, filepath, f_name)
 
     save_to_file(
-        pd.DataFrame(rows, columns=["Series", "Movie"]),
+        pd.DataFrame(rows, columns=columns),
         filepath=filepath,
         output_type=output_type,
         fname=f_name,
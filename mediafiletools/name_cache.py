@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'mediafiletools', 'series_names.json')
+# 30 days.
+DEFAULT_TTL = 30 * 24 * 60 * 60
+# Failed searches are retried sooner, new shows get added to TMDB.
+DEFAULT_FAILED_TTL = 24 * 60 * 60
+
+# The cache used to resolve the `series` names of `make_seriesdb()`,
+# set with `set_name_cache()`.
+_cache = None
+
+
+class SeriesLookupError(ValueError):
+    # Raised when a series name has no single match on TMDB.
+    def __init__(self, message, matches=()):
+        super().__init__(message)
+        self.matches = [tuple(m) for m in matches]
+
+
+class NameCache:
+    """
+    Persistent cache of the TMDB show each series name and year
+    resolves to, so `make_seriesdb(series=...)` skips the search
+    request for names it has seen before. Searches with several
+    matching shows or none are also remembered, for `failed_ttl`
+    seconds, and raise the same error again without a request.
+
+    Example:
+        set_name_cache(NameCache())
+        make_seriesdb(series='Seinfeld', year='1989')
+
+    Parameters
+    ----------
+    path: str, optional
+        The cache file. Default is
+        ~/.cache/mediafiletools/series_names.json.
+    ttl: float, default 30 days
+        Seconds a resolved name is kept.
+    failed_ttl: float, default one day
+        Seconds a failed search is kept.
+    """
+    def __init__(self, path=None, ttl=DEFAULT_TTL,
+                 failed_ttl=DEFAULT_FAILED_TTL):
+        self.path = path or DEFAULT_CACHE_FILE
+        self.ttl = ttl
+        self.failed_ttl = failed_ttl
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def get(self, series_name, year=None):
+        """
+        The cached href of the show, e.g. "/tv/1400", or None if the
+        name isn't cached. A cached failed search raises its
+        `SeriesLookupError`.
+        """
+        entry = self._load().get(name_key(series_name, year))
+        if entry is None:
+            return None
+        if entry.get("href") is not None:
+            if time.time() - entry["stored"] < self.ttl:
+                return entry["href"]
+        elif time.time() - entry["stored"] < self.failed_ttl:
+            raise SeriesLookupError(entry["error"], entry["matches"])
+        return None
+
+    def set(self, series_name, year, href):
+        self._update(name_key(series_name, year),
+                     {"href": href, "stored": time.time()})
+
+    def set_failed(self, series_name, year, error):
+        # Remember a `SeriesLookupError` of a search.
+        self._update(name_key(series_name, year),
+                     {"error": str(error), "matches": error.matches,
+                      "stored": time.time()})
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def _load(self):
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    try:
+                        with open(self.path, encoding="utf-8") as f:
+                            self._entries = json.load(f)
+                    except (OSError, ValueError):
+                        self._entries = {}
+        return self._entries
+
+    def _update(self, key, entry):
+        self._load()
+        with self._lock:
+            self._entries[key] = entry
+            self._save()
+
+    def _save(self):
+        # Write to a temporary file first so readers never see
+        # a partial cache.
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                    exist_ok=True)
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+
+def name_key(series_name, year=None):
+    # Case and whitespace don't change the search results.
+    name = " ".join(series_name.casefold().split())
+    return f"{name}|{year or ''}"
+
+
+def set_name_cache(cache):
+    """
+    Set the `NameCache` used to resolve series names. Pass None
+    to turn caching off.
+    """
+    global _cache
+    _cache = cache
+
+
+def get_name_cache():
+    return _cache
@@ -0,0 +1,257 @@
+import cProfile
+import functools
+import inspect
+import marshal
+import os
+import signal
+import threading
+import time
+import warnings
+
+from . import metrics
+
+
+# The folder of the profiles written with `profile=`.
+DEFAULT_PROFILE_DIR = os.environ.get("MEDIAFILETOOLS_PROFILE_DIR") or \
+    os.path.join(os.path.expanduser('~'), '.cache', 'mediafiletools',
+                 'profile')
+# Seconds of CPU time between two samples of the `sample` mode.
+SAMPLE_INTERVAL = 0.005
+# Stacks of the collapsed file are cut below this depth.
+_MAX_DEPTH = 200
+
+# The frames `entry_point()` adds between an entry point and its
+# caller, warnings raised for the caller have to skip them.
+WRAPPER_FRAMES = 2
+
+# Only the outermost entry point is profiled, e.g. `make_seriesdb()`
+# in `rename_episodes()` is part of the `rename_episodes()` profile.
+_active = False
+_lock = threading.Lock()
+
+
+def entry_point(func):
+    """
+    Profile `func` when it's called with `profile=True`, `'cprofile'`
+    or `'sample'`, or when the `MEDIAFILETOOLS_PROFILE` environment
+    variable is set to one of them. A pstats dump and a collapsed stack
+    file for flamegraph.pl or speedscope are written to
+    ~/.cache/mediafiletools/profile, or to `MEDIAFILETOOLS_PROFILE_DIR`.
+
+    With `metrics=` or `MEDIAFILETOOLS_METRICS_DIR`, the stages and
+    counters of the call are written to a Prometheus textfile, see
+    `metrics.write_metrics()`.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        arguments = signature.bind_partial(*args, **kwargs).arguments
+        run = metrics.start(func.__name__, arguments.get("metrics"))
+        success = False
+        try:
+            result = _profile(func, args, kwargs,
+                              _profile_mode(arguments.get("profile")))
+            success = True
+            return result
+        finally:
+            if run is not None:
+                metrics.finish(run, success)
+
+    return wrapper
+
+
+def _profile(func, args, kwargs, mode):
+    global _active
+    if mode is None:
+        return func(*args, **kwargs)
+    with _lock:
+        nested, _active = _active, True
+    if nested:
+        return func(*args, **kwargs)
+    try:
+        profiler = _profiler(mode)
+        profiler.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            _write_profile(profiler, func.__name__)
+    finally:
+        _active = False
+
+
+def _profile_mode(mode):
+    # "cprofile", "sample" or None, the argument wins over the
+    # environment variable.
+    if mode is None:
+        mode = os.environ.get("MEDIAFILETOOLS_PROFILE") or None
+        if mode in ("0", "false"):
+            mode = None
+    if mode in (True, "1", "true"):
+        return "cprofile"
+    if mode in (None, False):
+        return None
+    if mode not in ("cprofile", "sample"):
+        raise ValueError(f"Invalid profile: {mode!r}. Use True, 'cprofile' "
+                         f"or 'sample'.")
+    return mode
+
+
+def _profiler(mode):
+    if mode == "sample":
+        if not hasattr(signal, "setitimer"):
+            warnings.warn("Sampling needs signal.setitimer, which this "
+                          "platform doesn't have. Using cProfile instead.",
+                          stacklevel=2 + WRAPPER_FRAMES)
+        elif threading.current_thread() is not threading.main_thread():
+            warnings.warn("Sampling only works in the main thread. Using "
+                          "cProfile instead.",
+                          stacklevel=2 + WRAPPER_FRAMES)
+        else:
+            return _SamplingProfiler()
+    return _TracingProfiler()
+
+
+class _TracingProfiler:
+    # cProfile, every call is recorded.
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def stats(self):
+        self._profile.create_stats()
+        return self._profile.stats
+
+    def stacks(self):
+        return _collapse(self.stats())
+
+
+class _SamplingProfiler:
+    """
+    Records the stack of the main thread every `SAMPLE_INTERVAL`
+    seconds of CPU time with a SIGPROF timer. Nothing is done between
+    two samples, so long runs aren't slowed down like with cProfile.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        # Number of samples of every stack, root first.
+        self.samples = {}
+        self._root = None
+        self._previous = None
+
+    def start(self):
+        # Frames above the entry point aren't part of the profile.
+        self._root = inspect.currentframe().f_back
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous)
+        self._root = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None and frame is not self._root:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno,
+                          code.co_name))
+            frame = frame.f_back
+        if stack:
+            stack = tuple(reversed(stack))
+            self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def stats(self):
+        # The samples in the pstats format, a sample counts as a call
+        # of every function on its stack.
+        stats = {}
+        for stack, count in self.samples.items():
+            seconds = count * self.interval
+            for func in set(stack):
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                entry[0] += count
+                entry[1] += count
+                entry[3] += seconds
+            stats[stack[-1]][2] += seconds
+            for caller, func in set(zip(stack, stack[1:])):
+                edge = stats[func][4].setdefault(caller, [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += seconds
+                if func == stack[-1]:
+                    edge[2] += seconds
+        return {func: (cc, nc, tt, ct,
+                       {caller: tuple(edge) for caller, edge in
+                        callers.items()})
+                for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+    def stacks(self):
+        return {stack: count * self.interval
+                for stack, count in self.samples.items()}
+
+
+def _collapse(stats):
+    """
+    Rebuild the stacks of cProfile stats, which only keep the time of
+    every caller and callee pair. The time of a function is split
+    between its callers in proportion to the time they spent in it.
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, ct) in callers.items():
+            children.setdefault(caller, []).append((func, ct))
+    stacks = {}
+
+    def walk(stack, func, share):
+        tt = stats[func][2] * share
+        if tt:
+            stacks[stack] = stacks.get(stack, 0.0) + tt
+        if len(stack) >= _MAX_DEPTH:
+            return
+        for child, ct in children.get(func, ()):
+            total = stats[child][3]
+            # Skip recursion and calls too short to show up.
+            if child in stack or not total or ct * share < 1e-6:
+                continue
+            walk(stack + (child,), child, share * ct / total)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        # `_TracingProfiler.stop()` is recorded too, it isn't part of
+        # the profiled call.
+        if not callers and func[0] != __file__:
+            walk((func,), func, 1.0)
+    return stacks
+
+
+def _frame_name(func):
+    filename, lineno, name = func
+    if filename == "~":
+        # Builtins, e.g. "<built-in method posix.scandir>".
+        return name.replace(";", ":")
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(";", ":")
+
+
+def _write_profile(profiler, name):
+    """
+    Write `<name>-<time>.pstats`, readable with `pstats.Stats()`, and
+    `<name>-<time>.collapsed` with a "frame;frame;frame microseconds"
+    line per stack.
+    """
+    os.makedirs(DEFAULT_PROFILE_DIR, exist_ok=True)
+    base = os.path.join(DEFAULT_PROFILE_DIR,
+                        f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-"
+                        f"{os.getpid()}")
+    with open(f"{base}.pstats", "wb") as f:
+        marshal.dump(profiler.stats(), f)
+    with open(f"{base}.collapsed", "w", encoding="utf-8") as f:
+        for stack, seconds in sorted(profiler.stacks().items()):
+            micros = round(seconds * 1e6)
+            if micros:
+                f.write(";".join(map(_frame_name, stack)) + f" {micros}\n")
+    print(f"\nprofile located in: {base}.pstats")
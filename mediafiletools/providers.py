@@ -0,0 +1,397 @@
+import json
+import os
+import re
+import time
+from urllib.parse import quote, urlencode
+
+from . import series_details as sd
+
+
+# Base url of the TMDB JSON API.
+TMDB_API_URL = os.environ.get("MEDIAFILETOOLS_TMDB_API_URL",
+                              "https://api.themoviedb.org/3")
+
+_SHOW_ID_RE = re.compile(r"/tv/(\d+)")
+# The months of the website's dates, in English whatever the locale.
+_MONTHS = ("January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December")
+
+
+class EpisodeProvider:
+    """
+    A source of episode lists for `make_seriesdb()` and
+    `rename_episodes()`. Subclasses implement `episodes()` or
+    `iter_seasons()`.
+
+    .. versionadded:: 2.2.0
+    """
+    # The show's name, known once its episodes were read.
+    name = None
+
+    def episodes(self, start=1, end=None, final=False, from_write_ep=False,
+                 max_workers=None):
+        """
+        The episode rows of the seasons `start` to `end`, or up to the
+        last season. A `start` of None is the first season. Rows have the `EPISODE_COLUMNS`, or only the
+        season, episode number and title if `from_write_ep` is set.
+
+        Returns
+        -------
+        tuple
+            (show name, episode rows)
+        """
+        episodelist = []
+        for rows in self.iter_seasons(start, end, final, from_write_ep,
+                                      max_workers):
+            episodelist.extend(rows)
+        return self.show_name(), episodelist
+
+    def iter_seasons(self, start=1, end=None, final=False,
+                     from_write_ep=False, max_workers=None):
+        # Yield the rows of every season as soon as they're read,
+        # see `episodes()`.
+        yield self.episodes(start, end, final, from_write_ep,
+                            max_workers)[1]
+
+    def show_name(self):
+        return self.name
+
+
+class HTTPProvider(EpisodeProvider):
+    """
+    Base class of the providers reading a website or an API. A show
+    is found by its id, or by its name and year with a search that
+    goes through the `NameCache`.
+
+    Subclasses implement `season_url()` and `parse_season()`, and
+    `seasons_url()` and `parse_seasons()` if the site lists the
+    seasons of a show, so they can all be fetched concurrently.
+    """
+    # The name of the show id in error messages.
+    id_name = "TMDB ID"
+    # Whether the seasons are probed one by one when the season list
+    # can't be read.
+    probe = True
+
+    def __init__(self, show=None, series=None, year=None):
+        if show is None and series is None:
+            raise ValueError("Either a show id or a 'series' name "
+                             "must be provided.")
+        self.show = show
+        self.series = series
+        self.year = year
+
+    @property
+    def needs_search(self):
+        return self.show is None
+
+    def search_url(self, series_name, year=None):
+        raise ValueError(f"{type(self).__name__} can't search for shows "
+                         f"by name.")
+
+    def match_search(self, page, series_name):
+        # The href of the show in a search results page, e.g. "/tv/1400".
+        raise NotImplementedError
+
+    def season_url(self, season):
+        raise NotImplementedError
+
+    def seasons_url(self):
+        # The page listing every season, None if there isn't one.
+        return None
+
+    def parse_seasons(self, page):
+        # The season numbers listed in the `seasons_url()` page.
+        raise NotImplementedError
+
+    def parse_season(self, page, season, from_write_ep=False):
+        """
+        Extract the episodes of a season page.
+
+        Returns
+        -------
+        tuple
+            (episode rows, whether it's the last season)
+        """
+        raise NotImplementedError
+
+    def resolve(self):
+        # Search for the show once if only its name is known.
+        if self.needs_search:
+            self.show = sd._resolve_series(self.series, self.year,
+                                           provider=self)
+        return self.show
+
+    def discover_seasons(self, start):
+        """
+        Fetch the season list once so every season can be fetched up
+        front. Returns None if the list can't be read, the seasons are
+        then probed one by one.
+        """
+        try:
+            page = sd._fetch_page(self.seasons_url(), id_name=self.id_name)
+        except sd.HTTPStatusError:
+            if not self.probe:
+                raise
+            return None
+        return self.plan_seasons(self.parse_seasons(page), start)
+
+    def plan_seasons(self, seasons, start):
+        # The listed seasons to fetch, None to probe them instead.
+        seasons = sd._plan_seasons(seasons, start)
+        if self.probe:
+            return seasons or None
+        return seasons
+
+    def iter_seasons(self, start=1, end=None, final=False,
+                     from_write_ep=False, max_workers=None):
+        self.resolve()
+        start = 1 if start is None else int(start)
+        if end is not None:
+            seasons = list(range(start, int(end) + 1))
+        elif self.seasons_url() is not None:
+            seasons = self.discover_seasons(start)
+        else:
+            seasons = None
+
+        if seasons is not None:
+            if final and end is None:
+                # Like the probing below, `final` stops after the
+                # first season.
+                seasons = seasons[:1]
+            # The seasons are known, fetch them concurrently.
+            pages = sd._iter_pages([self.season_url(s) for s in seasons],
+                                   max_workers=max_workers)
+            for season, page in zip(seasons, pages):
+                yield self.parse_season(page, season, from_write_ep)[0]
+        else:
+            # Probe for the next season page by page.
+            while True:
+                page = sd._fetch_page(self.season_url(start),
+                                      id_name=self.id_name)
+                rows, last_season = self.parse_season(page, start,
+                                                      from_write_ep)
+                end_loop = sd._reach_end_of_season(
+                    start, end, final=final or last_season)
+                yield rows
+                start += 1
+                if end_loop:
+                    break
+
+    def show_name(self):
+        # Read the season list for the name if no season gave it.
+        if self.name is None and self.seasons_url() is not None:
+            self.parse_seasons(sd._fetch_page(self.seasons_url(),
+                                              id_name=self.id_name))
+        return self.name
+
+
+class TMDBProvider(HTTPProvider):
+    """
+    Scrapes the season pages of themoviedb.org. This is what
+    `make_seriesdb(series_id=...)` and `make_seriesdb(series=...)`
+    use by default.
+
+    Parameters
+    ----------
+    series_id: str, optional
+        The TMDB id of the show (e.g. '7317').
+    series: str, optional
+        The name of the show, searched for if `series_id` isn't given.
+    year: str, optional
+        The year that the series premiered.
+
+    .. versionadded:: 2.2.0
+    """
+    def __init__(self, series_id=None, series=None, year=None):
+        super().__init__(None if series_id is None else f"/tv/{series_id}",
+                         series, year)
+
+    def search_url(self, series_name, year=None):
+        return sd._search_url(series_name, year)
+
+    def match_search(self, page, series_name):
+        return sd._match_search_results(page, series_name)
+
+    def season_url(self, season):
+        return f"{sd.TMDB_URL}{self.show}/season/{season}"
+
+    def seasons_url(self):
+        return f"{sd.TMDB_URL}{self.show}/seasons"
+
+    def parse_seasons(self, page):
+        return sd._parse_season_list(page)
+
+    def parse_season(self, page, season, from_write_ep=False):
+        rows, last_season, soup = sd._scrape_season(
+            page, season, False, from_write_ep=from_write_ep)
+        self.name = sd._show_name(soup, False)
+        # Break the tree's reference cycles so it's freed right away
+        # instead of by the garbage collector.
+        soup.decompose()
+        return rows, last_season
+
+
+class IMDBProvider(HTTPProvider):
+    """
+    Scrapes the episode pages of imdb.com.
+
+    Parameters
+    ----------
+    imdb_id: str
+        The IMDB id of the show (e.g. 'tt0903747').
+
+    .. versionadded:: 2.2.0
+    """
+    id_name = "IMDB ID"
+
+    def __init__(self, imdb_id):
+        super().__init__(imdb_id)
+
+    def season_url(self, season):
+        return f"{sd.IMDB_URL}/title/{self.show}/episodes/?season={season}"
+
+    def parse_season(self, page, season, from_write_ep=False):
+        rows, last_season, soup = sd._scrape_season(
+            page, season, True, from_write_ep=from_write_ep)
+        self.name = sd._show_name(soup, True)
+        # Free the tree right away, see `TMDBProvider.parse_season`.
+        soup.decompose()
+        return rows, last_season
+
+
+class TMDBAPIProvider(HTTPProvider):
+    """
+    Reads the episodes from the TMDB JSON API instead of the website.
+    A season is a few KB of JSON instead of hundreds of KB of HTML,
+    and only the episode fields are read, there's no markup to parse.
+
+    Example:
+        make_seriesdb(provider=TMDBAPIProvider(series_id='1400'))
+
+    Parameters
+    ----------
+    series_id: str, optional
+        The TMDB id of the show (e.g. '1400').
+    series: str, optional
+        The name of the show, searched for if `series_id` isn't given.
+    year: str, optional
+        The year that the series premiered.
+    api_key: str, optional
+        The TMDB API key. Default is the `TMDB_API_KEY` environment
+        variable.
+
+    .. versionadded:: 2.2.0
+    """
+    # There's no 'Next Season' link, the seasons are always listed.
+    probe = False
+
+    def __init__(self, series_id=None, series=None, year=None, api_key=None):
+        super().__init__(None if series_id is None else f"/tv/{series_id}",
+                         series, year)
+        self.api_key = api_key or os.environ.get("TMDB_API_KEY")
+
+    def _url(self, path, **params):
+        if self.api_key:
+            params["api_key"] = self.api_key
+        query = urlencode(params, quote_via=quote)
+        return f"{TMDB_API_URL}{path}" + (f"?{query}" if query else "")
+
+    def _show_path(self):
+        # "/tv/1400", website hrefs like "/tv/1400-seinfeld" also work.
+        match = _SHOW_ID_RE.match(self.show)
+        return match.group(0) if match else self.show
+
+    def search_url(self, series_name, year=None):
+        params = {"query": series_name}
+        if year is not None:
+            params["first_air_date_year"] = year
+        return self._url("/search/tv", **params)
+
+    def match_search(self, page, series_name):
+        results = json.loads(page).get("results") or []
+        if results:
+            # Same rules as the website search, see
+            # `series_details._match_search_results`.
+            matches = [(r["name"], f"/tv/{r['id']}") for r in results
+                       if r.get("name") == results[0].get("name")]
+            if len(matches) > 1:
+                raise sd.SeriesLookupError(
+                    f"There are multiple results for {matches[0][0]}. Please "
+                    f"filter your results by specifying the show by year or "
+                    f"by TMDB ID. \n{matches}",
+                    matches=matches,
+                )
+            return matches[0][1]
+        raise sd.SeriesLookupError(f"There are no results for {series_name}.")
+
+    def season_url(self, season):
+        return self._url(f"{self._show_path()}/season/{season}")
+
+    def seasons_url(self):
+        return self._url(self._show_path())
+
+    def parse_seasons(self, page):
+        show = json.loads(page)
+        self.name = sd.clean_filename(show["name"])
+        return sorted(s["season_number"] for s in show.get("seasons") or ())
+
+    def parse_season(self, page, season, from_write_ep=False):
+        rows = []
+        for episode in json.loads(page).get("episodes") or ():
+            row = [season, str(episode["episode_number"]), episode["name"]]
+            if not from_write_ep:
+                row.extend([_air_date(episode.get("air_date")),
+                            episode.get("overview") or None])
+            rows.append(row)
+        return rows, False
+
+
+def _air_date(date):
+    # "2008-01-20" in the website's format, "January 20, 2008".
+    if not date:
+        return "N/A"
+    day = time.strptime(date, "%Y-%m-%d")
+    return f"{_MONTHS[day.tm_mon - 1]} {day.tm_mday}, {day.tm_year}"
+
+
+class CSVProvider(EpisodeProvider):
+    """
+    Reads the episodes from a csv file written by `make_seriesdb()`.
+
+    Parameters
+    ----------
+    csv_path: str
+        The csv file.
+
+    .. versionadded:: 2.2.0
+    """
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.name = os.path.splitext(os.path.basename(csv_path))[0]
+
+    def episodes(self, start=None, end=None, final=False,
+                 from_write_ep=False, max_workers=None):
+        # Every row of the file, specials included, unless `start` or
+        # `end` is given.
+        df = sd._read_episode_csv(self.csv_path)
+        if start is not None:
+            df = df[df["Season"] >= int(start)]
+        if end is not None:
+            df = df[df["Season"] <= int(end)]
+        columns = sd.EPISODE_COLUMNS[:3] if from_write_ep \
+            else sd.EPISODE_COLUMNS
+        return self.name, df[columns].values.tolist()
+
+
+def provider_for(imdb_id=None, series_id=None, series=None, year=None,
+                 csv_path=None):
+    # The default provider of the `make_seriesdb()` arguments.
+    if csv_path is not None:
+        return CSVProvider(csv_path)
+    if imdb_id is not None:
+        return IMDBProvider(imdb_id)
+    if series_id is not None or series is not None:
+        return TMDBProvider(series_id, series, year)
+    raise ValueError("At least one of 'imdb_id', 'series_id' or 'series' "
+                     "must be provided.")
@@ -0,0 +1,125 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+# The folder of the rename log and the rename journals, unless the
+# `MEDIAFILETOOLS_LOG_DIR` environment variable is set.
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                               'mediafiletools', 'log')
+
+logger = logging.getLogger("mediafiletools.rename")
+
+# The log file set with `set_rename_log()`, None turns the file off.
+# By default rename.jsonl in `log_dir()`, looked up on first use.
+_DEFAULT = object()
+_log_file = _DEFAULT
+# The listener writing the queued records, started on first use.
+_listener = None
+_queue_handler = None
+_lock = threading.Lock()
+
+
+class JsonLinesHandler(logging.Handler):
+    """
+    Writes every record as one JSON object per line. The file is only
+    opened with the first record and isn't flushed after each one, the
+    records are written by the `QueueListener` thread in batches.
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._file = None
+
+    def emit(self, record):
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                            exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            entry = {"time": record.created, "level": record.levelname,
+                     "event": record.getMessage()}
+            entry.update(getattr(record, "fields", {}))
+            self._file.write(json.dumps(entry, default=str) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        super().close()
+
+
+def set_rename_log(path):
+    """
+    Set the JSON lines file recording every rename, with the old and
+    new paths, the status and the time each rename took. Pass None
+    to only send the records to the `mediafiletools.rename` logger.
+    Default is rename.jsonl in ~/.cache/mediafiletools/log, or in
+    the `MEDIAFILETOOLS_LOG_DIR` environment variable.
+    """
+    global _log_file
+    flush_rename_log()
+    _log_file = path
+
+
+def log_dir():
+    # The folder of the rename log and journals. The environment
+    # variable is read on every call, so it can be set after import.
+    return os.environ.get("MEDIAFILETOOLS_LOG_DIR") or DEFAULT_LOG_DIR
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    Queue a structured record, e.g.
+    log_event("rename", old=src, new=dst, status="renamed").
+    The caller never waits for the disk.
+    """
+    _start()
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def flush_rename_log():
+    # Write the queued records and close the file, the listener is
+    # started again by the next record.
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            logger.removeHandler(_queue_handler)
+            _listener = _queue_handler = None
+
+
+def _start():
+    # Attach the queue to the logger on first use, nothing is done
+    # at import time.
+    global _listener, _queue_handler
+    if _listener is not None or _log_file is None:
+        return
+    with _lock:
+        if _listener is None:
+            records = queue.SimpleQueue() if hasattr(queue, "SimpleQueue") \
+                else queue.Queue()
+            _queue_handler = QueueHandler(records)
+            path = os.path.join(log_dir(), "rename.jsonl") \
+                if _log_file is _DEFAULT else _log_file
+            _listener = QueueListener(records, JsonLinesHandler(path))
+            _listener.start()
+            logger.addHandler(_queue_handler)
+            if logger.level == logging.NOTSET:
+                logger.setLevel(logging.INFO)
+
+
+atexit.register(flush_rename_log)
@@ -0,0 +1,162 @@
+import json
+import os
+import re
+from collections import Counter
+from heapq import nlargest, nsmallest
+
+from .common import normalize_ld
+
+
+INDEX_VERSION = 1
+
+# Stop counting trigram postings after this many, the rarest
+# trigrams are counted first so the budget goes to the useful ones.
+MAX_POSTINGS = 3000
+# Number of trigram candidates ranked with `normalize_ld`.
+MAX_CANDIDATES = 25
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+# Trie key holding the ids of the titles ending at a node.
+_END = "$"
+
+
+class MovieIndex:
+    """
+    Search index over movie titles with a prefix trie for
+    "starts with" queries and a trigram inverted index for
+    typo-tolerant lookups ranked by `normalize_ld`.
+
+    Example:
+        index = MovieIndex.from_dir('/home/user/movies')
+        index.prefix('die')
+        index.search('blazing sadles')
+        index.save('/home/user/movies.index.json')
+
+    Parameters
+    ----------
+    titles: iterable of str
+        The movie titles to index.
+    """
+    def __init__(self, titles=()):
+        self.titles = sorted(set(titles), key=str.casefold)
+        self._keys = [_normalize(title) for title in self.titles]
+        self._trie = {}
+        self._grams = {}
+        for title_id, key in enumerate(self._keys):
+            node = self._trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node.setdefault(_END, []).append(title_id)
+            for gram in _trigrams(key):
+                postings = self._grams.setdefault(gram, [])
+                if not postings or postings[-1] != title_id:
+                    postings.append(title_id)
+
+    @classmethod
+    def from_dir(cls, dir_path, strip=False):
+        """
+        Index every movie in the `dir_path` tree, named like
+        `make_moviedb()` does.
+
+        Parameters
+        ----------
+        dir_path: str
+            The root directory of the movie files.
+        strip: bool, default False
+            Call `_format_filename` with the `strip_all` kwarg
+            to remove extraneous details from the file names.
+        """
+        from .movie_sort_to_df import recursive_sort
+
+        return cls(recursive_sort(dir_path, strip=strip))
+
+    def __len__(self):
+        return len(self.titles)
+
+    def prefix(self, query, limit=20):
+        """
+        Titles starting with `query`, ignoring case and punctuation,
+        in alphabetical order.
+        """
+        node = self._trie
+        for char in _normalize(query):
+            node = node.get(char)
+            if node is None:
+                return []
+        # The trie drops punctuation, so its order isn't the order of
+        # the titles. Ids are, every match is collected first.
+        ids = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            ids.extend(node.get(_END, ()))
+            stack.extend(child for char, child in node.items()
+                         if char != _END)
+        return [self.titles[i] for i in nsmallest(limit, ids)]
+
+    def search(self, query, limit=10, distance=0.3):
+        """
+        Typo-tolerant search. Candidates sharing the most trigrams
+        with `query` are ranked by their levenshtein distance; titles
+        further than `distance` are dropped.
+        """
+        key = _normalize(query)
+        grams = sorted(set(_trigrams(key)),
+                       key=lambda g: len(self._grams.get(g, ())))
+        counts = Counter()
+        budget = MAX_POSTINGS
+        for gram in grams:
+            postings = self._grams.get(gram)
+            if not postings:
+                continue
+            if len(postings) > budget and counts:
+                break
+            budget -= len(postings)
+            counts.update(postings)
+        ranked = []
+        for title_id in nlargest(MAX_CANDIDATES, counts, key=counts.get):
+            ld = normalize_ld(key, self._keys[title_id])
+            if ld <= distance:
+                ranked.append((ld, self.titles[title_id]))
+        ranked.sort()
+        return [title for _, title in ranked[:limit]]
+
+    def save(self, path):
+        # Write the index to a json file.
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION,
+                       "titles": self.titles,
+                       "keys": self._keys,
+                       "trie": self._trie,
+                       "grams": self._grams}, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        # Read an index written by `save()` without rebuilding it.
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"{os.path.basename(path)} was written by an "
+                             f"incompatible version, rebuild the index.")
+        index = cls()
+        index.titles = data["titles"]
+        index._keys = data["keys"]
+        index._trie = data["trie"]
+        index._grams = data["grams"]
+        return index
+
+
+def index_path(filepath, f_name):
+    # The index file next to the `make_moviedb` output.
+    if os.path.splitext(filepath)[1]:
+        return os.path.splitext(filepath)[0] + ".index.json"
+    return os.path.join(filepath, f_name + ".index.json")
+
+
+def _normalize(title):
+    return _NON_ALNUM_RE.sub(" ", title.lower()).strip()
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
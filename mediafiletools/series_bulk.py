@@ -0,0 +1,305 @@
+import asyncio
+import os
+import random
+import time
+from urllib.parse import urlparse
+
+from . import series_details as sd
+from .name_cache import get_name_cache, name_key
+from .profiling import entry_point
+from .providers import HTTPProvider, provider_for
+
+
+# Responses worth retrying: rate limited or a server error.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Upper bound of a single backoff, in seconds.
+MAX_BACKOFF = 60
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the request rate of every show scraped
+    by `make_seriesdb_many()`. Tokens are added at `rate` per
+    second up to `capacity`, so short bursts are allowed but the
+    average rate never exceeds `rate`.
+
+    Parameters
+    ----------
+    rate: float
+        Requests per second.
+    capacity: int, optional
+        The largest burst. Default is `rate`, at least 1.
+    """
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("The rate must be greater than 0.")
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        # Wait until a token is available and take it.
+        if self._lock is None:
+            # Created here so it belongs to the running loop.
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens
+                                   + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _Fetcher:
+    # Fetches pages under the global rate limit and the per-host
+    # concurrency cap, retrying 429 and 5xx responses.
+    def __init__(self, bucket, per_host, retries, backoff, executor):
+        self.bucket = bucket
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = executor
+        self._hosts = {}
+
+    async def fetch(self, url, id_name="TMDB ID"):
+        loop = asyncio.get_running_loop()
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            async with self._hosts[host]:
+                # `requests` blocks, run it on the thread pool.
+                status_code, reason, text = await loop.run_in_executor(
+                    self.executor, sd._request, url)
+            if status_code == 200:
+                return text
+            if status_code not in RETRY_STATUSES or attempt >= self.retries:
+                raise sd.HTTPStatusError(url, status_code, reason,
+                                         id_name=id_name)
+            # Exponential backoff with full jitter, so shows throttled
+            # at the same moment don't retry in lockstep.
+            await asyncio.sleep(random.uniform(
+                0, min(MAX_BACKOFF, self.backoff * 2 ** attempt)))
+            attempt += 1
+
+
+@entry_point
+def make_seriesdb_many(specs, filepath=None, output_type='csv', rate=5.0,
+                       burst=None, per_host=sd.MAX_WORKERS, retries=3,
+                       backoff=1.0, profile=None, metrics=None):
+    """
+    Scrape many shows at once and write one output file per show
+    as soon as it's complete. Every request shares one rate limit,
+    and 429 or 5xx responses are retried with a jittered backoff.
+    A show that fails doesn't stop the others.
+
+    Example:
+        make_seriesdb_many([
+            {'series_id': '1400'},
+            {'series': 'Seinfeld', 'year': '1989'},
+            {'series_id': '7317', 'start': 1, 'end': 3},
+        ], filepath='/home/user/shows', rate=4)
+
+    Parameters
+    ----------
+    specs: list of dict
+        The shows to scrape. Each dict takes the `imdb_id`,
+        `series_id`, `series`, `year`, `start`, `end` and
+        `provider` arguments of `make_seriesdb()`.
+    filepath: str, optional
+        The output directory for the txt/csv files.
+        Default is home/user.
+    output_type: str, default `csv`
+        Choose the resulting filetype/output. Valid types are `txt`,
+        `csv`, `console`, or any other type of
+        `save_to_file()`.
+    rate: float, default 5.0
+        Requests per second across every show.
+    burst: int, optional
+        The largest burst of requests. Default is `rate`.
+    per_host: int, default `MAX_WORKERS`
+        The maximum number of requests in flight to the same host.
+    retries: int, default 3
+        How many times a 429 or 5xx response is retried.
+    backoff: float, default 1.0
+        The base delay in seconds, doubled after each retry.
+    profile: bool or str, optional
+        Profile the call with cProfile (True or `'cprofile'`), or with
+        the low overhead sampler (`'sample'`) for long runs. A pstats
+        dump and a collapsed stack file for flamegraphs are written to
+        ~/.cache/mediafiletools/profile. Default is the
+        `MEDIAFILETOOLS_PROFILE` environment variable.
+    metrics: str, optional
+        A node_exporter textfile collector folder. The duration of
+        every stage, the files scanned, dupes found, HTTP requests
+        and failures, rows written and the peak RSS of the call are
+        written to `mediafiletools_<function name>.prom` in it.
+        Default is the `MEDIAFILETOOLS_METRICS_DIR` environment
+        variable.
+
+    Returns
+    -------
+    list
+        For each spec, the name of the show or the exception
+        that stopped it.
+
+    .. versionadded:: 2.2.0
+    """
+    if filepath is None:
+        filepath = os.path.expanduser('~')
+    if any(spec.get('imdb_id') is not None for spec in specs):
+        sd._warn_imdb_id()
+
+    async def _scrape_show(spec, fetcher, resolver):
+        f_name, episodelist = await _scrape_episodes(spec, fetcher, resolver)
+        await asyncio.get_running_loop().run_in_executor(
+            fetcher.executor, sd._save_episodes, episodelist, f_name,
+            filepath, output_type)
+        return f_name
+
+    results = _run_bulk(specs, _scrape_show, rate, burst, per_host, retries,
+                        backoff)
+    for spec, result in zip(specs, results):
+        if isinstance(result, BaseException):
+            print(f"{type(result).__name__} - {result} --> {spec}")
+    return results
+
+
+class _Resolver:
+    # Resolves every distinct series name and year once per run,
+    # shows sharing a name wait for the same search.
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+        self._tasks = {}
+
+    def resolve(self, provider, series_name, year=None):
+        key = (type(provider), name_key(series_name, year))
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(
+                self._resolve(provider, series_name, year))
+        return self._tasks[key]
+
+    async def _resolve(self, provider, series_name, year):
+        # See `series_details._resolve_series`.
+        cache = get_name_cache()
+        href = cache.get(series_name, year) if cache is not None else None
+        if href is None:
+            page = await self.fetcher.fetch(
+                provider.search_url(series_name, year))
+            href = await asyncio.get_running_loop().run_in_executor(
+                self.fetcher.executor, sd._cache_search, cache, series_name,
+                year, page, provider.match_search)
+        return href
+
+
+def _fetch_episode_tables(specs, rate=5.0, burst=None,
+                          per_host=sd.MAX_WORKERS, retries=3, backoff=1.0):
+    """
+    The 'Season', 'Episode Number' and 'Title' rows of every show in
+    `specs`, see `make_seriesdb_many()`. Identical specs are only
+    scraped once. Returns the rows or the exception of each spec.
+    """
+    tasks = {}
+
+    def _scrape_table(spec, fetcher, resolver):
+        key = tuple(sorted(spec.items()))
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(_scrape_episodes(
+                spec, fetcher, resolver, from_write_ep=True))
+        return _rows(tasks[key])
+
+    async def _rows(task):
+        return (await task)[1]
+
+    return _run_bulk(specs, _scrape_table, rate, burst, per_host, retries,
+                     backoff)
+
+
+def _run_bulk(specs, scrape, rate, burst, per_host, retries, backoff):
+    # Run `scrape(spec, fetcher, resolver)` for every spec on one
+    # event loop, sharing the rate limit and the name resolution.
+    from concurrent.futures import ThreadPoolExecutor
+
+    async def _run(executor):
+        fetcher = _Fetcher(TokenBucket(rate, burst), per_host, retries,
+                           backoff, executor)
+        resolver = _Resolver(fetcher)
+        return await asyncio.gather(
+            *(scrape(spec, fetcher, resolver) for spec in specs),
+            return_exceptions=True)
+
+    workers = max(per_host, 1) * 2
+    sd._size_pool(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return asyncio.run(_run(executor))
+
+
+async def _scrape_episodes(spec, fetcher, resolver, from_write_ep=False):
+    # Scrape every requested season of one show.
+    # Returns (show name, episode rows).
+    loop = asyncio.get_running_loop()
+    provider = spec.get('provider') or provider_for(
+        spec.get('imdb_id'), spec.get('series_id'), spec.get('series'),
+        spec.get('year'))
+    end = spec.get('end')
+    if not isinstance(provider, HTTPProvider):
+        # Local providers don't make requests.
+        return await loop.run_in_executor(
+            fetcher.executor, lambda: provider.episodes(
+                spec.get('start'), end, from_write_ep=from_write_ep))
+    start = int(spec.get('start') or 1)
+    if provider.needs_search:
+        provider.show = await resolver.resolve(provider, provider.series,
+                                               provider.year)
+
+    async def _season(season):
+        page = await fetcher.fetch(provider.season_url(season),
+                                   provider.id_name)
+        # Parsing is CPU bound, keep it off the event loop.
+        return await loop.run_in_executor(
+            fetcher.executor, provider.parse_season, page, season,
+            from_write_ep)
+
+    if end is not None:
+        seasons = list(range(start, int(end) + 1))
+    elif provider.seasons_url() is not None:
+        seasons = await _discover_seasons(fetcher, provider, start)
+    else:
+        seasons = None
+
+    episodelist = []
+    if seasons is not None:
+        for rows, _ in await asyncio.gather(*(_season(s) for s in seasons)):
+            episodelist.extend(rows)
+    else:
+        season = start
+        while True:
+            rows, last_season = await _season(season)
+            episodelist.extend(rows)
+            if last_season:
+                break
+            season += 1
+    if provider.name is None and provider.seasons_url() is not None:
+        await _discover_seasons(fetcher, provider, start)
+    return provider.name, episodelist
+
+
+async def _discover_seasons(fetcher, provider, start):
+    # The planned seasons of a show, see `HTTPProvider.discover_seasons`.
+    try:
+        page = await fetcher.fetch(provider.seasons_url(), provider.id_name)
+    except sd.HTTPStatusError:
+        if not provider.probe:
+            raise
+        return None
+    seasons = await asyncio.get_running_loop().run_in_executor(
+        fetcher.executor, provider.parse_seasons, page)
+    return provider.plan_seasons(seasons, start)
@@ -1,27 +1,61 @@
+import itertools
 import logging
 import os
 import re
+import threading
+import time
 import warnings
 
-from bs4 import BeautifulSoup
-from requests import get
-import pandas as pd
-from .common import save_to_file, EXTENSIONS, _print_file_loc, clean_filename
-
-
-# Keep log of results of `rename_episodes`.
-log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log')
-os.makedirs(log_dir, exist_ok=True)
-
-log_file = os.path.join(log_dir, 'rename.log')
-logging.basicConfig(filename=log_file, level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-
+from .common import (STREAM_TYPES, save_to_file, stream_to_file,
+                     _print_file_loc, clean_filename)
+from .episode_rename import (apply_renames, plan_renames, plan_to_df,
+                             _scan_listing)
+from .http_cache import get_http_cache
+from .metrics import count, stage
+from .name_cache import SeriesLookupError, get_name_cache
+from .profiling import WRAPPER_FRAMES, entry_point
+from .rename_log import flush_rename_log, log_dir, log_event
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "application/json",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+    "Referer": "http://example.com",
+    "Cache-Control": "no-cache",
+}
+# Base urls of the scraped sites. Point them at a local server, e.g.
+# the replay server of the tests, with the environment variables.
+TMDB_URL = os.environ.get("MEDIAFILETOOLS_TMDB_URL",
+                          "https://www.themoviedb.org").rstrip("/")
+IMDB_URL = os.environ.get("MEDIAFILETOOLS_IMDB_URL",
+                          "https://www.imdb.com").rstrip("/")
+EPISODE_COLUMNS = ["Season", "Episode Number", "Title", "Air date", "Description"]
+
+# A link to a season page, e.g. "/tv/1400-seinfeld/season/3".
+_SEASON_HREF_RE = re.compile(r"/season/(\d+)/?$")
+
+# Maximum number of season pages fetched at the same time.
+MAX_WORKERS = 4
+
+# The bs4 parser backend, picked by `_html_parser()`.
+_parser = None
+
+# Shared `requests.Session`, created by `_get_session()`.
+_session = None
+# Connections kept per host, raised by `_size_pool()`.
+_pool_size = MAX_WORKERS
+_session_lock = threading.Lock()
+
+
+@entry_point
 def make_seriesdb(imdb_id=None, series_id=None, series=None,
                   year=None, start=None, end=None, filepath=None,
                   output_type="csv", from_write_ep=False,
-                  final=False):
+                  final=False, max_workers=None, provider=None,
+                  stream=False, profile=None, metrics=None):
     """
     Scrape the data of all the episodes in the given seasons and
     organize into a DataFrame. Default setting will scrape every
@@ -64,170 +98,435 @@ def make_seriesdb(imdb_id=None, series_id=None, series=None,
         Default is home/user.
     output_type: str, default `csv`
         Choose the resulting filetype/output. Valid types are `txt`,
-        `csv`, `console`.
+        `csv`, `console`, or any other type of
+        `save_to_file()`.
     from_write_ep: bool, default False
         Flag to call `_extract_data()` and return DataFrame
         to `write_episode_names()` function.
     final: bool, default False
         If True, stops scraping after the final season of
         a series has been reached.
+    max_workers: int, optional
+        The number of seasons fetched at the same time. Default is
+        `MAX_WORKERS`. The seasons are read from the show's overview
+        page, so they're all fetched concurrently even without `end`.
+
+        .. versionadded:: 2.2.0
+
+    provider: EpisodeProvider, optional
+        Where the episodes are read from, e.g. `TMDBAPIProvider` for
+        the TMDB JSON API or `CSVProvider` for a local csv file. If
+        given, `imdb_id`, `series_id`, `series` and `year` are ignored.
+
+        .. versionadded:: 2.2.0
+
+    stream: bool, default False
+        Write every season to the `txt`/`csv`/`jsonl` file as soon as
+        it's scraped instead of building a DataFrame of the whole show.
+        Memory stays at about one season, for shows with thousands
+        of episodes. Only the `txt`, `csv`, `jsonl` and `console`
+        output types can be streamed.
+
+        .. versionadded:: 2.2.0
+
+    profile: bool or str, optional
+        Profile the call with cProfile (True or `'cprofile'`), or with
+        the low overhead sampler (`'sample'`) for long runs. A pstats
+        dump and a collapsed stack file for flamegraphs are written to
+        ~/.cache/mediafiletools/profile. Default is the
+        `MEDIAFILETOOLS_PROFILE` environment variable.
+
+        .. versionadded:: 2.2.0
+
+    metrics: str, optional
+        A node_exporter textfile collector folder. The duration of
+        every stage, the files scanned, dupes found, HTTP requests
+        and failures, rows written and the peak RSS of the call are
+        written to `mediafiletools_<function name>.prom` in it.
+        Default is the `MEDIAFILETOOLS_METRICS_DIR` environment
+        variable.
+
+        .. versionadded:: 2.2.0
     """
-    if start is None:
-        start = 1
+    # `start` stays None for the providers, a csv file then keeps its
+    # specials (season 0).
     if filepath is None:
         filepath = os.path.expanduser('~')
-    name_parsed = False
-    season_url = None
-
-    episodelist = []
-    while True:
-        if imdb_id is not None:
-            season_url = rf"https://www.imdb.com/title/{imdb_id}/episodes/?season={start}"
-            warnings.warn(
-                "The `imdb_id` parameter is deprecated and will be removed in "
-                "version 2.1.3. Please use `series_id` instead, using the id "
-                "from themoviedb.org.",
-                DeprecationWarning,
-                stacklevel=2
-            )
-        elif series_id is not None:
-            season_url = rf"https://www.themoviedb.org/tv/{series_id}/season/{start}"
-        elif series is not None:
-            if season_url is not None:
-                season_url = season_url[:-1] + str(start)
-            else:
-                season_url = _parse_series_name(series_name=series, year=year,
-                                                start=start, url_created=name_parsed)
-
-        season = int(start)
-        response = get(
-            season_url,
-            headers={
-                "User-Agent": "Mozilla/5.0",
-                "Accept": "application/json",
-                "Accept-Language": "en-US,en;q=0.5",
-                "Accept-Encoding": "gzip, deflate",
-                "Connection": "keep-alive",
-                "Referer": "http://example.com",
-                "Cache-Control": "no-cache",
-            },
+    if imdb_id is not None:
+        _warn_imdb_id()
+    if stream and not from_write_ep and output_type not in STREAM_TYPES:
+        # Checked before a season is scraped.
+        raise ValueError(
+            f"{output_type} can't be streamed. Valid keywords are 'txt', "
+            f"'csv', 'jsonl' or 'console'."
         )
-        if response.status_code != 200:
-            raise ValueError(
-                f"Error: Received HTTP status code {response.status_code} "
-                f"({response.reason}) for URL: {season_url}. Please check the URL "
-                f"or IMDB ID and try again."
-            )
+    if provider is None:
+        from .providers import provider_for
+
+        provider = provider_for(imdb_id, series_id, series, year)
+    if stream and not from_write_ep:
+        _stream_episodes(provider, start, end, final, max_workers,
+                         filepath, output_type)
+        return
+    f_name, episodelist = provider.episodes(
+        start, end, final=final, from_write_ep=from_write_ep,
+        max_workers=max_workers)
+
+    if from_write_ep:
+        # Return episodelist to `rename_episodes()`
+        return episodelist
+
+    _save_episodes(episodelist, f_name, filepath, output_type)
+
+
+def _warn_imdb_id():
+    # Called by the entry points, the warning points at their caller.
+    warnings.warn(
+        "The `imdb_id` parameter is deprecated and will be removed in "
+        "version 2.1.3. Please use `series_id` instead, using the id "
+        "from themoviedb.org.",
+        DeprecationWarning,
+        stacklevel=3 + WRAPPER_FRAMES
+    )
+
+
+def _show_name(soup, imdb):
+    # Get show title for filename
+    if imdb:
+        return clean_filename(soup.find('h2').text.strip())
+    return soup.title.string.split(":")[0]
+
+
+def _stream_episodes(provider, start, end, final, max_workers,
+                     filepath, output_type):
+    # Write the rows of every season as they're scraped.
+    seasons = provider.iter_seasons(start, end, final,
+                                    max_workers=max_workers)
+    # The file is named after the show, known from the first season.
+    first = next(seasons, [])
+    f_name = provider.show_name()
+    _print_file_loc(output_type, filepath, f_name)
+    rows = itertools.chain(first, itertools.chain.from_iterable(seasons))
+    stream_to_file(rows, EPISODE_COLUMNS, filepath=filepath,
+                   output_type=output_type, fname=f_name)
+
+
+def _save_episodes(episodelist, f_name, filepath, output_type):
+    import pandas as pd
+
+    # Output file location to console.
+    _print_file_loc(output_type, filepath, f_name)
+
+    # Output a DataFrame to a txt/csv file or print to console.
+    save_to_file(
+        pd.DataFrame(episodelist, columns=EPISODE_COLUMNS),
+        filepath=filepath,
+        output_type=output_type,
+        fname=f_name,
+        # Updates the episodes of an existing `sqlite` table.
+        key=["Season", "Episode Number"],
+    )
+
+
+def _parse_season_list(page):
+    # The season numbers linked from a TMDB seasons page, in order.
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    soup = BeautifulSoup(page, _html_parser(), parse_only=SoupStrainer("a"))
+    seasons = set()
+    for link in soup.find_all("a", href=True):
+        match = _SEASON_HREF_RE.search(link["href"])
+        if match:
+            seasons.add(int(match.group(1)))
+    return sorted(seasons)
+
+
+def _plan_seasons(seasons, start):
+    # The seasons to fetch, from `start` up to the last one.
+    # Specials (season 0) are only included when `start` is 0.
+    return [s for s in seasons if s >= start]
+
+
+def _scrape_season(page, season, imdb, from_write_ep=False):
+    """
+    Parse a season page and extract its episodes.
+
+    Returns
+    -------
+    tuple
+        (episode rows, whether it's the last season, parsed tree)
+    """
+    soup = _parse_season_page(page, imdb)
+    episode_details, last_season = _find_episodes(soup, imdb)
+    rows = []
+    _extract_data(episode_details, rows, season, from_write_ep=from_write_ep)
+    return rows, last_season, soup
+
+
+def _parse_season_page(page, imdb):
+    """
+    Parse a season page into a tree holding only the elements the
+    scraper reads: the episode cards (or IMDB episode sections), the
+    'Next Season' navigation and the show title. Uses lxml when it
+    is installed.
+    """
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(page, _html_parser(),
+                         parse_only=_season_strainer(imdb))
+
+
+def _html_parser():
+    # The fastest parser backend that is installed.
+    global _parser
+    if _parser is None:
+        from importlib.util import find_spec
+
+        _parser = "lxml" if find_spec("lxml") is not None else "html.parser"
+    return _parser
+
+
+def _season_strainer(imdb):
+    # A SoupStrainer keeping only the top-level elements of a season
+    # page wanted by `_find_episodes` and the output file name.
+    from bs4 import SoupStrainer
+
+    class _SeasonStrainer(SoupStrainer):
+        def allow_tag_creation(self, nsprefix, name, attrs):
+            # bs4 >= 4.13
+            return _wanted_tag(name, attrs or {}, imdb)
+
+        def search_tag(self, markup_name=None, markup_attrs={}):
+            # bs4 < 4.13
+            if isinstance(markup_name, str):
+                return _wanted_tag(markup_name, markup_attrs or {}, imdb)
+            return super().search_tag(markup_name, markup_attrs)
+
+    return _SeasonStrainer()
+
+
+def _wanted_tag(name, attrs, imdb):
+    classes = attrs.get("class") or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    if imdb:
+        return (name == "h2"
+                or (name == "section"
+                    and any(c.startswith("sc-56c21e9b-0") for c in classes))
+                or (name == "button" and attrs.get("id") == "next-season-btn"))
+    return (name == "title"
+            or (name == "div" and "card" in classes)
+            or (name == "a" and attrs.get("alt") == "Next Season"))
+
+
+def _find_episodes(soup, imdb):
+    # Find the episode elements of a season page and whether it's
+    # the last season of the show.
+    if imdb:
+        episode_details = soup.find_all("section",
+                                        class_=re.compile("sc-56c21e9b-0.*"))
+        # Check for absense of 'Next Season' element in soup in imdb.
+        last_season = not soup.find('button', {'id': 'next-season-btn'})
+    else:
+        episode_details = soup.find_all('div', class_='card')
+        # Check for absense of 'Next Season' element in soup.
+        last_season = not soup.find('a', {'alt': 'Next Season'})
+    return episode_details, last_season
+
+
+def _get_session():
+    """
+    The `requests.Session` shared by every request of the package.
+    Connections are kept alive and pooled, so fetching many pages
+    from the same host only pays for one TCP and TLS handshake
+    per connection.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from requests import Session
+
+                session = Session()
+                session.headers.update(HEADERS)
+                _mount_adapter(session, _pool_size)
+                _session = session
+    return _session
+
+
+def _mount_adapter(session, pool_size):
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def _size_pool(workers):
+    """
+    Keep a connection per worker of a run with more than
+    `MAX_WORKERS` concurrent requests. A full pool would close the
+    connections it can't keep instead of reusing them.
+    """
+    global _pool_size
+    session = _get_session()
+    with _session_lock:
+        if workers > _pool_size:
+            _pool_size = workers
+            _mount_adapter(session, workers)
+
+
+class HTTPStatusError(ValueError):
+    # Raised when a page can't be fetched.
+    def __init__(self, url, status_code, reason, id_name="IMDB ID"):
+        super().__init__(
+            f"Error: Received HTTP status code {status_code} "
+            f"({reason}) for URL: {url}. Please check the URL "
+            f"or {id_name} and try again."
+        )
+        self.url = url
+        self.status_code = status_code
+
+
+@stage("http")
+def _request(url):
+    # GET a page with the shared session. Goes through the
+    # `ResponseCache` if one was set with `set_http_cache`.
+    # Returns (status code, reason, text).
+    count("http_requests")
+    try:
+        cache = get_http_cache()
+        if cache is not None:
+            status_code, reason, text = cache.fetch(_get_session(), url)
         else:
-            soup = BeautifulSoup(response.text, "html.parser")
-            name_parsed = True
-            if imdb_id is not None:
-                episode_details = soup.find_all("section",
-                                                class_=re.compile("sc-56c21e9b-0.*"))
-                # Check for absense of 'Next Season' element in soup in imdb.
-                if not soup.find('button', {'id': 'next-season-btn'}):
-                    final = True
-            else:
-                episode_details = soup.find_all('div', class_='card')
-                # Check for absense of 'Next Season' element in soup.
-                if not soup.find('a', {'alt': 'Next Season'}):
-                    final = True
-
-            # End loop after reaching final season.
-            end_loop = _reach_end_of_season(start, end, final=final)
-            _extract_data(
-                episode_details, episodelist, season, from_write_ep=from_write_ep
-            )
-            start += 1
-
-        if end_loop:
-            if from_write_ep:
-                # Return episodelist to `rename_episodes()`
-                return episodelist
-
-            # Get show title for filename
-            f_name = None
-            if imdb_id is not None:
-                f_name = clean_filename(soup.find('h2').text.strip())
-            elif series_id is not None or series is not None:
-                f_name = soup.title.string.split(":")[0]
-
-            # Output file location to console.
-            _print_file_loc(output_type, filepath, f_name)
-
-            # Output a DataFrame to a txt/csv file or print to console.
-            save_to_file(
-                pd.DataFrame(
-                    episodelist,
-                    columns=[
-                        "Season",
-                        "Episode Number",
-                        "Title",
-                        "Air date",
-                        "Description",
-                    ],
-                ),
-                filepath=filepath,
-                output_type=output_type,
-                fname=f_name,
-            )
-            break
+            response = _get_session().get(url)
+            status_code, reason, text = \
+                response.status_code, response.reason, response.text
+    except Exception:
+        count("http_failures")
+        raise
+    if status_code != 200:
+        count("http_failures")
+    return status_code, reason, text
+
+
+def _fetch_page(url, id_name="IMDB ID"):
+    # GET a page and return its text.
+    status_code, reason, text = _request(url)
+    if status_code != 200:
+        raise HTTPStatusError(url, status_code, reason, id_name=id_name)
+    return text
+
+
+def _iter_pages(urls, max_workers=None):
+    """
+    Fetch the urls concurrently and yield the pages in the same order
+    as `urls`. At most `max_workers` requests are in flight and only
+    the pages not yet consumed are held, so memory doesn't grow with
+    the number of urls.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    if max_workers is None:
+        max_workers = MAX_WORKERS
+    if len(urls) <= 1 or max_workers <= 1:
+        for url in urls:
+            yield _fetch_page(url)
+        return
+    _size_pool(max_workers)
+    urls = iter(urls)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque(pool.submit(_fetch_page, url)
+                        for url in itertools.islice(urls, max_workers))
+        while pending:
+            page = pending.popleft().result()
+            url = next(urls, None)
+            if url is not None:
+                pending.append(pool.submit(_fetch_page, url))
+            yield page
 
 
 def _parse_series_name(series_name, year=None, start=None,
                        href=None, url_created=None):
     # Converts the `series` string from `make_seriesdb` into a season url.
     if url_created:
-        return rf"https://www.themoviedb.org{href}/season/{start}"
+        return f"{TMDB_URL}{href}/season/{start}"
+    return f"{TMDB_URL}{_resolve_series(series_name, year)}/season/{start}"
+
+
+def _resolve_series(series_name, year=None, provider=None):
+    """
+    The TMDB href of a series name, e.g. "/tv/1400". Goes through
+    the `NameCache` if one was set with `set_name_cache`, so known
+    names and failed searches don't cost a request. The search is
+    made with `provider`, default is the TMDB website.
+    """
+    cache = get_name_cache()
+    href = cache.get(series_name, year) if cache is not None else None
+    if href is None:
+        if provider is None:
+            search_url, match = _search_url, None
+        else:
+            search_url, match = provider.search_url, provider.match_search
+        page = _fetch_page(search_url(series_name, year), id_name="TMDB ID")
+        href = _cache_search(cache, series_name, year, page, match)
+    return href
+
+
+def _cache_search(cache, series_name, year, page, match=None):
+    # Match a search results page and cache the outcome.
+    try:
+        href = (match or _match_search_results)(page, series_name)
+    except SeriesLookupError as e:
+        if cache is not None:
+            cache.set_failed(series_name, year, e)
+        raise
+    if cache is not None:
+        cache.set(series_name, year, href)
+    return href
+
+
+def _search_url(series_name, year=None):
+    # The TMDB search url of a series name.
     if year is not None:
         year = '%20y%3A' + year
     else:
         year = ''
-    season_url = f"https://www.themoviedb.org/search?query=" \
+    return f"{TMDB_URL}/search?query=" \
         f"{series_name.replace(' ', '%20')}{year}"
-    response = get(
-        season_url,
-        headers={
-             "User-Agent": "Mozilla/5.0",
-             "Accept": "application/json",
-             "Accept-Language": "en-US,en;q=0.5",
-             "Accept-Encoding": "gzip, deflate",
-             "Connection": "keep-alive",
-             "Referer": "http://example.com",
-             "Cache-Control": "no-cache",
-        },
-    )
-    if response.status_code != 200:
-        raise ValueError(
-            f"Error: Received HTTP status code {response.status_code} "
-            f"({response.reason}) for URL: {season_url}. Please check the URL "
-            f"or TMDB ID and try again."
-        )
-    else:
-        soup = BeautifulSoup(response.text, 'html.parser')
-        results = soup.find_all('div', class_='poster')
-
-        if results:
-            name_list = []
-            matches = []
-            for index, result in enumerate(results):
-                show_title = result.find('img')
-                alt_text = show_title['alt'] if show_title else None
-                # Get unique url of each search result.
-                href = result.find('a', class_='result')['href']
-                name_list.append(alt_text)
-                # Filter out results that don't match the series name.
-                if show_title and alt_text == name_list[0]:
-                    matches.append((alt_text, href))
-
-            if len(matches) > 1:
-                raise ValueError(
-                    f"There are multiple results for {name_list[0]}. Please filter "
-                    f"your results by specifying the show by year or by TMDB ID. \n"
-                    f"{matches}"
-                )
-            else:
-                return rf"https://www.themoviedb.org{matches[0][1]}/season/{start}"
+
+
+def _match_search_results(page, series_name):
+    # Find the href of the show in a TMDB search results page.
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, 'html.parser')
+    results = soup.find_all('div', class_='poster')
+
+    if results:
+        name_list = []
+        matches = []
+        for index, result in enumerate(results):
+            show_title = result.find('img')
+            alt_text = show_title['alt'] if show_title else None
+            # Get unique url of each search result.
+            href = result.find('a', class_='result')['href']
+            name_list.append(alt_text)
+            # Filter out results that don't match the series name.
+            if show_title and alt_text == name_list[0]:
+                matches.append((alt_text, href))
+
+        if len(matches) > 1:
+            raise SeriesLookupError(
+                f"There are multiple results for {name_list[0]}. Please filter "
+                f"your results by specifying the show by year or by TMDB ID. \n"
+                f"{matches}",
+                matches=matches,
+            )
+        elif matches:
+            return matches[0][1]
+    raise SeriesLookupError(f"There are no results for {series_name}.")
 
 
 def _reach_end_of_season(start, end, final=False):
@@ -248,7 +547,10 @@ def _reach_end_of_season(start, end, final=False):
         return endloop
 
 
-def rename_episodes(root_folder_path, info=None, **kwargs):
+@entry_point
+def rename_episodes(root_folder_path, info=None, dry_run=False,
+                    journal=None, max_workers=None, scan=None,
+                    profile=None, metrics=None, **kwargs):
     """
     Overwrite the old file names of the show's episodes with the new
     names scraped from IMDB with `make_seriesdb()`.
@@ -273,6 +575,51 @@ def rename_episodes(root_folder_path, info=None, **kwargs):
         The root directory of the series.
     info: str, optional
         Any additional information about the file.
+    dry_run: bool, default False
+        Don't rename anything, return the planned renames as a
+        DataFrame with the columns 'Season', 'Folder', 'Old Name'
+        and 'New Name'.
+
+        .. versionadded:: 2.2.0
+
+    journal: str, optional
+        The journal file recording every rename, used by
+        `rollback_renames()` and `resume_renames()`. Default is a
+        new file in ~/.cache/mediafiletools/log, or in the
+        `MEDIAFILETOOLS_LOG_DIR` environment variable.
+
+        .. versionadded:: 2.2.0
+
+    max_workers: int, optional
+        The number of season folders renamed at the same time.
+
+        .. versionadded:: 2.2.0
+
+    scan: MediaScan, optional
+        A `scan_media()` of the show folder or a folder above it,
+        read instead of listing the season folders again.
+
+        .. versionadded:: 2.2.0
+
+    profile: bool or str, optional
+        Profile the call with cProfile (True or `'cprofile'`), or with
+        the low overhead sampler (`'sample'`) for long runs. A pstats
+        dump and a collapsed stack file for flamegraphs are written to
+        ~/.cache/mediafiletools/profile. Default is the
+        `MEDIAFILETOOLS_PROFILE` environment variable.
+
+        .. versionadded:: 2.2.0
+
+    metrics: str, optional
+        A node_exporter textfile collector folder. The duration of
+        every stage, the files scanned, dupes found, HTTP requests
+        and failures, rows written and the peak RSS of the call are
+        written to `mediafiletools_<function name>.prom` in it.
+        Default is the `MEDIAFILETOOLS_METRICS_DIR` environment
+        variable.
+
+        .. versionadded:: 2.2.0
+
     **kwargs : dict, optional
         Arbitrary keyword arguments.
         - imdb_id: str, optional
@@ -286,92 +633,96 @@ def rename_episodes(root_folder_path, info=None, **kwargs):
         - csv_path: str, optional
             The csv file containing the series data. If passed,
             will rename the episodes from the input csv file.
+        - provider: EpisodeProvider, optional
+            Read the episodes from this provider, e.g.
+            `TMDBAPIProvider(series_id='7317')`.
+
+            .. versionadded:: 2.2.0
+
+    Returns
+    -------
+    str or DataFrame
+        The path of the journal, or the plan if `dry_run` is set.
+
     Raises
     ------
     ValueError
-        If neither 'imdb_id' nor 'csv_path' is provided in the keyword arguments.
+        If none of 'imdb_id', 'series_id', 'csv_path' or 'provider' is
+        provided in the keyword
+        arguments, or if two files would be renamed to the same name.
+    OSError
+        If a rename failed. The renames already made are rolled back.
     """
+    import pandas as pd
+    from .providers import CSVProvider, IMDBProvider, TMDBProvider
+
     if info is not None:
         info = " - " + info
     else:
         info = ""
 
-    if 'csv_path' in kwargs:
-        if kwargs['csv_path'].endswith(".csv"):
-            df = pd.read_csv(kwargs['csv_path'])
-        else:
-            raise ValueError(f"{os.path.basename(kwargs['csv_path'])} "
-                             f"must be a csv file.")
-        # Ensure the CSV file has the required columns.
-        if not all(
-            col in df.columns
-            for col in ["Season", "Episode Number", "Title", "Air date", "Description"]
-        ):
-            raise ValueError(
-                "CSV file columns do not match pattern 'Season', "
-                "'Episode Number', 'Title', 'Air date', 'Description'. "
-                "Is it the correct file?"
-            )
+    if 'imdb_id' in kwargs:
+        _warn_imdb_id()
+    if 'provider' in kwargs:
+        provider = kwargs['provider']
+    elif 'csv_path' in kwargs:
+        provider = CSVProvider(kwargs['csv_path'])
     elif 'imdb_id' in kwargs:
-        df = pd.DataFrame(
-            make_seriesdb(kwargs['imdb_id'], from_write_ep=True),
-            columns=["Season", "Episode Number", "Title"],
-        )
+        provider = IMDBProvider(kwargs['imdb_id'])
     elif 'series_id' in kwargs:
-        df = pd.DataFrame(
-            make_seriesdb(series_id=kwargs['series_id'], from_write_ep=True),
-            columns=["Season", "Episode Number", "Title"],
-        )
+        provider = TMDBProvider(series_id=kwargs['series_id'])
     else:
-        raise ValueError("At least one of 'imdb_id', 'series_id', or 'csv_path' "
-                         "must be provided.")
-
-    def _rename_files(file_name):
-        # Helper function.
-        for old_name, (_, row) in zip(file_name, group.iterrows()):
-            episode_name = "".join(c for c in row["Title"] if c not in r'\/:*?"<>|')
-            episode_num = row["Episode Number"]
-            file_ext = os.path.splitext(old_name)[1]
-            new_name = (
-                f"S{season:02d}E{int(episode_num):02d} - {episode_name}{info}{file_ext}"
-            )
-            old_file_path = os.path.join(season_folder, old_name)
-            new_file_path = os.path.join(season_folder, new_name)
-
-            try:
-                os.rename(old_file_path, new_file_path)
-                logging.info(f"Renamed: {old_name} -> {new_name}")
-                print(f"Renamed: {old_name} -> {new_name}")
-            except Exception as e:
-                logging.error(f"Error renaming {old_name}: {str(e)}")
-                print(f"Error renaming {old_name}: {str(e)}")
-
-    # Group the data by season
-    grouped = df.groupby("Season")
-    for season, group in grouped:
-        # Look for folders titled 'Season X'. Change depending on naming scheme.
-        # TODO add way of handling other naming schemes.
-        season_folder = os.path.join(root_folder_path, f"Season {season}")
-        if not os.path.exists(season_folder):
-            print(f"Season folder {season_folder} does not exist. Skipping...")
-            continue
-
-        # Loop through the folder and add each file name to the lists.
-        # Separate lists for video files and sub files.
-        files = {
-            "video": [f for f in os.listdir(season_folder) if f.lower().endswith(EXTENSIONS)],
-            "subs": [f for f in os.listdir(season_folder) if f.lower().endswith((".srt", ".vtt"))]
-        }
-        ep_num = max(files, key=lambda k: len(files[k]))
-        if len(files[ep_num]) != len(group):
-            print(
-                f"The number of video files in {season_folder} does not match the number "
-                f"of rows in the CSV for season {season}."
-            )
-            continue
-
-        for v in files.values():
-            _rename_files(v)
+        raise ValueError("At least one of 'imdb_id', 'series_id', 'csv_path' "
+                         "or 'provider' must be provided.")
+    df = pd.DataFrame(make_seriesdb(provider=provider, from_write_ep=True),
+                      columns=EPISODE_COLUMNS[:3])
+
+    listing = None
+    if scan is not None:
+        listing = _scan_listing(scan, root_folder_path)
+    moves, unmatched = plan_renames(root_folder_path, df, info, listing)
+    if unmatched:
+        print(f"{len(unmatched)} files didn't match an episode and won't "
+              f"be renamed:")
+        for _, folder, name in unmatched:
+            print(f"    {os.path.join(folder, name)}")
+    if dry_run:
+        return plan_to_df(moves, unmatched)
+    if journal is None:
+        journal = os.path.join(
+            log_dir(), f"rename-{time.strftime('%Y%m%d-%H%M%S')}.journal")
+    try:
+        renamed = apply_renames(moves, journal, max_workers=max_workers)
+        log_event("show", root=root_folder_path, status="renamed",
+                  renamed=renamed, journal=journal)
+    except OSError as e:
+        log_event("show", logging.ERROR, root=root_folder_path,
+                  status="rolled back", error=str(e), journal=journal)
+        raise
+    finally:
+        # Write the queued records before returning.
+        flush_rename_log()
+    print(f"Renamed {renamed} files. Undo with rollback_renames({journal!r})")
+    return journal
+
+
+def _read_episode_csv(csv_path):
+    # Read a csv file written by `make_seriesdb()`.
+    import pandas as pd
+
+    if csv_path.endswith(".csv"):
+        df = pd.read_csv(csv_path)
+    else:
+        raise ValueError(f"{os.path.basename(csv_path)} "
+                         f"must be a csv file.")
+    # Ensure the CSV file has the required columns.
+    if not all(col in df.columns for col in EPISODE_COLUMNS):
+        raise ValueError(
+            "CSV file columns do not match pattern 'Season', "
+            "'Episode Number', 'Title', 'Air date', 'Description'. "
+            "Is it the correct file?"
+        )
+    return df
 
 
 def _extract_data(episode_details, episodelist,
@@ -380,20 +731,8 @@ def _extract_data(episode_details, episodelist,
     Helper function to extract the useful information from the IMDB tags.
     """
     for dump in episode_details:
-        if str(episode_details.source) == "div|{'class': 'card'}":
-            # Extract season and episode number from the <a> tag
-            episode_link = dump.find('a', class_='no_click open')
-            episode_number = episode_link['data-episode-number']
-            season_number = episode_link['data-season-number']
-            title = dump.find('h3').get_text(strip=True)
-            episode_data = [int(season_number), episode_number, title]
-            if not from_write_ep:
-                # If called explicitly, also get all details about episodes.
-                descr = dump.find('p').get_text(strip=True)
-                date_span = dump.find('div', class_='date').find('span', class_='date')
-                date = date_span.get_text(strip=True) if date_span else "N/A"
-                episode_data.extend([date, descr])
-            episodelist.append(episode_data)
+        if dump.name == 'div':
+            episodelist.append(_extract_card(dump, from_write_ep))
         else:
             # If deprecated 'imdb_id' is used.
             for eps in dump:
@@ -410,3 +749,32 @@ def _extract_data(episode_details, episodelist,
                     descr_str = re.search(r"<div.*?>(.*?)</div>", str(descr)).group(1)
                     episode_data.extend([date_text, descr_str])
                 episodelist.append(episode_data)
+
+
+def _extract_card(card, from_write_ep=False):
+    """
+    Extract the fields of a TMDB episode card in a single walk over
+    its descendants.
+    """
+    link = title = descr = date = None
+    for tag in card.find_all(True):
+        name = tag.name
+        if name == "a" and link is None:
+            classes = tag.get("class") or []
+            if "no_click" in classes and "open" in classes:
+                link = tag
+        elif name == "h3" and title is None:
+            title = tag.get_text(strip=True)
+        elif from_write_ep:
+            continue
+        elif name == "p" and descr is None:
+            descr = tag.get_text(strip=True)
+        elif name == "span" and date is None and "date" in (tag.get("class") or []) \
+                and "date" in (tag.parent.get("class") or []):
+            date = tag.get_text(strip=True)
+    # Extract season and episode number from the <a> tag
+    episode_data = [int(link["data-season-number"]),
+                    link["data-episode-number"], title]
+    if not from_write_ep:
+        episode_data.extend([date if date is not None else "N/A", descr])
+    return episode_data
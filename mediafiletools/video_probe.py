@@ -0,0 +1,347 @@
+import mmap
+import os
+import struct
+
+
+# Upper bound on the number of bytes mapped from a single file. The
+# metadata we need lives in the `moov` box (MP4), the Segment header
+# (Matroska) or the `hdrl` list (AVI), all of which are tiny compared
+# to the media payload.
+MAX_PROBE_BYTES = 4 * 1024 * 1024
+
+# Number of top-level MP4 boxes to step over while looking for `moov`.
+_MAX_TOP_LEVEL_BOXES = 64
+
+# Matroska element ids.
+_EBML_HEADER = 0x1A45DFA3
+_SEGMENT = 0x18538067
+_INFO = 0x1549A966
+_TIMESTAMP_SCALE = 0x2AD7B1
+_DURATION = 0x4489
+_TRACKS = 0x1654AE6B
+_TRACK_ENTRY = 0xAE
+_TRACK_TYPE = 0x83
+_CODEC_ID = 0x86
+_VIDEO = 0xE0
+_PIXEL_WIDTH = 0xB0
+_PIXEL_HEIGHT = 0xBA
+_CLUSTER = 0x1F43B675
+
+
+def probe_video(path, max_bytes=MAX_PROBE_BYTES):
+    """
+    Read the duration, resolution and video codec of a movie file
+    without decoding it. Only the header region of the container is
+    memory-mapped and at most `max_bytes` are read per file.
+    Supported containers are MP4/MOV (and relatives), Matroska/WebM
+    and AVI. Unknown or damaged files return empty values.
+
+    Example:
+        probe_video('/home/user/movies/Die Hard 1988.mkv')
+
+    Parameters
+    ----------
+    path: str
+        The path of the movie file.
+    max_bytes: int, default `MAX_PROBE_BYTES`
+        The maximum number of bytes mapped from the file.
+
+    Returns
+    -------
+    dict
+        Keys are `duration` (seconds), `width`, `height` and
+        `codec`. Missing values are None.
+    """
+    info = {"duration": None, "width": None, "height": None, "codec": None}
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            magic = f.read(12)
+            if len(magic) < 12:
+                return info
+            if magic[:4] == b"\x1a\x45\xdf\xa3":
+                with _map_region(f, 0, min(size, max_bytes)) as buf:
+                    _parse_matroska(buf, info)
+            elif magic[:4] == b"RIFF" and magic[8:12] == b"AVI ":
+                with _map_region(f, 0, min(size, max_bytes)) as buf:
+                    _parse_avi(buf, info)
+            elif magic[4:8] in (b"ftyp", b"moov", b"mdat", b"free",
+                                b"wide", b"skip"):
+                moov = _find_mp4_moov(f, size)
+                if moov is not None and moov[1] <= max_bytes:
+                    with _map_region(f, *moov) as buf:
+                        _parse_mp4_moov(buf, info)
+    except (OSError, ValueError, struct.error, IndexError, BufferError):
+        pass
+    return info
+
+
+def probe_videos(paths, max_workers=None, max_bytes=MAX_PROBE_BYTES):
+    """
+    Probe many movie files concurrently with `probe_video()`.
+    The results are returned in the same order as `paths`.
+
+    Parameters
+    ----------
+    paths: list of str
+        The paths of the movie files.
+    max_workers: int, optional
+        The size of the worker pool. Default is decided by
+        `ThreadPoolExecutor`.
+    max_bytes: int, default `MAX_PROBE_BYTES`
+        The maximum number of bytes mapped from each file.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda p: probe_video(p, max_bytes=max_bytes),
+                             paths))
+
+
+def format_probe(info):
+    # Convert a `probe_video()` result into the strings shown in the
+    # `Duration`, `Resolution` and `Codec` columns.
+    duration = ""
+    if info["duration"]:
+        secs = int(round(info["duration"]))
+        duration = f"{secs // 3600}:{secs % 3600 // 60:02d}:{secs % 60:02d}"
+    resolution = ""
+    if info["width"] and info["height"]:
+        resolution = f"{info['width']}x{info['height']}"
+    return duration, resolution, info["codec"] or ""
+
+
+class _map_region:
+    # Context manager that memory-maps `length` bytes of `f` starting
+    # at `offset`. mmap offsets must be aligned to the allocation
+    # granularity so the slack is mapped too and sliced off again.
+    def __init__(self, f, offset, length):
+        self.f = f
+        self.offset = offset
+        self.length = length
+        self.mm = None
+        self.view = None
+
+    def __enter__(self):
+        if self.length <= 0:
+            raise ValueError("Nothing to map.")
+        aligned = self.offset - self.offset % mmap.ALLOCATIONGRANULARITY
+        slack = self.offset - aligned
+        self.mm = mmap.mmap(self.f.fileno(), self.length + slack,
+                            access=mmap.ACCESS_READ, offset=aligned)
+        self.view = memoryview(self.mm)[slack:]
+        return self.view
+
+    def __exit__(self, *exc):
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            # A slice of the view is still alive, e.g. in the traceback
+            # of a parse error. The map is closed when it's collected.
+            pass
+
+
+def _find_mp4_moov(f, size):
+    # Step over the top-level boxes reading only their headers and
+    # return the (offset, length) of the `moov` box.
+    offset = 0
+    for _ in range(_MAX_TOP_LEVEL_BOXES):
+        if offset + 8 > size:
+            return None
+        f.seek(offset)
+        header = f.read(16)
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = size - offset
+        if box_size < header_size:
+            return None
+        if box_type == b"moov":
+            return offset, min(box_size, size - offset)
+        offset += box_size
+    return None
+
+
+def _iter_boxes(buf, start, end):
+    # Yield (type, payload_start, payload_end) of the MP4 boxes
+    # between `start` and `end`.
+    pos = start
+    while pos + 8 <= end:
+        box_size, box_type = struct.unpack_from(">I4s", buf, pos)
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = end - pos
+        if box_size < header_size:
+            return
+        yield bytes(box_type), pos + header_size, min(pos + box_size, end)
+        pos += box_size
+
+
+def _parse_mp4_moov(buf, info):
+    for box_type, start, end in _iter_boxes(buf, 8, len(buf)):
+        if box_type == b"mvhd":
+            version = buf[start]
+            if version == 1:
+                timescale, duration = struct.unpack_from(">IQ", buf, start + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", buf, start + 12)
+            if timescale:
+                info["duration"] = duration / timescale
+        elif box_type == b"trak" and info["codec"] is None:
+            _parse_mp4_trak(buf, start, end, info)
+
+
+def _parse_mp4_trak(buf, start, end, info):
+    # Descend trak > mdia > (hdlr, minf > stbl > stsd) and keep the
+    # sample entry of the first video track.
+    for box_type, s, e in _iter_boxes(buf, start, end):
+        if box_type != b"mdia":
+            continue
+        handler = None
+        stsd = None
+        for sub_type, ss, se in _iter_boxes(buf, s, e):
+            if sub_type == b"hdlr":
+                handler = bytes(buf[ss + 8:ss + 12])
+            elif sub_type == b"minf":
+                for minf_type, ms, me in _iter_boxes(buf, ss, se):
+                    if minf_type != b"stbl":
+                        continue
+                    for stbl_type, ts, te in _iter_boxes(buf, ms, me):
+                        if stbl_type == b"stsd":
+                            stsd = ts
+        if handler == b"vide" and stsd is not None:
+            # Skip version/flags, entry count and the entry size.
+            entry = stsd + 8
+            info["codec"] = bytes(buf[entry + 4:entry + 8]).decode(
+                "latin-1").strip()
+            width, height = struct.unpack_from(">HH", buf, entry + 32)
+            info["width"], info["height"] = width, height
+
+
+def _read_vint(buf, pos, keep_marker=False):
+    # Read an EBML variable length integer. Element ids keep their
+    # marker bits, element sizes don't. Returns (value, length);
+    # unknown sizes are returned as None.
+    first = buf[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML integer.")
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = value == mask - 1
+    for i in range(1, length):
+        byte = buf[pos + i]
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        return None, length
+    return value, length
+
+
+def _iter_ebml(buf, start, end):
+    # Yield (id, data_start, data_end) of the EBML elements between
+    # `start` and `end`. Elements with an unknown size extend to `end`.
+    pos = start
+    while pos < end:
+        element_id, id_len = _read_vint(buf, pos, keep_marker=True)
+        size, size_len = _read_vint(buf, pos + id_len)
+        data_start = pos + id_len + size_len
+        data_end = end if size is None else min(data_start + size, end)
+        yield element_id, data_start, data_end
+        if element_id == _CLUSTER:
+            return
+        pos = data_end
+
+
+def _ebml_uint(buf, start, end):
+    return int.from_bytes(bytes(buf[start:end]), "big")
+
+
+def _parse_matroska(buf, info):
+    scale = 1000000
+    duration = None
+    for element_id, start, end in _iter_ebml(buf, 0, len(buf)):
+        if element_id != _SEGMENT:
+            continue
+        for seg_id, s, e in _iter_ebml(buf, start, end):
+            if seg_id == _INFO:
+                for info_id, is_, ie in _iter_ebml(buf, s, e):
+                    if info_id == _TIMESTAMP_SCALE:
+                        scale = _ebml_uint(buf, is_, ie)
+                    elif info_id == _DURATION:
+                        fmt = ">f" if ie - is_ == 4 else ">d"
+                        duration = struct.unpack_from(fmt, buf, is_)[0]
+            elif seg_id == _TRACKS:
+                for track_id, ts, te in _iter_ebml(buf, s, e):
+                    if track_id == _TRACK_ENTRY and info["codec"] is None:
+                        _parse_matroska_track(buf, ts, te, info)
+            elif seg_id == _CLUSTER:
+                break
+    if duration is not None:
+        info["duration"] = duration * scale / 1e9
+
+
+def _parse_matroska_track(buf, start, end, info):
+    track_type = codec = width = height = None
+    for element_id, s, e in _iter_ebml(buf, start, end):
+        if element_id == _TRACK_TYPE:
+            track_type = _ebml_uint(buf, s, e)
+        elif element_id == _CODEC_ID:
+            codec = bytes(buf[s:e]).decode("ascii", "replace").rstrip("\x00")
+        elif element_id == _VIDEO:
+            for video_id, vs, ve in _iter_ebml(buf, s, e):
+                if video_id == _PIXEL_WIDTH:
+                    width = _ebml_uint(buf, vs, ve)
+                elif video_id == _PIXEL_HEIGHT:
+                    height = _ebml_uint(buf, vs, ve)
+    if track_type == 1:
+        info["codec"] = codec
+        info["width"], info["height"] = width, height
+
+
+def _iter_riff(buf, start, end):
+    # Yield (fourcc, list_type, data_start, data_end) of RIFF chunks.
+    # `list_type` is only set for LIST chunks.
+    pos = start
+    while pos + 8 <= end:
+        fourcc, size = struct.unpack_from("<4sI", buf, pos)
+        data_start = pos + 8
+        data_end = min(data_start + size, end)
+        if fourcc == b"LIST":
+            yield fourcc, bytes(buf[data_start:data_start + 4]), \
+                data_start + 4, data_end
+        else:
+            yield fourcc, None, data_start, data_end
+        # Chunks are padded to an even size.
+        pos = data_start + size + (size & 1)
+
+
+def _parse_avi(buf, info):
+    for fourcc, list_type, start, end in _iter_riff(buf, 12, len(buf)):
+        if list_type != b"hdrl":
+            if list_type == b"movi":
+                return
+            continue
+        for sub, sub_list, s, e in _iter_riff(buf, start, end):
+            if sub == b"avih":
+                usec_per_frame, = struct.unpack_from("<I", buf, s)
+                total_frames, = struct.unpack_from("<I", buf, s + 16)
+                width, height = struct.unpack_from("<II", buf, s + 32)
+                info["duration"] = usec_per_frame * total_frames / 1e6
+                info["width"], info["height"] = width, height
+            elif sub_list == b"strl" and info["codec"] is None:
+                for chunk, _, cs, _ in _iter_riff(buf, s, e):
+                    if chunk == b"strh" and bytes(buf[cs:cs + 4]) == b"vids":
+                        info["codec"] = bytes(buf[cs + 4:cs + 8]).decode(
+                            "latin-1").strip("\x00 ")
+        return
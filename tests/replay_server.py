@@ -0,0 +1,383 @@
+"""
+Local stand-in for TMDB serving a corpus of recorded pages, so the
+scraper can be tested and benchmarked without network access.
+
+The corpus is a directory of html files with an `index.json` mapping
+every request path (with its query string) to a file. `build_corpus()`
+writes pages in the TMDB markup, including very long seasons, and
+`--record` fills a corpus with pages fetched from the real site.
+
+Usage:
+    python tests/replay_server.py build tests/corpus
+    python tests/replay_server.py serve tests/corpus --latency 0.05
+    python tests/replay_server.py serve tests/corpus \\
+        --record https://www.themoviedb.org
+
+    MEDIAFILETOOLS_TMDB_URL=http://127.0.0.1:8766 python my_script.py
+    MEDIAFILETOOLS_TMDB_API_URL=http://127.0.0.1:8766/3 python my_script.py
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlencode
+
+
+# (show id, name, year, episodes of every season)
+SHOWS = [
+    ("1400", "Some Show", "1989", [5, 12, 22, 24]),
+    ("1401", "Some Show", "2015", [8]),
+    ("7317", "Other Show", "2004", [10, 10, 10]),
+    # Very long seasons, like daily shows and soaps.
+    ("9000", "Long Show", "1999", [250, 1000]),
+]
+
+# Markup around the episode cards, roughly the size of a real page.
+_HEAD = (
+    "<head><meta charset='utf-8'><title>{name}: Season {season} "
+    "&#8212; The Movie Database (TMDB)</title>"
+    + "".join(f"<link rel='stylesheet' href='/assets/{i}.css'>"
+              for i in range(10))
+    + "<script>" + "var x = 1;" * 200 + "</script></head>"
+)
+_NAV = ("<header><nav><ul>"
+        + "".join(f"<li><a href='/menu/{i}'>Menu {i}</a></li>"
+                  for i in range(40))
+        + "</ul></nav></header>")
+_FOOTER = ("<footer>"
+           + "".join(f"<div class='column'><h3>Links {i}</h3><ul>"
+                     + "".join(f"<li><a href='/f/{i}/{j}'>{j}</a></li>"
+                               for j in range(8))
+                     + "</ul></div>" for i in range(5))
+           + "</footer>")
+
+
+def season_page(name, season, episodes, last=False):
+    # A season page in the TMDB markup read by `_extract_card`.
+    cards = "".join(
+        f'<div class="card"><div class="episode closed">'
+        f'<div class="image"><a class="no_click open" '
+        f'data-episode-number="{ep}" data-season-number="{season}" '
+        f'href="#"><img loading="lazy" src="/t/{season}/{ep}.jpg" '
+        f'alt="Episode {ep}"></a></div>'
+        f'<div class="info"><div class="title"><div class="wrapper">'
+        f'<span class="episode_number">{ep}</span>'
+        f'<div class="episode_title"><h3><a class="no_click open" '
+        f'href="#">{name} S{season:02d}E{ep:02d}</a></h3></div></div>'
+        f'<div class="date"><span class="date">'
+        f'{time.strftime("%B %d, %Y", time.gmtime(ep * 86400))}</span>'
+        f'<span class="runtime">45m</span></div></div>'
+        f'<div class="overview"><p>Episode {ep} of season {season}. '
+        f'{"A long plot summary. " * 4}</p></div></div></div>'
+        f'<div class="expanded_info"></div></div>'
+        for ep in range(1, episodes + 1)
+    )
+    nav = "" if last else (
+        f'<a class="right" alt="Next Season" '
+        f'href="/season/{season + 1}">Season {season + 1}</a>')
+    return (f"<!DOCTYPE html><html>{_HEAD.format(name=name, season=season)}"
+            f"<body>{_NAV}<main><section class='episode_list'>{cards}"
+            f"</section><div class='season_nav'>{nav}</div></main>"
+            f"{_FOOTER}</body></html>")
+
+
+def seasons_page(show_id, name, seasons, specials=True):
+    # The overview page listing every season of a show.
+    numbers = ([0] if specials else []) + list(range(1, len(seasons) + 1))
+    entries = "".join(
+        f'<div class="season_wrapper"><section><div class="season">'
+        f'<div class="flex"><a href="/tv/{show_id}/season/{season}">'
+        f'<img src="/s/{show_id}/{season}.jpg" alt="{name}"></a>'
+        f'<div class="content"><div><h2><a href="/tv/{show_id}/season/'
+        f'{season}">{"Specials" if season == 0 else f"Season {season}"}'
+        f'</a></h2><h4>{episodes} Episodes</h4></div>'
+        f'<div class="season_overview"><p>{"An overview. " * 5}</p></div>'
+        f'</div></div></div></section></div>'
+        for season, episodes in zip(numbers, ([3] if specials else [])
+                                    + list(seasons))
+    )
+    return (f"<!DOCTYPE html><html>{_HEAD.format(name=name, season='s')}"
+            f"<body>{_NAV}<main><a href='/tv/{show_id}'>Back to main</a>"
+            f"{entries}</main>{_FOOTER}</body></html>")
+
+
+def search_page(results):
+    # A search results page of (show id, name, year).
+    posters = "".join(
+        f'<div class="card v4 tight"><div class="image"><div class="poster">'
+        f'<a class="result" href="/tv/{show_id}">'
+        f'<img src="/p/{show_id}.jpg" alt="{name}"></a></div></div>'
+        f'<div class="details"><h2>{name}</h2>'
+        f'<span class="release_date">{year}</span></div></div>'
+        for show_id, name, year in results
+    )
+    return (f"<!DOCTYPE html><html><head><title>Search</title></head>"
+            f"<body>{_NAV}<main>{posters}</main>{_FOOTER}</body></html>")
+
+
+def search_path(name, year=None):
+    # The request path of `_search_url()`.
+    year = "" if year is None else "%20y%3A" + year
+    return f"/search?query={name.replace(' ', '%20')}{year}"
+
+
+def api_show(show_id, name, year, seasons):
+    # The TMDB API details of a show, `/3/tv/<id>`.
+    return json.dumps({
+        "id": int(show_id), "name": name, "first_air_date": f"{year}-01-01",
+        "overview": "An overview. " * 5, "number_of_seasons": len(seasons),
+        "seasons": [{"season_number": season, "episode_count": episodes,
+                     "name": "Specials" if season == 0 else f"Season {season}"}
+                    for season, episodes in zip(range(len(seasons) + 1),
+                                                [3] + list(seasons))],
+    })
+
+
+def api_season(name, season, episodes):
+    # The TMDB API season, `/3/tv/<id>/season/<n>`, with the same
+    # episodes as `season_page()`.
+    return json.dumps({
+        "season_number": season, "name": f"Season {season}",
+        "episodes": [{
+            "episode_number": ep, "season_number": season,
+            "name": f"{name} S{season:02d}E{ep:02d}",
+            "air_date": time.strftime("%Y-%m-%d", time.gmtime(ep * 86400)),
+            "overview": f"Episode {ep} of season {season}. "
+                        f"{'A long plot summary. ' * 4}",
+            "runtime": 45, "still_path": f"/t/{season}/{ep}.jpg",
+        } for ep in range(1, episodes + 1)],
+    })
+
+
+def api_search(results):
+    # The TMDB API search results of (show id, name, year).
+    return json.dumps({"page": 1, "results": [
+        {"id": int(show_id), "name": name, "first_air_date": f"{year}-01-01"}
+        for show_id, name, year in results]})
+
+
+def api_search_path(name, year=None):
+    # The request path of `TMDBAPIProvider.search_url()` without a key.
+    params = {"query": name}
+    if year is not None:
+        params["first_air_date_year"] = year
+    return f"/3/search/tv?{urlencode(params, quote_via=quote)}"
+
+
+def build_corpus(corpus_dir, shows=SHOWS):
+    """
+    Write the season and overview pages of `shows` and the search
+    pages of their names to `corpus_dir`, and the same data as TMDB
+    API responses under `/3`. Returns the index.
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    index = {}
+
+    def _write(path, page):
+        ext = ".json" if path.startswith("/3/") else ".html"
+        f_name = quote(path.strip("/"), safe="") + ext
+        with open(os.path.join(corpus_dir, f_name), "w",
+                  encoding="utf-8") as f:
+            f.write(page)
+        index[path] = f_name
+
+    names = {}
+    for show_id, name, year, seasons in shows:
+        names.setdefault(name, []).append((show_id, name, year))
+        _write(search_path(name, year), search_page([(show_id, name, year)]))
+        _write(api_search_path(name, year), api_search([(show_id, name, year)]))
+        _write(f"/tv/{show_id}/seasons", seasons_page(show_id, name, seasons))
+        _write(f"/3/tv/{show_id}", api_show(show_id, name, year, seasons))
+        for season, episodes in enumerate(seasons, 1):
+            _write(f"/tv/{show_id}/season/{season}",
+                   season_page(name, season, episodes,
+                               last=season == len(seasons)))
+            _write(f"/3/tv/{show_id}/season/{season}",
+                   api_season(name, season, episodes))
+    for name, results in names.items():
+        _write(search_path(name), search_page(results))
+        _write(api_search_path(name), api_search(results))
+    _save_index(corpus_dir, index)
+    return index
+
+
+def load_index(corpus_dir):
+    try:
+        with open(os.path.join(corpus_dir, "index.json"),
+                  encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_index(corpus_dir, index):
+    with open(os.path.join(corpus_dir, "index.json"), "w",
+              encoding="utf-8") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+
+
+class ReplayServer:
+    """
+    HTTP server replaying the pages of a corpus.
+
+    Example:
+        with ReplayServer("tests/corpus", latency=0.05) as server:
+            series_details.TMDB_URL = server.url
+            make_seriesdb(series_id="1400")
+
+    Parameters
+    ----------
+    corpus_dir: str
+        The corpus directory.
+    latency: float, default 0
+        Seconds every response is delayed by.
+    jitter: float, default 0
+        Up to this many seconds are randomly added to `latency`.
+    error_rate: float, default 0
+        The fraction of requests answered with `error_status`.
+    error_status: int, default 503
+        The status code of the injected errors.
+    fail_first: int, default 0
+        Answer the first `fail_first` requests of every path with
+        `error_status`, for deterministic retry tests.
+    record: str, optional
+        Base url of the real site. Paths missing from the corpus
+        are fetched from it and added to the corpus.
+    seed: int, optional
+        Seed of the latency and error randomness.
+    """
+    def __init__(self, corpus_dir, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=503, fail_first=0, record=None, seed=None,
+                 host="127.0.0.1", port=0):
+        self.corpus_dir = corpus_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_first = fail_first
+        self.record = record.rstrip("/") if record else None
+        self.index = load_index(corpus_dir)
+        self.requests = 0
+        self.errors = 0
+        self._seen = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        handler = type("ReplayHandler", (_ReplayHandler,), {"replay": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _respond(self, path):
+        # Returns (status, body) of a request.
+        with self._lock:
+            self.requests += 1
+            seen = self._seen[path] = self._seen.get(path, 0) + 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = (seen <= self.fail_first
+                    or self._random.random() < self.error_rate)
+            if fail:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self.error_status, b""
+        f_name = self.index.get(path)
+        if f_name is None and self.record:
+            return self._record(path)
+        if f_name is None:
+            return 404, b""
+        with open(os.path.join(self.corpus_dir, f_name), "rb") as f:
+            return 200, f.read()
+
+    def _record(self, path):
+        # Fetch a page from the real site and add it to the corpus.
+        from mediafiletools.series_details import _get_session
+
+        response = _get_session().get(self.record + path)
+        if response.status_code != 200:
+            return response.status_code, b""
+        f_name = quote(path.strip("/"), safe="") + ".html"
+        with open(os.path.join(self.corpus_dir, f_name), "wb") as f:
+            f.write(response.content)
+        with self._lock:
+            self.index[path] = f_name
+            _save_index(self.corpus_dir, self.index)
+        return 200, response.content
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    replay = None
+
+    def do_GET(self):
+        status, body = self.replay._respond(self.path)
+        self.send_response(status)
+        f_name = self.replay.index.get(self.path, "")
+        self.send_header("Content-Type", "application/json" if
+                         f_name.endswith(".json") else
+                         "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Write the corpus.")
+    build.add_argument("corpus")
+    serve = commands.add_parser("serve", help="Serve a corpus.")
+    serve.add_argument("corpus")
+    serve.add_argument("--port", type=int, default=8766)
+    serve.add_argument("--latency", type=float, default=0.0)
+    serve.add_argument("--jitter", type=float, default=0.0)
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    serve.add_argument("--error-status", type=int, default=503)
+    serve.add_argument("--record", help="Record missing pages from this url.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"{len(build_corpus(args.corpus))} pages written to "
+              f"{args.corpus}")
+        return
+    server = ReplayServer(args.corpus, latency=args.latency,
+                          jitter=args.jitter, error_rate=args.error_rate,
+                          error_status=args.error_status, record=args.record,
+                          port=args.port)
+    print(f"Replaying {args.corpus} on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,31 @@
 import ast
+import json
 import os
 import shutil
 import re
+import struct
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pandas as pd
 import pytest
 
 from bs4 import BeautifulSoup
+from mediafiletools import series_details
 from mediafiletools.series_details import make_seriesdb, rename_episodes, _extract_data
 from mediafiletools.movie_sort_to_df import make_moviedb
+from mediafiletools.find_movie_dupes import find_movie_dupes
+from mediafiletools.catalog_server import Catalog, make_catalog_server
+from mediafiletools.search_index import MovieIndex
+from mediafiletools.http_cache import ResponseCache, set_http_cache
 from mediafiletools.find_music_dupes import find_music_dupes
-from mediafiletools.common import normalize_ld, _print_file_loc
+from mediafiletools.common import (normalize_ld, _print_file_loc,
+                                   save_to_file, stream_to_file)
+from mediafiletools.video_probe import probe_video
 
 
 @pytest.fixture
@@ -743,3 +758,1120 @@ def test_print_file_loc(capfd):
     _print_file_loc('txt', r'\home\user\filename.txt', 'example')
     loc_print = capfd.readouterr()
     assert loc_print.out == "\ntxt file located in: \\home\\user\\filename.txt\n"
+
+
+def _box(box_type, payload):
+    # Build an MP4 box.
+    return struct.pack(">I4s", len(payload) + 8, box_type) + payload
+
+
+def _ebml(element_id, payload):
+    # Build an EBML element with a 8 byte size field.
+    return element_id + b"\x01" + len(payload).to_bytes(7, "big") + payload
+
+
+def test_probe_video(monkeypatch, tmp_path):
+    # MP4 with the `moov` box after `mdat`.
+    mvhd = _box(b"mvhd", bytes(4) + struct.pack(">IIII", 0, 0, 1000, 5400000))
+    hdlr = _box(b"hdlr", bytes(8) + b"vide" + bytes(12))
+    entry = struct.pack(">I4s", 86, b"avc1") + bytes(24) \
+        + struct.pack(">HH", 1920, 1080) + bytes(50)
+    stsd = _box(b"stsd", bytes(4) + struct.pack(">I", 1) + entry)
+    minf = _box(b"minf", _box(b"stbl", stsd))
+    trak = _box(b"trak", _box(b"mdia", hdlr + minf))
+    mp4 = _box(b"ftyp", b"isom" + bytes(4)) + _box(b"mdat", bytes(100)) \
+        + _box(b"moov", mvhd + trak)
+    mp4_path = tmp_path / "movie.mp4"
+    mp4_path.write_bytes(mp4)
+    assert probe_video(str(mp4_path)) == {"duration": 5400.0, "width": 1920,
+                                          "height": 1080, "codec": "avc1"}
+    # The `moov` box is never read past `max_bytes`.
+    assert probe_video(str(mp4_path), max_bytes=16)["codec"] is None
+
+    # Matroska.
+    video = _ebml(b"\xe0", _ebml(b"\xb0", b"\x05\x00") + _ebml(b"\xba", b"\x02\xd0"))
+    track = _ebml(b"\xae", _ebml(b"\x83", b"\x01")
+                  + _ebml(b"\x86", b"V_MPEGH/ISO/HEVC") + video)
+    info = _ebml(b"\x2a\xd7\xb1", b"\x0f\x42\x40") \
+        + _ebml(b"\x44\x89", struct.pack(">d", 6000000.0))
+    segment = _ebml(b"\x18\x53\x80\x67", _ebml(b"\x15\x49\xa9\x66", info)
+                    + _ebml(b"\x16\x54\xae\x6b", track))
+    mkv_path = tmp_path / "movie.mkv"
+    mkv_path.write_bytes(_ebml(b"\x1a\x45\xdf\xa3", b"") + segment)
+    assert probe_video(str(mkv_path)) == {"duration": 6000.0, "width": 1280,
+                                          "height": 720,
+                                          "codec": "V_MPEGH/ISO/HEVC"}
+
+    # Empty files have no metadata.
+    empty = tmp_path / "empty.avi"
+    empty.write_bytes(b"")
+    assert probe_video(str(empty))["duration"] is None
+
+    # A parse error holding a slice of the map doesn't escape.
+    from mediafiletools import video_probe
+
+    kept = []
+
+    def bad_parse(buf, info):
+        kept.append(buf[:4])
+        raise IndexError("truncated")
+
+    monkeypatch.setattr(video_probe, "_parse_matroska", bad_parse)
+    assert probe_video(str(mkv_path))["duration"] is None
+
+
+def test_movies_dataframe_probe(request, tmp_path):
+    actual_files_dir, movies_dir = path_to_test_module(request,
+                                                       'actual_files',
+                                                       'dummy_movies')
+    actual_probe_csv = os.path.join(actual_files_dir, "actual_probe.csv")
+    make_moviedb(movies_dir,
+                 filepath=str(actual_probe_csv),
+                 output_type='csv',
+                 probe=True)
+    df = pd.read_csv(actual_probe_csv)
+    assert list(df.columns) == ["A - Z", "Movie", "Duration",
+                                "Resolution", "Codec"]
+
+
+def test_movies_folder_probe(monkeypatch, tmp_path):
+    # Only the videos of the root folder are probed and counted, the
+    # other files are still listed as uncategorized.
+    from mediafiletools import movie_sort_to_df
+
+    movies_dir = tmp_path / "movies"
+    (movies_dir / "Die Hard").mkdir(parents=True)
+    for name in ("Die Hard 1988.mkv", "Die Hard 2 1990.mkv"):
+        (movies_dir / "Die Hard" / name).write_bytes(b"")
+    for name in ("Heat 1995.mkv", "Heat 1995.srt", "movie.nfo"):
+        (movies_dir / name).write_bytes(b"")
+    probed = []
+    probe_videos = movie_sort_to_df.probe_videos
+    monkeypatch.setattr(movie_sort_to_df, "probe_videos",
+                        lambda paths, **kwargs: probed.extend(paths)
+                        or probe_videos(paths, **kwargs))
+    metrics_dir = tmp_path / "metrics"
+    make_moviedb(str(movies_dir), filepath=str(tmp_path / "db.csv"),
+                 sort_type="folder", probe=True, metrics=str(metrics_dir))
+    assert sorted(os.path.basename(p) for p in probed) == [
+        "Die Hard 1988.mkv", "Die Hard 2 1990.mkv", "Heat 1995.mkv"]
+    samples = read_prom(metrics_dir / "mediafiletools_make_moviedb.prom")
+    assert samples['mediafiletools_files_scanned{entry="make_moviedb"}'] == 3
+    df = pd.read_csv(tmp_path / "db.csv")
+    assert list(df["Movie"].dropna()) == ["Die Hard 1988", "Die Hard 2 1990",
+                                          "Heat 1995", "Heat 1995.srt",
+                                          "Movie.nfo"]
+
+
+def test_movie_dupes(tmp_path):
+    movies_dir = tmp_path / "movies"
+    (movies_dir / "HD").mkdir(parents=True)
+    (movies_dir / "Blazing Saddles 1974.avi").write_bytes(b"0" * 10)
+    (movies_dir / "HD" / "Blazing.Saddles.1974.1080p.BluRay.mkv").write_bytes(b"0" * 20)
+    (movies_dir / "HD" / "Blazing Sadles (1974).mp4").write_bytes(b"0" * 5)
+    (movies_dir / "Cliffhanger 1993.mp4").write_bytes(b"")
+    (movies_dir / "Cliffhanger 1993.srt").write_bytes(b"")
+    actual_csv = str(tmp_path / "dupes.csv")
+
+    find_movie_dupes(str(movies_dir), filepath=actual_csv)
+    df = pd.read_csv(actual_csv, keep_default_na=False)
+    assert list(df["Release"]) == ["", "Blazing.Saddles.1974.1080p.BluRay.mkv",
+                                   "Blazing Saddles 1974.avi"]
+    assert list(df["Size"]) == ["", "20 B", "10 B"]
+
+    # Fuzzy matching inside the 1974 bucket picks up the typo.
+    find_movie_dupes(str(movies_dir), filepath=actual_csv, distance=0.08)
+    df = pd.read_csv(actual_csv, keep_default_na=False)
+    assert len(df) == 4
+    assert df["Movie"][1] == "Blazing Saddles 1974"
+
+
+def test_stream_to_file(tmp_path):
+    # The streaming writers produce the same files as `save_to_file`.
+    rows = [("", ""), ("A", "Airplane! 1980"), ("", "Alien (1979)"),
+            ("", ""), ("B", "Blazing Saddles, 1974"), ("", "Brazil [1985]")]
+    columns = ["A - Z", "Movie"]
+    for output_type in ("txt", "csv"):
+        expected = tmp_path / f"expected.{output_type}"
+        save_to_file(pd.DataFrame(rows, columns=columns),
+                     filepath=str(expected), output_type=output_type)
+        # Both a list and a one-shot iterator of rows.
+        for source in (rows, iter(rows)):
+            actual = tmp_path / f"actual.{output_type}"
+            stream_to_file(source, columns, filepath=str(actual),
+                           output_type=output_type)
+            assert actual.read_bytes() == expected.read_bytes()
+
+
+def test_lazy_import():
+    # Importing the package or `make_moviedb` must not pull in the
+    # heavy dependencies or touch the file system.
+    heavy = ("pandas", "bs4", "requests", "tinytag", "Levenshtein", "tabulate")
+    code = ("import sys; import mediafiletools; "
+            "from mediafiletools import make_moviedb; "
+            f"print([m for m in {heavy!r} if m in sys.modules])")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.getcwd(),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+    # Functions named like their module stay functions once the module
+    # is imported.
+    code = ("import mediafiletools.find_music_dupes; "
+            "from mediafiletools import Catalog, find_movie_dupes; "
+            "import mediafiletools; "
+            "print(callable(mediafiletools.find_music_dupes), "
+            "callable(find_movie_dupes))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.getcwd(),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "True True"
+
+
+def test_catalog_server(request, monkeypatch, tmp_path):
+    movies_dir = tmp_path / "movies"
+    (movies_dir / "Die Hard Series").mkdir(parents=True)
+    (movies_dir / "Die Hard Series" / "Die.Hard.1988.720p.mp4").write_bytes(b"")
+    (movies_dir / "Cliffhanger 1993.mkv").write_bytes(b"")
+    _, musicdir = path_to_test_module(request, 'actual_dupe_files',
+                                      'dummy_music')
+    catalog = Catalog([str(movies_dir)], [os.path.join(musicdir, 'perfect-match-mp3')])
+    assert catalog.refresh()
+    assert catalog.lookup("die hard")[0]["movie"] == "Die Hard 1988"
+    assert catalog.lookup("Die.Hard.1988.1080p.mkv")[0]["movie"] == "Die Hard 1988"
+    assert catalog.lookup("Die.Hard.1988.720p")[0]["movie"] == "Die Hard 1988"
+    assert catalog.lookup("Die Hard 1990") == []
+    assert catalog.letter("c") == ["Cliffhanger 1993"]
+    assert len(catalog.dupes("music")) == 1
+
+    # Nothing changed on disk, the songs aren't matched again.
+    music_module = sys.modules["mediafiletools.find_music_dupes"]
+    matches = []
+    match_songs = music_module._match_songs
+    monkeypatch.setattr(music_module, "_match_songs",
+                        lambda *a, **k: matches.append(1)
+                        or match_songs(*a, **k))
+    assert not catalog.refresh()
+    assert matches == []
+    # A file edited in place doesn't change its folder's mtime.
+    song_dir = os.path.join(musicdir, 'perfect-match-mp3')
+    song = os.path.join(song_dir, sorted(os.listdir(song_dir))[0])
+    folder_mtime = os.stat(song_dir).st_mtime_ns
+    os.utime(song, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert os.stat(song_dir).st_mtime_ns == folder_mtime
+    assert catalog.refresh()
+    assert matches == [1]
+    (movies_dir / "Die Hard Series" / "Die Hard 1988 1080p.mkv").write_bytes(b"")
+    assert catalog.refresh()
+    assert len(catalog.dupes("movies")[0]) == 2
+
+    server = make_catalog_server(catalog, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/letter/D"
+        with urllib.request.urlopen(url) as response:
+            body = json.loads(response.read())
+        assert body["movies"] == ["Die Hard 1988", "Die Hard 1988"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_catalog_symlink_loop(tmp_path):
+    # Links back to a parent folder aren't followed.
+    movies_dir = tmp_path / "movies"
+    for name in ("A", "B"):
+        (movies_dir / name).mkdir(parents=True)
+        try:
+            os.symlink("..", movies_dir / name / "up",
+                       target_is_directory=True)
+        except OSError:
+            pytest.skip("symlinks aren't supported")
+    (movies_dir / "A" / "Heat 1995.mkv").write_bytes(b"")
+    catalog = Catalog([str(movies_dir)], [])
+    assert catalog.refresh()
+    assert catalog.letter("h") == ["Heat 1995"]
+
+
+def test_search_index(request, tmp_path):
+    _, movies_dir = path_to_test_module(request, 'actual_files', 'dummy_movies')
+    index = MovieIndex.from_dir(movies_dir, strip=True)
+    assert index.prefix("die hard") == ["Die Hard 1988",
+                                        "Die Hard 2-Die Harder[1990]",
+                                        "Die Hard-With A Vengeance[1995]"]
+    assert index.prefix("nightmare")[0] == "Nightmare on elm st"
+    assert index.prefix("zz") == []
+    # `limit` keeps the first titles, punctuation included.
+    titles = MovieIndex(["Alien: Covenant (2017)", "Alien 3 (1992)",
+                         "Alien (1979)", "Aliens (1986)", "Alien!"])
+    assert titles.prefix("alien", limit=2) == ["Alien (1979)",
+                                               "Alien 3 (1992)"]
+    assert titles.prefix("alien", limit=3) == titles.prefix("alien")[:3]
+    assert MovieIndex(["Up!", "Up (2009)"]).prefix("up", limit=1) == \
+        ["Up (2009)"]
+    assert index.search("Blazing Sadles 1974") == ["Blazing Saddles 1974"]
+    assert index.search("Cliffhangr")[0] == "Cliffhanger"
+
+    # A saved index answers the same without rebuilding.
+    index_file = str(tmp_path / "movies.index.json")
+    index.save(index_file)
+    loaded = MovieIndex.load(index_file)
+    assert loaded.prefix("die hard") == index.prefix("die hard")
+    assert loaded.search("young guns ii") == index.search("young guns ii")
+
+    make_moviedb(movies_dir, filepath=str(tmp_path / "db.csv"),
+                 search_index=True)
+    assert len(MovieIndex.load(str(tmp_path / "db.index.json"))) == len(index)
+
+
+def tmdb_season_page(season, episodes, last=False):
+    # A minimal TMDB season page.
+    cards = "".join(
+        f'<div class="card"><a class="no_click open" '
+        f'data-episode-number="{ep}" data-season-number="{season}"></a>'
+        f'<h3>S{season:02d}E{ep:02d} title</h3>'
+        f'<div class="date"><span class="date">Jan {ep}, 2008</span></div>'
+        f'<p>Plot of episode {ep}.</p></div>'
+        for ep in range(1, episodes + 1)
+    )
+    nav = "" if last else '<a alt="Next Season" href="#">Next</a>'
+    return (f"<html><head><title>Some Show: Season {season}</title></head>"
+            f"<body>{cards}{nav}</body></html>")
+
+
+def test_concurrent_season_fetch(monkeypatch, tmp_path):
+    # Seasons are fetched concurrently but keep their order.
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_fetch(url, id_name="IMDB ID"):
+        if url.endswith("/seasons"):
+            # The overview lists the specials and seasons 1 to 6.
+            return "".join(f'<a href="/tv/7317/season/{s}">Season {s}</a>'
+                           for s in range(7))
+        season = int(url.rsplit("/", 1)[1])
+        with lock:
+            in_flight.append(season)
+            peak.append(len(in_flight))
+        # Later seasons finish first.
+        time.sleep(0.05 / season)
+        with lock:
+            in_flight.remove(season)
+        return tmdb_season_page(season, 3, last=season == 6)
+
+    monkeypatch.setattr(series_details, "_fetch_page", fake_fetch)
+    rows = make_seriesdb(series_id="7317", start=2, end=6, from_write_ep=True,
+                         max_workers=3)
+    assert [(r[0], r[1]) for r in rows] == \
+        [(s, str(e)) for s in range(2, 7) for e in range(1, 4)]
+    assert max(peak) == 3
+
+    # Without `end` the seasons are read from the overview page
+    # and also fetched concurrently.
+    peak.clear()
+    actual_csv = str(tmp_path / "show.csv")
+    make_seriesdb(series_id="7317", start=2, filepath=actual_csv)
+    df = pd.read_csv(actual_csv)
+    assert list(df["Season"].unique()) == [2, 3, 4, 5, 6]
+    assert df["Title"][0] == "S02E01 title"
+    assert max(peak) > 1
+
+    # `final` stops after the first season, like when probing.
+    peak.clear()
+    rows = make_seriesdb(series_id="7317", start=2, final=True,
+                         from_write_ep=True)
+    assert {r[0] for r in rows} == {2}
+    assert len(peak) == 1
+
+    # If there's no overview page, seasons are probed until the last one.
+    def no_overview(url, id_name="IMDB ID"):
+        if url.endswith("/seasons"):
+            raise series_details.HTTPStatusError(url, 404, "Not Found")
+        return fake_fetch(url, id_name)
+
+    monkeypatch.setattr(series_details, "_fetch_page", no_overview)
+    make_seriesdb(series_id="7317", filepath=actual_csv)
+    df = pd.read_csv(actual_csv)
+    assert list(df["Season"].unique()) == [1, 2, 3, 4, 5, 6]
+    assert df["Title"][0] == "S01E01 title"
+
+
+class _EtagHandler(BaseHTTPRequestHandler):
+    # Serves one page with an ETag and counts the requests.
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"page {self.path}".encode()
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_connection_pool(monkeypatch, tmp_path, caplog):
+    # The pool keeps a connection for every worker of a bulk run.
+    import logging
+    from mediafiletools import make_seriesdb_many
+    from tests.replay_server import SHOWS, ReplayServer, build_corpus
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    with ReplayServer(corpus, latency=0.02) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        with caplog.at_level(logging.WARNING, logger="urllib3"):
+            make_seriesdb_many([{"series_id": show[0]} for show in SHOWS] * 2,
+                               filepath=str(tmp_path), output_type="console",
+                               per_host=6)
+    assert "Connection pool is full" not in caplog.text
+    adapter = series_details._get_session().get_adapter(server.url)
+    assert adapter._pool_maxsize >= 12
+
+
+def test_http_cache(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _EtagHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    cache = ResponseCache(str(tmp_path / "cache"), ttl=60)
+    set_http_cache(cache)
+    try:
+        assert series_details._fetch_page(base + "/a") == "page /a"
+        # Fresh entries are served without a request.
+        assert series_details._fetch_page(base + "/a") == "page /a"
+        assert _EtagHandler.requests == [None]
+
+        # Expired entries are revalidated with the ETag.
+        cache.ttl = 0
+        assert series_details._fetch_page(base + "/a") == "page /a"
+        assert _EtagHandler.requests == [None, '"v1"']
+
+        # Offline mode only serves from the cache.
+        cache.offline = True
+        assert series_details._fetch_page(base + "/a") == "page /a"
+        with pytest.raises(ValueError):
+            series_details._fetch_page(base + "/b")
+        assert len(_EtagHandler.requests) == 2
+
+        # The least recently used entries are evicted.
+        small = ResponseCache(str(tmp_path / "small"), max_size=300)
+        set_http_cache(small)
+        for page in ("/1", "/2", "/3"):
+            series_details._fetch_page(base + page)
+            time.sleep(0.01)
+        assert small._load(base + "/1") is None
+        assert small._load(base + "/3")["body"] == "page /3"
+    finally:
+        set_http_cache(None)
+        server.shutdown()
+        server.server_close()
+
+
+def test_parse_season_page():
+    # Only the episode cards, navigation and title are kept.
+    noise = '<div class="nav"><a href="/x">link</a><p>text</p></div>'
+    page = tmdb_season_page(3, 2).replace("<body>", "<body>" + noise)
+    soup = series_details._parse_season_page(page, imdb=False)
+    assert soup.find("div", class_="nav") is None
+    assert soup.title.string == "Some Show: Season 3"
+    episode_details, last_season = series_details._find_episodes(soup, imdb=False)
+    assert not last_season
+    episodelist = []
+    _extract_data(episode_details, episodelist, 3)
+    assert episodelist == [[3, '1', 'S03E01 title', 'Jan 1, 2008', 'Plot of episode 1.'],
+                           [3, '2', 'S03E02 title', 'Jan 2, 2008', 'Plot of episode 2.']]
+    episodelist = []
+    _extract_data(episode_details, episodelist, 3, from_write_ep=True)
+    assert episodelist == [[3, '1', 'S03E01 title'], [3, '2', 'S03E02 title']]
+
+
+def test_make_seriesdb_many(monkeypatch, tmp_path):
+    # Throttled requests are retried and a failing show doesn't
+    # stop the others.
+    from mediafiletools import make_seriesdb_many
+
+    throttled = set()
+
+    def fake_request(url):
+        if url.endswith("/seasons"):
+            return 404, "Not Found", ""
+        show, season = url.split("/tv/")[1].split("/season/")
+        if show == "404":
+            return 404, "Not Found", ""
+        if url not in throttled and season == "2":
+            throttled.add(url)
+            return 429, "Too Many Requests", ""
+        page = tmdb_season_page(int(season), 2, last=season == "3")
+        return 200, "OK", page.replace("Some Show", f"Show {show}")
+
+    monkeypatch.setattr(series_details, "_request", fake_request)
+    results = make_seriesdb_many(
+        [{"series_id": "100", "start": 1, "end": 2},
+         {"series_id": "200"},
+         {"series_id": "404", "end": 1}],
+        filepath=str(tmp_path), rate=1000, backoff=0.01)
+    assert results[:2] == ["Show 100", "Show 200"]
+    assert isinstance(results[2], series_details.HTTPStatusError)
+    assert results[2].status_code == 404
+    assert len(throttled) == 2
+    df = pd.read_csv(tmp_path / "Show 100.csv")
+    assert list(df["Season"]) == [1, 1, 2, 2]
+    df = pd.read_csv(tmp_path / "Show 200.csv")
+    assert list(df["Season"]) == [1, 1, 2, 2, 3, 3]
+
+
+def test_token_bucket():
+    # A burst is allowed, then requests are spaced by 1 / rate.
+    import asyncio
+    from mediafiletools.series_bulk import TokenBucket
+
+    async def take(bucket, n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    bucket = TokenBucket(rate=50, capacity=5)
+    start = time.monotonic()
+    asyncio.run(take(bucket, 5))
+    assert time.monotonic() - start < 0.05
+    start = time.monotonic()
+    asyncio.run(take(bucket, 5))
+    assert time.monotonic() - start >= 0.08
+
+
+def test_replay_server(monkeypatch, tmp_path):
+    # The scraper runs offline against the recorded corpus.
+    from mediafiletools import make_seriesdb_many
+    from tests.replay_server import ReplayServer, build_corpus
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    with ReplayServer(corpus) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        rows = make_seriesdb(series="Other Show", from_write_ep=True)
+        assert len(rows) == 30
+        assert rows[-1] == [3, '10', 'Other Show S03E10']
+        # The search, the overview and the three seasons.
+        assert server.requests == 5
+        rows = make_seriesdb(series_id="9000", start=2, end=2,
+                             from_write_ep=True)
+        assert len(rows) == 1000
+        with pytest.raises(ValueError, match="multiple results"):
+            make_seriesdb(series="Some Show")
+        with pytest.raises(series_details.HTTPStatusError):
+            make_seriesdb(series_id="404", end=1)
+
+    # Injected errors are retried by `make_seriesdb_many`.
+    with ReplayServer(corpus, fail_first=1, error_status=503) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        results = make_seriesdb_many([{"series_id": "1401"}],
+                                     filepath=str(tmp_path), backoff=0.01)
+        assert results == ["Some Show"]
+        # The overview and the season page each failed once.
+        assert (server.requests, server.errors) == (4, 2)
+    df = pd.read_csv(tmp_path / "Some Show.csv")
+    assert len(df) == 8
+
+
+def test_providers(monkeypatch, tmp_path):
+    # The JSON API gives the same episodes as the website.
+    from mediafiletools import (CSVProvider, TMDBAPIProvider,
+                                make_seriesdb_many, providers)
+    from tests.replay_server import ReplayServer, build_corpus
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    with ReplayServer(corpus) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        monkeypatch.setattr(providers, "TMDB_API_URL", server.url + "/3")
+        html = make_seriesdb(series_id="7317", from_write_ep=True)
+        requests = server.requests
+        api = make_seriesdb(provider=TMDBAPIProvider(series="Other Show"),
+                            from_write_ep=True)
+        assert api == html
+        # The search, the show and the three seasons.
+        assert server.requests - requests == 5
+        provider = TMDBAPIProvider(series_id="1400")
+        make_seriesdb(provider=provider, start=2, end=3,
+                      filepath=str(tmp_path))
+        assert provider.name == "Some Show"
+        with pytest.raises(ValueError, match="multiple results"):
+            make_seriesdb(provider=TMDBAPIProvider(series="Some Show"))
+        results = make_seriesdb_many(
+            [{"provider": TMDBAPIProvider(series="Long Show", year="1999")}],
+            filepath=str(tmp_path))
+        assert results == ["Long Show"]
+
+    df = pd.read_csv(tmp_path / "Some Show.csv")
+    assert list(df["Season"].unique()) == [2, 3]
+    assert df["Air date"].iloc[0] == "January 2, 1970"
+    assert len(pd.read_csv(tmp_path / "Long Show.csv")) == 1250
+    name, rows = CSVProvider(str(tmp_path / "Some Show.csv")).episodes(
+        start=3, from_write_ep=True)
+    assert (name, len(rows), rows[0]) == ("Some Show", 22,
+                                          [3, 1, "Some Show S03E01"])
+
+    # Without `start` the specials of a csv file are kept, like in
+    # `rename_library()`.
+    csv_path = str(tmp_path / "Specials.csv")
+    pd.DataFrame([(0, 1, "Special", "", ""), (1, 1, "Pilot", "", "")],
+                 columns=series_details.EPISODE_COLUMNS).to_csv(csv_path,
+                                                                index=False)
+    assert make_seriesdb(provider=CSVProvider(csv_path),
+                         from_write_ep=True) == [[0, 1, "Special"],
+                                                 [1, 1, "Pilot"]]
+    assert CSVProvider(csv_path).episodes(start=1, from_write_ep=True)[1] \
+        == [[1, 1, "Pilot"]]
+
+
+def test_stream_seriesdb(monkeypatch, tmp_path):
+    # Streamed output matches the DataFrame output.
+    from mediafiletools import TMDBProvider
+    from tests.replay_server import ReplayServer, build_corpus
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    with ReplayServer(corpus) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        for output_type in ("csv", "txt"):
+            for stream in (False, True):
+                out = tmp_path / f"{output_type}-{stream}"
+                out.mkdir()
+                make_seriesdb(series="Long Show", output_type=output_type,
+                              filepath=str(out), stream=stream)
+        seasons = TMDBProvider(series_id="1400").iter_seasons(max_workers=2)
+        assert [len(rows) for rows in seasons] == [5, 12, 22, 24]
+
+    batch = pd.read_csv(tmp_path / "csv-False" / "Long Show.csv")
+    streamed = pd.read_csv(tmp_path / "csv-True" / "Long Show.csv")
+    assert len(streamed) == 1250
+    pd.testing.assert_frame_equal(batch, streamed)
+    batch = (tmp_path / "txt-False" / "Long Show.txt").read_text().split()
+    streamed = (tmp_path / "txt-True" / "Long Show.txt").read_text().split()
+    assert batch == streamed
+
+    # Output types that can't be streamed fail before any request.
+    def no_fetch(url, id_name="IMDB ID"):
+        raise AssertionError(url)
+
+    monkeypatch.setattr(series_details, "_fetch_page", no_fetch)
+    with pytest.raises(ValueError, match="can't be streamed"):
+        make_seriesdb(series_id="1400", output_type="sqlite",
+                      filepath=str(tmp_path), stream=True)
+
+
+def test_output_sinks(monkeypatch, tmp_path, capfd):
+    # The sinks of `save_to_file` and the sqlite upsert.
+    import importlib.util
+    import sqlite3
+    from mediafiletools import common, register_sink, save_to_file
+    from tests.replay_server import ReplayServer, build_corpus
+
+    df = pd.DataFrame({"Season": [1, 1], "Title": ["A/B", None]})
+    save_to_file(df, str(tmp_path), "jsonl", "out")
+    lines = (tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"Season": 1, "Title": "A/B"}, {"Season": 1, "Title": None}]
+    if importlib.util.find_spec("pyarrow") is None:
+        with pytest.raises(ImportError, match="pyarrow"):
+            save_to_file(df, str(tmp_path), "parquet", "out")
+    else:
+        save_to_file(df, str(tmp_path), "parquet", "out")
+        pd.testing.assert_frame_equal(
+            pd.read_parquet(tmp_path / "out.parquet"), df)
+    with pytest.raises(ValueError, match="'sqlite'"):
+        save_to_file(df, str(tmp_path), "xlsx", "out")
+
+    written = []
+    register_sink("list", None)(lambda df, fpath, fname, key=None:
+                                written.append((fpath, fname, len(df))))
+    try:
+        save_to_file(df, str(tmp_path), "list", "out")
+    finally:
+        common._SINKS.pop("list")
+    assert written == [(None, "out", 2)]
+    _print_file_loc("sqlite", str(tmp_path / "shows.sqlite"), "x")
+    assert capfd.readouterr().out.strip().endswith("shows.sqlite")
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    db = str(tmp_path / "shows.sqlite")
+    with ReplayServer(corpus) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        make_seriesdb(series_id="1400", end=2, filepath=db,
+                      output_type="sqlite")
+        # Season 2 again and season 3 are upserted.
+        make_seriesdb(series_id="1400", start=2, end=3, filepath=db,
+                      output_type="sqlite")
+        make_seriesdb(series_id="7317", filepath=db, output_type="sqlite")
+    with sqlite3.connect(db) as con:
+        assert con.execute('SELECT COUNT(*), MAX("Season") '
+                           'FROM "Some Show"').fetchone() == (39, 3)
+        assert con.execute('SELECT COUNT(*) FROM "Other Show"'
+                           ).fetchone() == (30,)
+    con.close()
+
+
+def test_fixed_width_table():
+    # The vectorized renderer writes the same table as tabulate.
+    from tabulate import tabulate
+    from mediafiletools import common
+
+    def reference(df):
+        table = tabulate(df, headers='keys', tablefmt='plain',
+                         stralign='left', numalign='left', showindex=False)
+        return '\n'.join(' ' + line for line in table.split('\n'))
+
+    frames = [
+        pd.DataFrame([(1, "1", " Pilot ", None), (12, "2", "Amélie 東京", "x")],
+                     columns=["Season", "Episode Number", "Title", "Notes"]),
+        pd.DataFrame([("", ""), ("A", "Alien"), ("", "Aliens")],
+                     columns=["A - Z", "Movie"]).astype(object),
+        pd.DataFrame({"Title": pd.Series([], dtype=str)}),
+        # Number formatting is left to tabulate.
+        pd.DataFrame({"Episode": ["01", "2"], "Title": ["True", "1e5"]}),
+    ]
+    for df in frames:
+        assert common._tabulate_df(df) == reference(df)
+    assert common._fixed_width_lines(frames[0]) is not None
+    assert common._fixed_width_lines(frames[3]) is None
+
+
+def test_scan_media(monkeypatch, tmp_path):
+    # One walk of a mixed share feeds the movie, music and episode tools.
+    from mediafiletools import scan_media
+    from mediafiletools.find_movie_dupes import get_movies
+    from mediafiletools.find_music_dupes import get_songs
+
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    media = tmp_path / "media"
+    shutil.copytree(os.path.join(tests_dir, "dummy_movies"), media / "Movies")
+    shutil.copytree(os.path.join(tests_dir, "dummy_music"), media / "Music")
+    season = media / "TV" / "Show" / "Season 1"
+    season.mkdir(parents=True)
+    for name in ("Show S01E02.mkv", "Show S01E01.mkv", "Show S01E01.srt"):
+        (season / name).write_text(name)
+    csv_path = str(tmp_path / "show.csv")
+    pd.DataFrame([(1, 1, "One", "", ""), (1, 2, "Two", "", "")],
+                 columns=["Season", "Episode Number", "Title", "Air date",
+                          "Description"]).to_csv(csv_path, index=False)
+    movies, tv = str(media / "Movies"), str(media / "TV" / "Show")
+
+    def run(scan=None):
+        out = tmp_path / ("scan" if scan else "walk")
+        out.mkdir()
+        for sort_type in ("abc", "folder"):
+            make_moviedb(movies, filepath=str(out), sort_type=sort_type,
+                         scan=scan)
+        plan = rename_episodes(tv, csv_path=csv_path, dry_run=True, scan=scan)
+        songs = get_songs(str(media / "Music"), scan=scan)
+        return (get_movies(movies, scan=scan),
+                sorted(song.tag._filename for song in songs),
+                plan.values.tolist(),
+                [(out / f"{f}.csv").read_text()
+                 for f in ("Movie Database A - Z", "Movie Database")])
+
+    expected = run()
+    scan = scan_media(str(media))
+    assert len(scan.video) == len(expected[0]) + 2
+    assert len(scan.audio) == len(expected[1])
+    assert str(season / "Show S01E01.srt") in scan.subtitle
+
+    def walk(*args, **kwargs):
+        raise AssertionError("walked the tree again")
+
+    monkeypatch.setattr(os, "walk", walk)
+    monkeypatch.setattr(os, "listdir", walk)
+    monkeypatch.setattr(os, "scandir", walk)
+    assert run(scan) == expected
+
+    # Folders outside the scan aren't silently empty.
+    with pytest.raises(FileNotFoundError):
+        scan.walk(str(tmp_path / "elsewhere"))
+    with pytest.raises(FileNotFoundError):
+        make_moviedb(str(tmp_path / "elsewhere"), filepath=str(tmp_path),
+                     scan=scan)
+
+
+def test_name_cache(monkeypatch, tmp_path):
+    # Resolved names and failed searches are served from the cache.
+    from mediafiletools import NameCache, make_seriesdb_many, set_name_cache
+    from mediafiletools.name_cache import SeriesLookupError
+    from tests.replay_server import ReplayServer, build_corpus
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    cache_file = str(tmp_path / "names.json")
+    set_name_cache(NameCache(cache_file))
+    try:
+        with ReplayServer(corpus) as server:
+            monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+            url = series_details._parse_series_name("Other Show", start=2)
+            assert url == f"{server.url}/tv/7317/season/2"
+            with pytest.raises(SeriesLookupError) as error:
+                series_details._resolve_series("Some Show")
+            assert len(error.value.matches) == 2
+            assert server.requests == 2
+
+            # A new cache reads the file, names differing in case and
+            # spacing share an entry.
+            set_name_cache(NameCache(cache_file))
+            assert series_details._resolve_series("other  SHOW") == "/tv/7317"
+            with pytest.raises(SeriesLookupError, match="multiple results"):
+                series_details._resolve_series("Some Show")
+            assert server.requests == 2
+
+            # Identical names of a bulk run are searched once.
+            set_name_cache(None)
+            results = make_seriesdb_many(
+                [{"series": "Long Show", "start": 1, "end": 1},
+                 {"series": "long show", "start": 2, "end": 2}],
+                filepath=str(tmp_path), output_type="console")
+            assert results == ["Long Show", "Long Show"]
+            assert server.requests == 2 + 1 + 2
+
+        # Expired entries are searched again.
+        assert NameCache(cache_file, ttl=0).get("Other Show") is None
+        assert NameCache(cache_file, failed_ttl=0).get("Some Show") is None
+    finally:
+        set_name_cache(None)
+
+
+def test_rename_plan(monkeypatch, tmp_path):
+    # Renames are planned, applied with a journal and rolled back.
+    from mediafiletools import rollback_renames
+    from mediafiletools import episode_rename
+
+    show = tmp_path / "Show"
+    folders = {
+        1: ["ep1.mkv", "ep2.mkv", "ep3.mkv"],
+        # Matched by the numbers in the names, whatever their order.
+        2: ["Show.2x03.mkv", "show s02e01 720p.mkv", "Episode 2.srt",
+            "extras.mkv"],
+        # No numbers, paired in sorted order.
+        3: ["c.mkv", "a.mkv", "b.mkv"],
+    }
+    for season, names in folders.items():
+        (show / f"Season {season}").mkdir(parents=True)
+        for name in names:
+            (show / f"Season {season}" / name).write_text(name)
+    originals = {s: sorted(names) for s, names in folders.items()}
+    csv_path = str(tmp_path / "eps.csv")
+    pd.DataFrame(
+        [(s, e, t, "", "") for s in (1, 2, 3)
+         for e, t in ((1, "One"), (2, "Two"), (3, "Three"))],
+        columns=["Season", "Episode Number", "Title", "Air date", "Description"]
+    ).to_csv(csv_path, index=False)
+
+    def listing():
+        return {s: sorted(os.listdir(show / f"Season {s}")) for s in folders}
+
+    plan = rename_episodes(str(show), csv_path=csv_path, dry_run=True)
+    assert list(plan.columns) == ["Season", "Folder", "Old Name", "New Name"]
+    assert len(plan) == 10
+    assert plan["New Name"].isna().sum() == 1
+    assert listing() == originals
+
+    journal = str(tmp_path / "rename.journal")
+    assert rename_episodes(str(show), csv_path=csv_path,
+                           journal=journal) == journal
+    assert listing() == {
+        1: ["S01E01 - One.mkv", "S01E02 - Two.mkv", "S01E03 - Three.mkv"],
+        2: ["S02E01 - One.mkv", "S02E02 - Two.srt", "S02E03 - Three.mkv",
+            "extras.mkv"],
+        3: ["S03E01 - One.mkv", "S03E02 - Two.mkv", "S03E03 - Three.mkv"],
+    }
+    assert (show / "Season 2" / "S02E03 - Three.mkv").read_text() == \
+        "Show.2x03.mkv"
+    assert (show / "Season 3" / "S03E01 - One.mkv").read_text() == "a.mkv"
+    assert rollback_renames(journal) == 9
+    assert listing() == originals
+
+    # A failure rolls back every rename already made.
+    real_rename = os.rename
+
+    def failing_rename(src, dst):
+        if dst.endswith("S01E03 - Three.mkv"):
+            raise PermissionError(dst)
+        real_rename(src, dst)
+
+    monkeypatch.setattr(episode_rename.os, "rename", failing_rename)
+    with pytest.raises(PermissionError):
+        rename_episodes(str(show), csv_path=csv_path, journal=journal)
+    monkeypatch.undo()
+    assert listing() == originals
+
+    # Names taken by files that aren't renamed are caught up front.
+    (show / "Season 1" / "S01E01 - One.mkv").mkdir()
+    with pytest.raises(ValueError, match="overwrite"):
+        rename_episodes(str(show), csv_path=csv_path, dry_run=True)
+
+    # Swapped names go through temporary names.
+    folder = str(show / "Season 3")
+    episode_rename.apply_renames(
+        [(3, folder, "a.mkv", "b.mkv"), (3, folder, "b.mkv", "a.mkv")],
+        journal)
+    assert (show / "Season 3" / "a.mkv").read_text() == "b.mkv"
+    assert rollback_renames(journal) == 4
+    assert (show / "Season 3" / "a.mkv").read_text() == "a.mkv"
+
+    # A file deleted since is skipped, the others are still undone.
+    episode_rename.apply_renames(
+        [(3, folder, "a.mkv", "c.mkv"), (3, folder, "b.mkv", "d.mkv")],
+        journal)
+    os.remove(os.path.join(folder, "c.mkv"))
+    assert rollback_renames(journal) == 1
+    assert sorted(os.listdir(folder)) == ["b.mkv"]
+
+
+def test_parse_episode_number():
+    from mediafiletools.episode_rename import parse_episode_number
+
+    assert parse_episode_number("Show.S01E02.1080p.x265.mkv") == (1, 2)
+    assert parse_episode_number("show s1.e12.mkv") == (1, 12)
+    assert parse_episode_number("Show - 3x07 - Title.avi") == (3, 7)
+    assert parse_episode_number("Episode 4.mp4", season=2) == (2, 4)
+    assert parse_episode_number("Ep.05.mp4", season=2) == (2, 5)
+    assert parse_episode_number("Episode 4.mp4") is None
+    assert parse_episode_number("Trailer 1080p x264.mkv", season=1) is None
+
+
+def test_rename_library(monkeypatch, tmp_path):
+    # Every show of the tree is renamed with one consolidated report.
+    from mediafiletools import rename_library, rollback_renames
+    from tests.replay_server import ReplayServer, build_corpus
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    tv_root = tmp_path / "tv"
+    files = {
+        "Other Show": {1: ["1x01.mkv", "1x02.mkv"], 3: ["S03E10.mkv"]},
+        "Some Show (2015)": {1: ["Episode 8.mp4", "Episode 9.mp4"]},
+        "Mine": {1: ["a.mkv"]},
+        "Missing Show": {1: ["S01E01.mkv"]},
+    }
+    for show, seasons in files.items():
+        for season, names in seasons.items():
+            folder = tv_root / show / f"Season {season}"
+            folder.mkdir(parents=True)
+            for name in names:
+                (folder / name).write_text(name)
+    csv_path = str(tmp_path / "mine.csv")
+    pd.DataFrame([(1, 1, "Pilot", "", "")],
+                 columns=["Season", "Episode Number", "Title", "Air date",
+                          "Description"]).to_csv(csv_path, index=False)
+
+    with ReplayServer(corpus) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        journal_dir, report = rename_library(
+            str(tv_root), {"Mine": {"csv_path": csv_path}},
+            journal_dir=str(tmp_path / "journals"))
+
+    assert list(report.columns) == ["Show", "Season", "Old Name",
+                                    "New Name", "Status"]
+    status = report.set_index("Old Name")["Status"]
+    assert (status == "renamed").sum() == 5
+    assert status["Episode 9.mp4"] == "unmatched"
+    failed = report[report["Status"].str.startswith("failed")]
+    assert list(failed["Show"]) == ["Missing Show"]
+    assert sorted(os.listdir(tv_root / "Other Show" / "Season 3")) == \
+        ["S03E10 - Other Show S03E10.mkv"]
+    assert sorted(os.listdir(tv_root / "Some Show (2015)" / "Season 1")) == \
+        ["Episode 9.mp4", "S01E08 - Some Show S01E08.mp4"]
+    assert os.listdir(tv_root / "Mine" / "Season 1") == ["S01E01 - Pilot.mkv"]
+
+    assert rollback_renames(journal_dir) == 5
+    assert os.listdir(tv_root / "Mine" / "Season 1") == ["a.mkv"]
+
+
+def test_rename_log(monkeypatch, tmp_path):
+    # Every rename is written as a JSON line by the queue listener.
+    from mediafiletools import set_rename_log
+    from mediafiletools import rename_log
+
+    # Importing the package doesn't configure any logging.
+    code = ("import logging, mediafiletools.series_details; "
+            "print(len(logging.getLogger().handlers), "
+            "len(logging.getLogger('mediafiletools.rename').handlers))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                         text=True, check=True).stdout
+    assert out.split() == ["0", "0"]
+
+    folder = tmp_path / "Show" / "Season 1"
+    folder.mkdir(parents=True)
+    (folder / "1x01.mkv").write_text("")
+    csv_path = str(tmp_path / "eps.csv")
+    pd.DataFrame([(1, 1, "Pilot", "", "")],
+                 columns=["Season", "Episode Number", "Title", "Air date",
+                          "Description"]).to_csv(csv_path, index=False)
+    log_file = str(tmp_path / "log" / "rename.jsonl")
+    default = rename_log._log_file
+    set_rename_log(log_file)
+    try:
+        journal = rename_episodes(str(tmp_path / "Show"), csv_path=csv_path,
+                                  journal=str(tmp_path / "rename.journal"))
+        # The records were written when `rename_episodes` returned.
+        assert not rename_log.logger.handlers
+        with open(log_file, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert [r["event"] for r in records] == ["rename", "show"]
+        assert records[0]["old"] == str(folder / "1x01.mkv")
+        assert records[0]["new"] == str(folder / "S01E01 - Pilot.mkv")
+        assert records[0]["status"] == "renamed"
+        assert records[0]["ms"] >= 0
+        assert records[1]["journal"] == journal
+    finally:
+        set_rename_log(default)
+
+    # MEDIAFILETOOLS_LOG_DIR is read when it's needed, not at import.
+    log_folder = tmp_path / "env_log"
+    monkeypatch.setenv("MEDIAFILETOOLS_LOG_DIR", str(log_folder))
+    (folder / "S01E01 - Pilot.mkv").rename(folder / "1x01.mkv")
+    journal = rename_episodes(str(tmp_path / "Show"), csv_path=csv_path)
+    assert os.path.dirname(journal) == str(log_folder)
+    assert os.path.exists(log_folder / "rename.jsonl")
+
+
+def test_profile(monkeypatch, tmp_path):
+    # profile= writes a pstats dump and collapsed stacks of the call.
+    import pstats
+    from mediafiletools import profiling
+
+    monkeypatch.setattr(profiling, "DEFAULT_PROFILE_DIR", str(tmp_path))
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    movies = os.path.join(tests_dir, "dummy_movies")
+    make_moviedb(movies, filepath=str(tmp_path), profile=True)
+    # make_moviedb is the only profile, nested entry points are part of it.
+    monkeypatch.setenv("MEDIAFILETOOLS_PROFILE", "cprofile")
+    find_movie_dupes(movies, filepath=str(tmp_path))
+    profiles = sorted(f for f in os.listdir(tmp_path)
+                      if f.endswith(".pstats"))
+    assert [f.split("-")[0] for f in profiles] == ["find_movie_dupes",
+                                                   "make_moviedb"]
+    base = os.path.join(tmp_path, profiles[1][:-len(".pstats")])
+    names = {func[2] for func in pstats.Stats(base + ".pstats").stats}
+    assert {"make_moviedb", "recursive_sort", "_format_filename"} <= names
+    with open(base + ".collapsed", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines and all(re.fullmatch(r"make_moviedb \(.+\) \d+", line)
+                         or line.startswith("make_moviedb (")
+                         for line in lines)
+    assert any("recursive_sort (movie_sort_to_df.py:" in line
+               for line in lines)
+    with pytest.raises(ValueError):
+        make_moviedb(movies, filepath=str(tmp_path), profile="trace")
+
+    # The sampler catches a busy function without tracing every call.
+    def busy():
+        end = time.process_time() + 0.2
+        while time.process_time() < end:
+            pass
+
+    sampler = profiling._SamplingProfiler(interval=0.002)
+    sampler.start()
+    busy()
+    sampler.stop()
+    stacks = sampler.stacks()
+    assert any(stack[-1][2] == "busy" for stack in stacks)
+    stats = sampler.stats()
+    busy_func = next(func for func in stats if func[2] == "busy")
+    assert stats[busy_func][3] == pytest.approx(sum(stacks.values()))
+
+
+def test_warning_location(monkeypatch, tmp_path):
+    # Warnings of the entry points point at their caller, not at the
+    # wrapper of `entry_point`.
+    import warnings
+    from mediafiletools import profiling
+    from mediafiletools.providers import CSVProvider
+
+    monkeypatch.setattr(profiling, "DEFAULT_PROFILE_DIR", str(tmp_path))
+    csv_path = str(tmp_path / "eps.csv")
+    pd.DataFrame([(1, 1, "Pilot", "", "")],
+                 columns=series_details.EPISODE_COLUMNS).to_csv(csv_path,
+                                                                index=False)
+    (tmp_path / "Show").mkdir()
+    calls = [
+        lambda: make_seriesdb(imdb_id="tt0098904", from_write_ep=True,
+                              provider=CSVProvider(csv_path)),
+        lambda: make_seriesdb(imdb_id="tt0098904", from_write_ep=True,
+                              provider=CSVProvider(csv_path), profile=True),
+        lambda: rename_episodes(str(tmp_path / "Show"), imdb_id="tt0098904",
+                                provider=CSVProvider(csv_path),
+                                dry_run=True),
+    ]
+    for call in calls:
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            call()
+        assert [x.category for x in w] == [DeprecationWarning]
+        assert w[0].filename == __file__
+
+
+def read_prom(path):
+    # The samples of a Prometheus textfile, by name and labels.
+    samples = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+    return samples
+
+
+def test_metrics(monkeypatch, tmp_path):
+    # Entry points write their stages and counters as a textfile.
+    from tests.replay_server import ReplayServer, build_corpus
+
+    metrics_dir = tmp_path / "metrics"
+    movies_dir = tmp_path / "movies"
+    movies_dir.mkdir()
+    for name in ("Heat 1995.avi", "Heat.1995.1080p.mkv", "Ronin 1998.mp4"):
+        (movies_dir / name).write_bytes(b"")
+    find_movie_dupes(str(movies_dir), filepath=str(tmp_path),
+                     metrics=str(metrics_dir))
+    samples = read_prom(metrics_dir / "mediafiletools_find_movie_dupes.prom")
+    entry = 'entry="find_movie_dupes"'
+    dupes = pd.read_csv(tmp_path / "Movie Dupes.csv")
+    assert samples[f"mediafiletools_success{{{entry}}}"] == 1
+    assert samples[f"mediafiletools_files_scanned{{{entry}}}"] == 3
+    assert samples[f"mediafiletools_dupes_found{{{entry}}}"] == 2
+    assert samples[f"mediafiletools_rows_written{{{entry}}}"] == len(dupes)
+    for stage in ("scan", "match", "output"):
+        assert f'mediafiletools_stage_duration_seconds{{{entry},' \
+               f'stage="{stage}"}}' in samples
+    assert samples[f"mediafiletools_peak_rss_bytes{{{entry}}}"] > 0
+    assert [f.name for f in metrics_dir.iterdir()] == [
+        "mediafiletools_find_movie_dupes.prom"]
+
+    corpus = str(tmp_path / "corpus")
+    build_corpus(corpus)
+    monkeypatch.setenv("MEDIAFILETOOLS_METRICS_DIR", str(metrics_dir))
+    path = metrics_dir / "mediafiletools_make_seriesdb.prom"
+    entry = 'entry="make_seriesdb"'
+    with ReplayServer(corpus) as server:
+        monkeypatch.setattr(series_details, "TMDB_URL", server.url)
+        make_seriesdb(series="Long Show", filepath=str(tmp_path), stream=True)
+        samples = read_prom(path)
+        assert samples[f"mediafiletools_rows_written{{{entry}}}"] == 1250
+        assert samples[f"mediafiletools_http_requests{{{entry}}}"] > 1
+        assert samples[f"mediafiletools_http_failures{{{entry}}}"] == 0
+        with pytest.raises(ValueError):
+            make_seriesdb(series_id="999999", filepath=str(tmp_path))
+    samples = read_prom(path)
+    assert samples[f"mediafiletools_success{{{entry}}}"] == 0
+    assert samples[f"mediafiletools_http_failures{{{entry}}}"] >= 1
+
+    # A metrics folder that can't be written only warns.
+    blocker = tmp_path / "not_a_folder"
+    blocker.write_text("")
+    with pytest.warns(UserWarning, match="couldn't be written") as w:
+        find_movie_dupes(str(movies_dir), filepath=str(tmp_path),
+                         metrics=str(blocker))
+    assert w[0].filename == __file__